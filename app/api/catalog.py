@@ -0,0 +1,191 @@
+import json
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Callable, List, Optional
+
+from fastapi import APIRouter, Query, Request, Response
+
+from app.core.config import settings
+from app.core.exceptions import AppException, NotFoundError
+from app.models.catalog import PriceRangeResponse, ProductPageResponse, ProductResponse
+from app.services.catalog import DEFAULT_PAGE_SIZE, SORT_KEYS, CatalogSnapshot, get_snapshot_async, split_features
+from app.services.facets import PRICE_BANDS
+
+# Create a router for the read-only catalog API
+router = APIRouter(
+    prefix="/catalog",
+    tags=["catalog"],
+)
+
+# Catalog versions restart at 1 in every process, so ETags also carry an id
+# of this process to stay unique across restarts and machines
+_INSTANCE_ID = uuid.uuid4().hex[:12]
+
+# Serialized bodies of recent responses, keyed by (ETag, URL)
+MAX_CACHED_BODIES = 512
+_bodies: "OrderedDict[tuple[str, str], bytes]" = OrderedDict()
+
+_NOT_MODIFIED = {304: {"description": "The catalog has not changed since the ETag in If-None-Match"}}
+
+
+def catalog_etag(version: int) -> str:
+    """Strong ETag for every catalog representation at a version."""
+    return f'"{_INSTANCE_ID}-{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches the ETag (weak comparison, RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _drop_session(request: Request) -> None:
+    """Keep the session middleware from adding Set-Cookie and Vary: Cookie.
+
+    Catalog responses are the same for every visitor and never use the
+    session, but NiceGUI gives every request one; with a cookie attached,
+    shared caches would not store them despite Cache-Control: public. The
+    session middleware reads scope["session"] when the response starts, so
+    an untouched empty session makes it leave the headers alone.
+    """
+    session = request.scope.get("session")
+    if session is not None:
+        request.scope["session"] = type(session)()
+
+
+def _json_bytes(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _cache_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": (
+            f"public, max-age={settings.catalog_cache_max_age}, "
+            f"stale-while-revalidate={settings.catalog_stale_while_revalidate}"
+        ),
+    }
+
+
+async def _conditional_response(
+    request: Request,
+    render: Callable[[CatalogSnapshot], bytes],
+    shows_stock: bool = True,
+) -> Response:
+    """Answer 304 when the client's copy is current, else the (cached) JSON body.
+
+    Every representation is a pure function of the URL and the catalog
+    version, so a version change is the only thing that invalidates it.
+    Representations without stock depend on the index_version only and
+    stay valid through the stock updates of orders.
+    """
+    _drop_session(request)
+    snapshot = await get_snapshot_async()
+    etag = catalog_etag(snapshot.version if shows_stock else snapshot.index_version)
+    headers = _cache_headers(etag)
+    if_none_match = request.headers.get("if-none-match")
+    # "*" matches any current representation, so it can only be answered
+    # once the resource is known to exist (render raises 404 otherwise)
+    wildcard = if_none_match is not None and if_none_match.strip() == "*"
+    if not wildcard and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (etag, str(request.url))
+    body = _bodies.get(key)
+    if body is None:
+        try:
+            body = render(snapshot)
+        except AppException as e:
+            raise e.to_http_exception()
+        _bodies[key] = body
+        if len(_bodies) > MAX_CACHED_BODIES:
+            _bodies.popitem(last=False)
+    else:
+        _bodies.move_to_end(key)
+    if wildcard:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/products", response_model=ProductPageResponse, responses=_NOT_MODIFIED)
+async def list_products(
+    request: Request,
+    category: Optional[str] = Query(None, description="Only products in this category"),
+    brand: Optional[str] = Query(None, description="Only products of this brand"),
+    min_price: Optional[float] = Query(None, ge=0, description="Inclusive lower price bound"),
+    max_price: Optional[float] = Query(None, ge=0, description="Inclusive upper price bound"),
+    features: str = Query("", description="Comma-separated features every product must have"),
+    sort: str = Query("price", description=f"One of: {', '.join(SORT_KEYS)}"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=100),
+):
+    """Keyset-paginated product listing with category, brand, price and feature filters."""
+    def render(snapshot: CatalogSnapshot) -> bytes:
+        page = snapshot.paginate(
+            category=category,
+            brand=brand,
+            min_price=min_price,
+            max_price=max_price,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            features=split_features(features),
+        )
+        return ProductPageResponse(
+            items=[asdict(product) for product in page.items],
+            next_cursor=page.next_cursor,
+            sort=page.sort,
+        ).model_dump_json().encode()
+
+    return await _conditional_response(request, render)
+
+
+@router.get("/products/{product_id}", response_model=ProductResponse, responses=_NOT_MODIFIED)
+async def get_product(request: Request, product_id: int):
+    """A single product by id."""
+    def render(snapshot: CatalogSnapshot) -> bytes:
+        product = snapshot.by_id.get(product_id)
+        if product is None:
+            raise NotFoundError(detail=f"Product {product_id} not found")
+        return ProductResponse.model_validate(asdict(product)).model_dump_json().encode()
+
+    return await _conditional_response(request, render)
+
+
+@router.get("/categories", response_model=List[str], responses=_NOT_MODIFIED)
+async def list_categories(request: Request):
+    """All categories with at least one product."""
+    return await _conditional_response(
+        request, lambda snapshot: _json_bytes(list(snapshot.by_category)), shows_stock=False
+    )
+
+
+@router.get("/brands", response_model=List[str], responses=_NOT_MODIFIED)
+async def list_brands(request: Request):
+    """All brands with at least one product."""
+    return await _conditional_response(
+        request, lambda snapshot: _json_bytes(list(snapshot.by_brand)), shows_stock=False
+    )
+
+
+@router.get("/price-ranges", response_model=List[PriceRangeResponse], responses=_NOT_MODIFIED)
+async def list_price_ranges(request: Request):
+    """Price bands with product counts; use min_price/max_price on /products to list one."""
+    def render(snapshot: CatalogSnapshot) -> bytes:
+        bands = [
+            PriceRangeResponse(
+                key=key,
+                label=label,
+                min_price=min_price,
+                max_price=max_price,
+                count=len(snapshot.price_range(min_price, max_price)),
+            ).model_dump()
+            for key, label, min_price, max_price in PRICE_BANDS
+        ]
+        return _json_bytes(bands)
+
+    return await _conditional_response(request, render, shows_stock=False)
@@ -2,14 +2,16 @@ from fastapi import APIRouter
 
 # Import all API routers
 from app.api.auth import router as auth_router
-from app.api.example import router as example_router
+from app.api.catalog import router as catalog_router
+from app.api.search import router as search_router
 
 # Create a main API router
 api_router = APIRouter()
 
 # Include all API routers
 api_router.include_router(auth_router)
-api_router.include_router(example_router)
+api_router.include_router(catalog_router)
+api_router.include_router(search_router)
 
 # Add more routers here as your application grows
 # api_router.include_router(users_router)
@@ -0,0 +1,46 @@
+from dataclasses import asdict
+from typing import List
+
+from fastapi import APIRouter, Query
+
+from app.models.catalog import SearchResponse, SuggestionResponse
+from app.services.search import search_catalog_async, suggest_async
+
+# Create a router for catalog search endpoints
+router = APIRouter(
+    prefix="/search",
+    tags=["search"],
+)
+
+
+@router.get("", response_model=SearchResponse)
+async def search_products(
+    q: str = Query("", max_length=200, description="Free-text query (name, brand, description, features)"),
+    category: List[str] = Query([], description="Categories to include (any of)"),
+    brand: List[str] = Query([], description="Brands to include (any of)"),
+    price: List[str] = Query([], description="Price bands to include, e.g. 1000-5000 (any of)"),
+    feature: List[str] = Query([], description="Features every product must have (all of)"),
+    limit: int = Query(24, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Full-text and faceted product search with live counts for every facet value."""
+    result = await search_catalog_async(
+        q,
+        {"category": category, "brand": brand, "price": price, "feature": feature},
+        limit=limit,
+        offset=offset,
+    )
+    return {
+        "total": result.total,
+        "items": [asdict(product) for product in result.items],
+        "facets": {facet: [asdict(value) for value in values] for facet, values in result.facets.items()},
+    }
+
+
+@router.get("/suggest", response_model=List[SuggestionResponse])
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100, description="Partial text typed by the customer"),
+    limit: int = Query(8, ge=1, le=20),
+):
+    """Prefix typeahead over product names and brands."""
+    return [asdict(suggestion) for suggestion in await suggest_async(q, limit=limit)]
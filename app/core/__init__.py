@@ -18,12 +18,15 @@ imported and used by other modules as needed.
 # - logging.py: Logging setup and configuration
 # - exceptions.py: Custom exception classes and error handling
 # - middleware.py: ASGI middleware for request/response processing
+# - metrics.py: Per-route request metrics in the Prometheus format
+# - rate_limit.py: Rate limit counters (in memory or shared through Redis)
 # - security.py: Security-related utilities (CORS, authentication, etc.)
 # - health.py: Health check utilities
 # - utils.py: Utility functions
 # - database.py: Database utilities
 # - deployment.py: Deployment utilities
 # - error_handlers.py: Error handling utilities
+# - lifecycle.py: Timed startup phases (required vs deferrable)
 
 # Import core modules for easy access
 from app.core.config import settings
@@ -34,6 +37,7 @@ from app.core.exceptions import (
     ValidationError,
     AuthenticationError,
     AuthorizationError,
+    ConflictError,
     DatabaseError,
     ConfigurationError,
     ExternalServiceError,
@@ -43,6 +47,7 @@ from app.core.error_handlers import setup_error_handlers, create_error_response,
 from app.core.middleware import setup_middleware
 from app.core.utils import setup_routers, validate_environment, import_string, get_project_root
 from app.core.health import HealthCheck, is_healthy
+from app.core.lifecycle import StartupLifecycle, lifecycle
 
 # Optional imports that might not be used in all applications
 try:
@@ -66,9 +71,9 @@ except ImportError:
 
 # Database is optional and might not be used in all applications
 try:
-    from app.core.database import setup_database
+    from app.core.database import setup_database, get_db, get_db_context, get_async_db_context, with_unit_of_work
     # Uncomment when you need database functionality
-    # from app.core.database import get_db, create_tables
+    # from app.core.database import create_tables
 except ImportError:
     # Database module might not be used in all applications
     pass
@@ -83,6 +88,7 @@ __all__ = [
     "ValidationError",
     "AuthenticationError",
     "AuthorizationError",
+    "ConflictError",
     "DatabaseError",
     "ConfigurationError",
     "ExternalServiceError",
@@ -97,6 +103,8 @@ __all__ = [
     "get_project_root",
     "HealthCheck",
     "is_healthy",
+    "StartupLifecycle",
+    "lifecycle",
     # Optional modules
     "verify_password",
     "get_password_hash",
@@ -106,7 +114,10 @@ __all__ = [
     "get_current_active_user",
     "DeploymentManager",
     "setup_database",
+    "get_db",
+    "get_db_context",
+    "get_async_db_context",
+    "with_unit_of_work",
     # Uncomment when you need database functionality
-    # "get_db",
     # "create_tables",
 ]
\ No newline at end of file
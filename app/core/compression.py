@@ -0,0 +1,272 @@
+"""Response compression.
+
+Encodings are negotiated from Accept-Encoding in the order br, zstd, gzip,
+among those whose library is installed (gzip always is). Compression costs
+depend on the response:
+
+- bodies of responses with an ETag (static files, the catalog API) change
+  rarely, so CompressionCache compresses each distinct body once per
+  encoding at a high level and keeps the result, keyed by content hash
+- other bodies are compressed per request at a fast level
+- precompress_directory() writes .br/.zst/.gz siblings of static assets at
+  maximum levels, which PrecompressedStaticFiles serves as they are
+
+Only text-like content types are compressed; images, video, fonts in
+compressed formats and archives are sent as they are.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+import tempfile
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+from app.core.logging import app_logger
+
+# Brotli and Zstandard are optional; without them clients get gzip
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Every encoding understood, in order of preference
+ALL_ENCODINGS: Tuple[str, ...] = ("br", "zstd", "gzip")
+# Encodings this process can compress with
+ENCODINGS: Tuple[str, ...] = tuple(
+    encoding for encoding, module in (("br", brotli), ("zstd", zstandard), ("gzip", gzip)) if module is not None
+)
+
+# Per-request compression of dynamic responses
+FAST_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+# Compressed once per body and cached; about 100 ms per MB with br
+CACHED_LEVELS = {"br": 9, "zstd": 12, "gzip": 9}
+# Precompressed files are written ahead of serving, so size is all that counts
+PRECOMPRESS_LEVELS = {"br": 11, "zstd": 19, "gzip": 9}
+
+# File suffix of precompressed siblings, e.g. app.js.br
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+# Static files precompress_directory() compresses
+PRECOMPRESS_FILE_SUFFIXES = (".html", ".css", ".js", ".mjs", ".json", ".map", ".svg", ".txt", ".xml", ".wasm")
+
+# Compressible media types besides text/* and the +json / +xml suffixes
+COMPRESSIBLE_TYPES = frozenset({
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/vnd.ms-fontobject",
+    "application/wasm",
+    "application/x-javascript",
+    "application/xhtml+xml",
+    "application/xml",
+    "font/otf",
+    "font/ttf",
+    "image/svg+xml",
+    "image/x-icon",
+})
+
+# Bodies from this size on are compressed in a worker thread
+THREAD_MINIMUM_SIZE = 128 * 1024
+
+
+@lru_cache(maxsize=256)
+def is_compressible(content_type: Union[str, bytes]) -> bool:
+    """Whether a Content-Type is worth compressing."""
+    if isinstance(content_type, bytes):
+        content_type = content_type.decode("latin-1")
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type.startswith("text/"):
+        # Events must reach the client as they are sent
+        return media_type != "text/event-stream"
+    return media_type in COMPRESSIBLE_TYPES or media_type.endswith(("+json", "+xml"))
+
+
+@lru_cache(maxsize=256)
+def accepted_encodings(accept_encoding: bytes, encodings: Tuple[str, ...] = ENCODINGS) -> Tuple[str, ...]:
+    """Encodings an Accept-Encoding header allows, best first.
+
+    Higher q-values win; ties go to the order of `encodings`. Encodings the
+    client rates below identity are left out. Browsers send a handful of
+    distinct headers, so results are cached.
+    """
+    qvalues: Dict[str, float] = {}
+    for item in accept_encoding.decode("latin-1").lower().split(","):
+        name, _, params = item.partition(";")
+        name = name.strip()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues["gzip" if name == "x-gzip" else name] = q
+    wildcard = qvalues.get("*", 0.0)
+    identity = qvalues.get("identity", 0.0)
+    ranked = [
+        (-q, rank, encoding)
+        for rank, encoding in enumerate(encodings)
+        for q in (qvalues.get(encoding, wildcard),)
+        if q > 0 and q >= identity
+    ]
+    return tuple(encoding for _, _, encoding in sorted(ranked))
+
+
+def negotiate_encoding(accept_encoding: bytes) -> Optional[str]:
+    """Best encoding this process can compress with for an Accept-Encoding header, or None."""
+    accepted = accepted_encodings(accept_encoding)
+    return accepted[0] if accepted else None
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    """Compress a whole body."""
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class StreamCompressor:
+    """Compresses a body that arrives in chunks."""
+    __slots__ = ("compress", "finish")
+
+    def __init__(self, encoding: str, level: int):
+        self.compress: Callable[[bytes], bytes]
+        self.finish: Callable[[], bytes]
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=level)
+            self.compress, self.finish = compressor.process, compressor.finish
+        elif encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self.compress, self.finish = compressor.compress, compressor.flush
+        else:
+            # wbits 31: deflate with a gzip header and trailer
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress, self.finish = compressor.compress, compressor.flush
+
+
+class CompressionCache:
+    """Compressed bodies by (content hash, encoding).
+
+    Each distinct body is compressed once per encoding at CACHED_LEVELS, in
+    a worker thread; concurrent requests for the same body wait for that
+    one compression. The least recently used entries are dropped once
+    they take more than max_bytes.
+
+    Attributes:
+        hits: Bodies served from the cache
+        misses: Bodies compressed
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+        self._pending: Dict[Tuple[bytes, str], asyncio.Event] = {}
+
+    async def compress(self, body: bytes, encoding: str) -> bytes:
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        while True:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compressed
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            # Another request is compressing this body
+            await pending.wait()
+            if key not in self._entries:
+                # It failed or the entry was evicted right away
+                break
+
+        done = self._pending.setdefault(key, asyncio.Event())
+        self.misses += 1
+        try:
+            compressed = await asyncio.to_thread(compress, body, encoding, CACHED_LEVELS[encoding])
+        finally:
+            if self._pending.get(key) is done:
+                del self._pending[key]
+            done.set()
+        self._store(key, compressed)
+        return compressed
+
+    def _store(self, key: Tuple[bytes, str], compressed: bytes) -> None:
+        if len(compressed) > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = compressed
+        self.size += len(compressed)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+
+def precompress_directory(
+    directory: Union[str, Path],
+    encodings: Iterable[str] = ENCODINGS,
+    minimum_size: int = 256,
+) -> int:
+    """Write precompressed siblings of the static assets under a directory.
+
+    Assets (PRECOMPRESS_FILE_SUFFIXES) of at least minimum_size bytes get
+    one sibling per encoding, e.g. app.js.br, unless an up-to-date one
+    exists. Siblings that would not be smaller are not written. Serving a
+    sibling costs no CPU, so files below COMPRESSION_MINIMUM_SIZE are worth
+    precompressing too.
+
+    Returns:
+        Number of files written
+    """
+    written = 0
+    for path in Path(directory).rglob("*"):
+        if not path.name.endswith(PRECOMPRESS_FILE_SUFFIXES) or not path.is_file():
+            continue
+        source = path.stat()
+        if source.st_size < minimum_size:
+            continue
+        body = None
+        for encoding in encodings:
+            target = path.with_name(path.name + PRECOMPRESSED_SUFFIXES[encoding])
+            try:
+                if target.stat().st_mtime >= source.st_mtime:
+                    continue
+            except FileNotFoundError:
+                pass
+            if body is None:
+                body = path.read_bytes()
+            compressed = compress(body, encoding, PRECOMPRESS_LEVELS[encoding])
+            if len(compressed) >= len(body):
+                continue
+            # Written under a temporary name so no request sees a partial file
+            fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(compressed)
+                # mkstemp creates files readable by their owner only
+                os.chmod(temp_name, source.st_mode & 0o777)
+                os.replace(temp_name, target)
+            except BaseException:
+                os.unlink(temp_name)
+                raise
+            written += 1
+    if written:
+        app_logger.info(f"Precompressed {written} static files under {directory}")
+    return written
@@ -1,7 +1,8 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
+import json
 import os
 from pydantic import AnyHttpUrl, field_validator, Field
-from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
 
 class Settings(BaseSettings):
     """Application settings.
@@ -28,7 +29,7 @@ class Settings(BaseSettings):
     # CORS SETTINGS
     # List of origins that are allowed to make cross-origin requests
     # Use ["*"] to allow any origin (not recommended for production)
-    cors_origins: List[str] = []
+    cors_origins: Annotated[List[str], NoDecode] = []
     
     # SECURITY SETTINGS
     # Secret key for signing tokens - MUST be overridden in production
@@ -41,9 +42,81 @@ class Settings(BaseSettings):
     # DATABASE SETTINGS
     # Database connection string - override in production
     database_url: Optional[str] = None
+    # Optional async connection string; derived from database_url when unset
+    async_database_url: Optional[str] = None
+    # Log a warning when one request runs at least this many queries
+    db_query_warning_threshold: int = 20
+    # Log a possible N+1 when one statement repeats this often in a request
+    db_repeated_query_threshold: int = 5
+    
+    # HTTP CACHING
+    # Cache-Control for the catalog API: fresh for max-age seconds, then
+    # served stale for up to stale-while-revalidate seconds while revalidating
+    catalog_cache_max_age: int = 30
+    catalog_stale_while_revalidate: int = 300
+    
+    # STARTUP SETTINGS
+    # "warm_first" finishes all startup work before serving; "serve_first"
+    # serves as soon as required phases are done and warms caches afterwards
+    startup_mode: Literal["warm_first", "serve_first"] = "warm_first"
+    # Seconds a request that arrives during startup waits before getting a 503
+    startup_gate_timeout: float = 30.0
+    
+    # CATALOG
+    # Seconds between checks for catalog imports run by other processes (e.g.
+    # the import CLI), which make every server reload; 0 disables the checks
+    catalog_poll_interval: float = 5.0
+    
+    # CART STORAGE
+    # "sqlite" keeps carts in a WAL-mode SQLite file; "redis" in Redis under
+    # cart:<storage id> (needs the redis package and REDIS_URL)
+    cart_store: Literal["sqlite", "redis"] = "sqlite"
+    cart_store_path: str = "carts.db"
+    redis_url: Optional[str] = None
+    # Mutations of a cart within this many seconds are written once; Redis,
+    # which other servers read, is always written through
+    cart_write_delay: float = 0.5
+    
+    # RATE LIMITING
+    # "memory" limits each process on its own; "redis" shares the counters of
+    # all machines through REDIS_URL
+    rate_limit_store: Literal["memory", "redis"] = "memory"
+    # Requests per client IP and window when the rate_limit middleware is on
+    rate_limit_requests: int = 100
+    rate_limit_window: int = 60
+    # Seconds to wait for the shared store before deciding on local counters
+    rate_limit_timeout: float = 0.05
+    
+    # MIDDLEWARE
+    # Middleware layers from outermost to innermost, as a comma-separated list
+    # of: metrics, request_context, rate_limit, session, compression, cors. Layers
+    # with nothing to do (cors without CORS_ORIGINS, session without a
+    # SECRET_KEY) are skipped. NiceGUI adds its own session middleware when
+    # run with a storage secret.
+    middleware: Annotated[List[str], NoDecode] = ["metrics", "request_context", "compression", "cors"]
+    # COMPRESSION
+    # br, zstd (with the brotli / zstandard packages) or gzip, as negotiated.
+    # Smaller responses are sent uncompressed
+    compression_minimum_size: int = 1000
+    # Memory for compressed bodies of responses with an ETag, which are
+    # compressed once and then served from this cache
+    compression_cache_bytes: int = 32 * 1024 * 1024
+    # METRICS
+    # Per-route request metrics in the Prometheus text format; empty disables
+    # the endpoint (requests are still measured)
+    metrics_path: str = "/metrics"
+    
+    # INVENTORY RESERVATIONS
+    # Seconds a cart holds the stock of its products after the last activity
+    reservation_ttl: int = 900
     
     # STATIC FILES
     static_dir: str = "app/static"
+    # Ingest product images into static_dir at startup (deferrable phase)
+    ingest_product_images: bool = True
+    # Directory product image_url may name local files in (feed imports);
+    # unset, only http(s) image URLs are fetched
+    image_import_dir: Optional[str] = None
     
     # TEMPLATES
     templates_dir: str = "app/templates"
@@ -56,16 +129,18 @@ class Settings(BaseSettings):
     )
     
     # Validators
-    @field_validator("cors_origins", mode="before")
+    @field_validator("cors_origins", "middleware", mode="before")
     @classmethod
     def assemble_cors_origins(cls, v: Union[str, List[str]]) -> Union[List[str], str]:
-        """Parse CORS origins from string to list.
+        """Parse CORS origins and middleware names from string to list.
         
-        This allows setting CORS_ORIGINS as a comma-separated string in .env file.
+        This allows setting CORS_ORIGINS or MIDDLEWARE as a comma-separated string in .env file.
         """
         if isinstance(v, str) and not v.startswith("["):
-            return [i.strip() for i in v.split(",")]
-        elif isinstance(v, (list, str)):
+            return [i.strip() for i in v.split(",") if i.strip()]
+        elif isinstance(v, str):
+            return json.loads(v)
+        elif isinstance(v, list):
             return v
         raise ValueError(v)
 
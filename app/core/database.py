@@ -1,93 +1,316 @@
-from typing import Generator, Optional, Dict, Any
+from typing import AsyncGenerator, Callable, Generator, Optional, Dict, Any
+import functools
+import inspect
 import os
-from contextlib import contextmanager
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 
-# SQLAlchemy imports are commented out since they're optional dependencies
-# Uncomment these when you need database functionality
-# from sqlalchemy import create_engine, MetaData
-# from sqlalchemy.ext.declarative import declarative_base
-# from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, Session
 
 from app.core.config import settings
 from app.core.logging import app_logger
 
-# This is a placeholder for the SQLAlchemy Base class
-# Uncomment when you need database functionality
-# Base = declarative_base()
+# Database used when DATABASE_URL is not configured
+DEFAULT_DATABASE_URL = "sqlite:///watches.db"
 
-# Placeholder for the SQLAlchemy engine
-engine = None
+# Async drivers used for the event-loop side of the application
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
 
-# Placeholder for the SQLAlchemy sessionmaker
-# SessionLocal = None
+# Declarative base shared by all SQLAlchemy models
+Base = declarative_base()
 
-def setup_database() -> None:
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record) -> None:
+    # SQLite ignores FOREIGN KEY clauses, ON DELETE CASCADE included, unless
+    # every connection turns enforcement on
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def _create_engine(database_url: str):
+    """Create an engine with the connect args required by the given backend."""
+    connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
+    engine = create_engine(database_url, connect_args=connect_args, echo=settings.debug)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _enable_sqlite_foreign_keys)
+    return engine
+
+
+def get_async_database_url(database_url: str) -> str:
+    """Return the async-driver equivalent of a sync database URL.
+    
+    Args:
+        database_url: A database URL such as ``sqlite:///watches.db``
+        
+    Returns:
+        The same URL using the async driver (e.g. ``sqlite+aiosqlite``)
+    """
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    if driver:
+        url = url.set(drivername=driver)
+    return url.render_as_string(hide_password=False)
+
+
+def _create_async_engine(database_url: str):
+    """Create an async engine for the given (sync or async) database URL."""
+    engine = create_async_engine(get_async_database_url(database_url), echo=settings.debug)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _enable_sqlite_foreign_keys)
+    return engine
+
+
+# SQLAlchemy engine and session factory
+engine = _create_engine(settings.database_url or DEFAULT_DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine and session factory for code running on the NiceGUI event loop.
+# Queries run in the driver's worker thread, so a slow query only delays the
+# awaiting page instead of every connected client.
+async_engine = _create_async_engine(settings.async_database_url or settings.database_url or DEFAULT_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+def setup_database(database_url: Optional[str] = None) -> None:
     """Initialize database connection and session factory.
     
-    This function should be called at application startup to set up the database connection.
-    It's currently a placeholder - uncomment and modify when you need database functionality.
+    The engine is created at import time from DATABASE_URL (falling back to
+    the local SQLite file). Call this function to point the application at a
+    different database, e.g. in scripts.
+    
+    Args:
+        database_url: Optional database URL overriding the configured one
     """
-    global engine
-    # global SessionLocal
+    global engine, async_engine
     
-    # Check if database URL is configured
-    if not settings.database_url or settings.database_url == "sqlite:///./test.db":
-        app_logger.warning("Database URL not configured or using default test database")
+    if not database_url:
         return
     
     try:
-        # Uncomment when you need database functionality
-        # engine = create_engine(
-        #     settings.database_url,
-        #     pool_pre_ping=True,  # Check connection before using from pool
-        #     pool_recycle=3600,   # Recycle connections after 1 hour
-        #     echo=settings.debug, # Log SQL queries in debug mode
-        # )
-        # 
-        # # Create session factory
-        # SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        # 
-        # app_logger.info(f"Database connection established: {settings.database_url.split('@')[-1]}")
-        pass
+        engine = _create_engine(database_url)
+        SessionLocal.configure(bind=engine)
+        async_engine = _create_async_engine(database_url)
+        AsyncSessionLocal.configure(bind=async_engine)
+        app_logger.info(f"Database connection established: {database_url.split('@')[-1]}")
     except Exception as e:
         app_logger.error(f"Failed to connect to database: {e}")
         raise
 
-# Uncomment when you need database functionality
-# def get_db() -> Generator[Session, None, None]:
-#     """Get a database session.
-#     
-#     This function is intended to be used as a FastAPI dependency.
-#     
-#     Yields:
-#         SQLAlchemy Session
-#     """
-#     if not SessionLocal:
-#         raise RuntimeError("Database not initialized. Call setup_database() first.")
-#     
-#     db = SessionLocal()
-#     try:
-#         yield db
-#     finally:
-#         db.close()
+# Request-scoped unit of work
+#
+# All database access made while building one page or serving one API request
+# shares a single session. Sessions are opened lazily, so requests served
+# entirely from in-memory caches never check out a connection.
 
-# @contextmanager
-# def get_db_context() -> Generator[Session, None, None]:
-#     """Get a database session as a context manager.
-#     
-#     This function is intended to be used with the 'with' statement.
-#     
-#     Yields:
-#         SQLAlchemy Session
-#     """
-#     if not SessionLocal:
-#         raise RuntimeError("Database not initialized. Call setup_database() first.")
-#     
-#     db = SessionLocal()
-#     try:
-#         yield db
-#     finally:
-#         db.close()
+class UnitOfWork:
+    """Session(s) shared by everything running within one request.
+    
+    Attributes:
+        name: Label used in log messages (e.g. the page path)
+        query_count: Number of SQL statements executed so far
+        statement_counts: Executions per distinct SQL string, used to spot N+1 patterns
+    """
+    def __init__(self, name: str = "request"):
+        self.name = name
+        self.query_count = 0
+        self.statement_counts: Dict[str, int] = {}
+        self.started_at = time.perf_counter()
+        self._session: Optional[Session] = None
+        self._async_session: Optional[AsyncSession] = None
+    
+    @property
+    def session(self) -> Session:
+        """The synchronous session, opened on first use."""
+        if self._session is None:
+            self._session = SessionLocal()
+        return self._session
+    
+    @property
+    def async_session(self) -> AsyncSession:
+        """The async session, opened on first use."""
+        if self._async_session is None:
+            self._async_session = AsyncSessionLocal()
+        return self._async_session
+    
+    def record(self, statement: str) -> None:
+        """Count one executed statement."""
+        self.query_count += 1
+        self.statement_counts[statement] = self.statement_counts.get(statement, 0) + 1
+    
+    def log_summary(self) -> None:
+        """Log the query count, warning on likely N+1 patterns."""
+        elapsed_ms = (time.perf_counter() - self.started_at) * 1000
+        repeated = {sql: n for sql, n in self.statement_counts.items() if n >= settings.db_repeated_query_threshold}
+        message = f"{self.name}: {self.query_count} queries in {elapsed_ms:.1f}ms"
+        if repeated:
+            for sql, n in repeated.items():
+                app_logger.warning(f"{self.name}: possible N+1, statement executed {n} times: {sql[:200]}")
+        if self.query_count >= settings.db_query_warning_threshold:
+            app_logger.warning(message)
+        elif self.query_count:
+            app_logger.debug(message)
+    
+    def commit(self) -> None:
+        if self._session is not None:
+            self._session.commit()
+    
+    def rollback(self) -> None:
+        if self._session is not None:
+            self._session.rollback()
+    
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+    
+    async def commit_async(self) -> None:
+        self.commit()
+        if self._async_session is not None:
+            await self._async_session.commit()
+    
+    async def rollback_async(self) -> None:
+        self.rollback()
+        if self._async_session is not None:
+            await self._async_session.rollback()
+    
+    async def close_async(self) -> None:
+        self.close()
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+
+# The unit of work active in the current request (thread or asyncio task)
+_current_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar("current_unit_of_work", default=None)
+
+def get_current_unit_of_work() -> Optional[UnitOfWork]:
+    """Return the unit of work active in the current context, if any."""
+    return _current_unit_of_work.get()
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    unit_of_work = _current_unit_of_work.get()
+    if unit_of_work is not None:
+        unit_of_work.record(statement)
+
+@contextmanager
+def unit_of_work(name: str = "request") -> Generator[UnitOfWork, None, None]:
+    """Open a unit of work, or join the one already active in this context.
+    
+    The outermost scope commits on success, rolls back on error and logs the
+    number of queries executed. Nested scopes share the outer session.
+    
+    Args:
+        name: Label used in log messages
+        
+    Yields:
+        The active UnitOfWork
+    """
+    current = _current_unit_of_work.get()
+    if current is not None:
+        yield current
+        return
+    
+    uow = UnitOfWork(name)
+    token = _current_unit_of_work.set(uow)
+    try:
+        yield uow
+        uow.commit()
+    except Exception:
+        uow.rollback()
+        raise
+    finally:
+        uow.close()
+        _current_unit_of_work.reset(token)
+        uow.log_summary()
+
+@asynccontextmanager
+async def async_unit_of_work(name: str = "request") -> AsyncGenerator[UnitOfWork, None]:
+    """Async counterpart of unit_of_work() for NiceGUI page handlers.
+    
+    Args:
+        name: Label used in log messages
+        
+    Yields:
+        The active UnitOfWork
+    """
+    current = _current_unit_of_work.get()
+    if current is not None:
+        yield current
+        return
+    
+    uow = UnitOfWork(name)
+    token = _current_unit_of_work.set(uow)
+    try:
+        yield uow
+        await uow.commit_async()
+    except Exception:
+        await uow.rollback_async()
+        raise
+    finally:
+        await uow.close_async()
+        _current_unit_of_work.reset(token)
+        uow.log_summary()
+
+def get_db() -> Generator[Session, None, None]:
+    """Get the request's database session.
+    
+    This function is intended to be used as a FastAPI dependency.
+    
+    Yields:
+        SQLAlchemy Session
+    """
+    with unit_of_work() as uow:
+        yield uow.session
+
+@contextmanager
+def get_db_context() -> Generator[Session, None, None]:
+    """Get the current request's database session as a context manager.
+    
+    This function is intended to be used with the 'with' statement. Inside a
+    request it returns the shared session; otherwise it opens a new one.
+    
+    Yields:
+        SQLAlchemy Session
+    """
+    with unit_of_work() as uow:
+        yield uow.session
+
+@asynccontextmanager
+async def get_async_db_context() -> AsyncGenerator[AsyncSession, None]:
+    """Get the current request's async database session.
+    
+    Yields:
+        SQLAlchemy AsyncSession
+    """
+    async with async_unit_of_work() as uow:
+        yield uow.async_session
+
+def with_unit_of_work(func: Callable) -> Callable:
+    """Decorator running a page handler inside one unit of work.
+    
+    Works for both sync and async handlers. The handler's name is used as the
+    label in query-count log messages.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with async_unit_of_work(func.__name__):
+                return await func(*args, **kwargs)
+        return async_wrapper
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with unit_of_work(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
 
 # def create_tables() -> None:
 #     """Create all tables defined in SQLAlchemy models.
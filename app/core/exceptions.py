@@ -104,6 +104,19 @@ class RateLimitError(AppException):
             headers=headers
         )
 
+class ConflictError(AppException):
+    """Exception raised when a request conflicts with the current state (e.g. out of stock)."""
+    def __init__(
+        self, 
+        detail: str = "Request conflicts with the current state",
+        headers: Optional[Dict[str, Any]] = None
+    ):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=detail,
+            headers=headers
+        )
+
 class DatabaseError(AppException):
     """Exception raised when a database operation fails."""
     def __init__(
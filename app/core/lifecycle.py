@@ -0,0 +1,161 @@
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.logging import app_logger
+
+STARTUP_MODES = ("warm_first", "serve_first")
+
+
+@dataclass(frozen=True)
+class StartupPhase:
+    """One named step of application startup.
+    
+    Attributes:
+        name: Label used in the timing log
+        run: Sync or async callable; sync callables run in a worker thread
+        required: Whether requests may only be served after this phase
+    """
+    name: str
+    run: Callable[[], Any]
+    required: bool = True
+
+
+class StartupLifecycle:
+    """Ordered startup phases, run from the server's startup hook.
+    
+    NiceGUI runs async startup handlers as background tasks, so the server
+    accepts connections while the phases run. Serving is gated on `ready`
+    instead (see StartupGateMiddleware): required phases (e.g. migrations)
+    always finish before a request is handled. Deferrable phases (seeding,
+    cache warming) run after them: before the gate opens in "warm_first"
+    mode, or in the background once serving has started in "serve_first"
+    mode, which keeps cold starts short.
+    
+    Attributes:
+        mode: "warm_first" or "serve_first"
+        timings: Seconds spent per phase, in completion order
+        ready: Whether requests may be served
+        failed: Name of the required phase that failed, if any
+        warm: Whether every phase has completed
+    """
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = mode or settings.startup_mode
+        if self.mode not in STARTUP_MODES:
+            raise ValueError(f"Unknown startup mode: {self.mode}")
+        self.phases: List[StartupPhase] = []
+        self.timings: Dict[str, float] = {}
+        self.ready = False
+        self.failed: Optional[str] = None
+        self.warm = False
+        self._ready_event: Optional[asyncio.Event] = None
+        self._warm_task: Optional[asyncio.Task] = None
+    
+    def phase(self, name: str, required: bool = True) -> Callable[[Callable[[], Any]], Callable[[], Any]]:
+        """Decorator registering a function as a startup phase.
+        
+        Args:
+            name: Label used in the timing log
+            required: Whether it must finish before requests are served
+        """
+        def decorator(func: Callable[[], Any]) -> Callable[[], Any]:
+            self.add_phase(name, func, required=required)
+            return func
+        return decorator
+    
+    def add_phase(self, name: str, run: Callable[[], Any], required: bool = True) -> None:
+        """Register a startup phase; phases run in registration order."""
+        self.phases.append(StartupPhase(name, run, required))
+    
+    async def _run_phase(self, phase: StartupPhase) -> None:
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(phase.run):
+                await phase.run()
+            else:
+                await asyncio.to_thread(phase.run)
+        finally:
+            self.timings[phase.name] = time.perf_counter() - started
+        app_logger.debug(f"Startup phase {phase.name} took {self.timings[phase.name] * 1000:.1f}ms")
+    
+    async def _run_deferred(self, started: float) -> None:
+        for phase in self.phases:
+            if not phase.required:
+                try:
+                    await self._run_phase(phase)
+                except Exception as e:
+                    # The app keeps serving; caches fill lazily instead
+                    app_logger.error(f"Deferred startup phase {phase.name} failed: {e}")
+        self.warm = True
+        self._log_breakdown("warm", started)
+    
+    async def startup(self) -> None:
+        """Run the phases; install with ``app.on_startup(lifecycle.startup)``."""
+        started = time.perf_counter()
+        # A restarted app (e.g. between tests) starts gated again
+        self.ready = False
+        self.failed = None
+        self._ready_event = None
+        for phase in self.phases:
+            if phase.required:
+                try:
+                    await self._run_phase(phase)
+                except Exception as e:
+                    # The gate answers 503 rather than serving a half-migrated app
+                    self.failed = phase.name
+                    self._ready_signal().set()
+                    app_logger.error(f"Required startup phase {phase.name} failed: {e}")
+                    raise
+        
+        if self.mode == "serve_first":
+            self._log_breakdown("ready to serve", started)
+            self._open()
+            self._warm_task = asyncio.create_task(self._run_deferred(started))
+        else:
+            await self._run_deferred(started)
+            self._open()
+    
+    def _open(self) -> None:
+        self.ready = True
+        self._ready_signal().set()
+    
+    def _ready_signal(self) -> asyncio.Event:
+        # Created on first use, inside the server's event loop
+        if self._ready_event is None:
+            self._ready_event = asyncio.Event()
+        return self._ready_event
+    
+    async def wait_ready(self, timeout: float) -> bool:
+        """Wait until requests may be served.
+        
+        Returns:
+            False if a required phase failed or timeout seconds passed first
+        """
+        if not self.ready and self.failed is None:
+            try:
+                await asyncio.wait_for(self._ready_signal().wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.ready
+    
+    def _log_breakdown(self, stage: str, started: float) -> None:
+        total = (time.perf_counter() - started) * 1000
+        phases = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.timings.items())
+        app_logger.info(f"Startup {stage} after {total:.1f}ms ({self.mode}): {phases}")
+    
+    def status(self) -> Dict[str, Any]:
+        """Startup state for health checks."""
+        return {
+            "mode": self.mode,
+            "ready": self.ready,
+            "failed": self.failed,
+            "warm": self.warm,
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()},
+        }
+
+
+# Application-wide lifecycle; main.py registers its phases on it
+lifecycle = StartupLifecycle()
@@ -99,4 +99,19 @@ def log_structured(logger: logging.Logger, level: str, message: str, data: Dict[
     elif level.lower() == "error":
         logger.error(f"{message} - {data}")
     elif level.lower() == "critical":
-        logger.critical(f"{message} - {data}")
\ No newline at end of file
+        logger.critical(f"{message} - {data}")
+
+# Helper function to (re)configure the application logger
+def setup_logging(level: Optional[str] = None) -> logging.Logger:
+    """Configure the application logger.
+    
+    Args:
+        level: Optional log level override (defaults to LOG_LEVEL)
+        
+    Returns:
+        The application logger
+    """
+    level = (level or log_level).upper()
+    if level in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        app_logger.setLevel(getattr(logging, level))
+    return app_logger
@@ -1,21 +1,39 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount
+import asyncio
+import re
 import time
-from typing import Callable, List
+import uuid
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
 
 # Import settings
 from app.core.config import settings
+from app.core.compression import (
+    FAST_LEVELS,
+    THREAD_MINIMUM_SIZE,
+    CompressionCache,
+    StreamCompressor,
+    compress,
+    is_compressible,
+    negotiate_encoding,
+)
+from app.core.exceptions import ConfigurationError
+from app.core.lifecycle import StartupLifecycle
 from app.core.logging import app_logger
+from app.core.metrics import PROMETHEUS_CONTENT_TYPE, MetricsRegistry, metrics
+from app.core.rate_limit import MemoryRateLimitStore, RateLimitStore, create_rate_limit_store
 
-def setup_middleware(app: FastAPI) -> None:
-    """Set up middleware for the FastAPI application.
-    
-    Args:
-        app: The FastAPI application instance
-    """
-    # Add CORS middleware
+# Stores opened by add_rate_limiting(), closed by close_middleware()
+_rate_limit_stores: List[RateLimitStore] = []
+
+def _add_cors(app: FastAPI) -> bool:
+    if not settings.cors_origins:
+        return False
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.cors_origins,
@@ -23,37 +41,188 @@ def setup_middleware(app: FastAPI) -> None:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    return True
+
+def _add_compression(app: FastAPI) -> bool:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        cache=CompressionCache(settings.compression_cache_bytes),
+    )
+    return True
+
+def _add_session(app: FastAPI) -> bool:
+    if not settings.secret_key or settings.secret_key == "CHANGEME_IN_PRODUCTION":
+        return False
+    app.add_middleware(
+        SessionMiddleware,
+        secret_key=settings.secret_key,
+        max_age=3600,  # 1 hour
+    )
+    return True
+
+def _add_metrics(app: FastAPI) -> bool:
+    add_metrics(app)
+    return True
+
+def _add_request_context(app: FastAPI) -> bool:
+    app.add_middleware(RequestContextMiddleware)
+    return True
+
+def _add_rate_limit(app: FastAPI) -> bool:
+    add_rate_limiting(app, settings.rate_limit_requests, settings.rate_limit_window)
+    return True
+
+# Layers that can be named in settings.middleware; each installer returns
+# False when the layer has nothing to do and was skipped
+MIDDLEWARE_LAYERS: Dict[str, Callable[[FastAPI], bool]] = {
+    "metrics": _add_metrics,
+    "request_context": _add_request_context,
+    "rate_limit": _add_rate_limit,
+    "session": _add_session,
+    "compression": _add_compression,
+    "cors": _add_cors,
+}
+
+def setup_middleware(app: FastAPI, layers: Optional[List[str]] = None) -> List[str]:
+    """Set up middleware for the FastAPI application.
     
-    # Add GZip compression middleware
-    app.add_middleware(GZipMiddleware, minimum_size=1000)
+    Every layer is a pure ASGI middleware, so none of them adds a task or a
+    queue of its own. Only compression buffers response bodies, and only
+    those it compresses whole.
     
-    # Add session middleware if secret key is set
-    if settings.secret_key and settings.secret_key != "CHANGEME_IN_PRODUCTION":
-        app.add_middleware(
-            SessionMiddleware,
-            secret_key=settings.secret_key,
-            max_age=3600,  # 1 hour
-        )
+    Args:
+        app: The FastAPI application instance
+        layers: Layer names from outermost to innermost; defaults to settings.middleware
+        
+    Returns:
+        The layers installed, outermost first
+        
+    Raises:
+        ConfigurationError: If a layer name is unknown
+    """
+    layers = settings.middleware if layers is None else layers
+    unknown = [name for name in layers if name not in MIDDLEWARE_LAYERS]
+    if unknown:
+        raise ConfigurationError(detail=f"Unknown middleware: {', '.join(unknown)}")
     
-    # Add request timing middleware
-    @app.middleware("http")
-    async def add_process_time_header(request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(process_time)
-        return response
+    # add_middleware wraps what was added before, so add the innermost first
+    installed = [name for name in reversed(layers) if MIDDLEWARE_LAYERS[name](app)]
+    installed.reverse()
     
     # Log middleware setup
-    app_logger.info("Middleware configured successfully")
+    app_logger.info(f"Middleware configured (outermost first): {', '.join(installed) or 'none'}")
+    return installed
+
+def add_startup_gate(app: FastAPI, lifecycle: StartupLifecycle) -> None:
+    """Hold requests until the lifecycle's required phases have run.
+    
+    Add it before setup_middleware(), so it sits inside the other layers and
+    waiting or rejected requests are still measured and rate limited.
+    """
+    app.add_middleware(
+        StartupGateMiddleware,
+        lifecycle=lifecycle,
+        timeout=settings.startup_gate_timeout,
+        # Metrics stay readable while the app starts
+        exempt_paths=[settings.metrics_path],
+    )
+
+async def close_middleware() -> None:
+    """Close the stores opened by rate limiting middleware (call on shutdown)."""
+    while _rate_limit_stores:
+        await _rate_limit_stores.pop().close()
 
 # Custom middleware classes
 
-class RateLimitMiddleware:
-    """Simple rate limiting middleware.
+# Id of the request being handled
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Incoming request ids are kept only if they look like one
+_REQUEST_ID_PATTERN = re.compile(rb"[A-Za-z0-9._-]{1,128}")
+
+def get_request_id() -> Optional[str]:
+    """Return the id of the HTTP request being handled, if any."""
+    return request_id_var.get()
+
+class StartupGateMiddleware:
+    """Holds HTTP requests until the startup lifecycle is ready.
+
+    Requests that arrive while the required startup phases run (e.g. the
+    one that woke a scaled-to-zero machine) wait up to `timeout` seconds
+    and are then served as usual. If startup takes longer or a required
+    phase failed, they get a 503.
+    """
+    def __init__(self, app, lifecycle: StartupLifecycle, timeout: float = 30.0, exempt_paths: List[str] = None):
+        self.app = app
+        self.lifecycle = lifecycle
+        self.timeout = timeout
+        self.exempt_paths = tuple(path for path in exempt_paths or () if path)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.lifecycle.ready
+            or (self.exempt_paths and scope["path"].startswith(self.exempt_paths))
+        ):
+            return await self.app(scope, receive, send)
+
+        if await self.lifecycle.wait_ready(self.timeout):
+            return await self.app(scope, receive, send)
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                [b"content-type", b"application/json"],
+                [b"retry-after", b"5"],
+            ],
+        })
+        await send({
+            "type": "http.response.body",
+            "body": b'{"detail":"The service is starting. Please try again shortly."}',
+        })
+
+class RequestContextMiddleware:
+    """Gives every HTTP request an id.
     
-    This is a basic implementation. For production, consider using a more
-    robust solution with Redis or another distributed cache.
+    The id is readable with get_request_id() anywhere while the request is
+    handled and is returned in the X-Request-ID header. An X-Request-ID
+    sent by a proxy is kept, so logs on both sides match.
+    """
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                if _REQUEST_ID_PATTERN.fullmatch(value):
+                    request_id = value.decode("ascii")
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+        header = (b"x-request-id", request_id.encode("ascii"))
+        
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
+        
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
+
+class RateLimitMiddleware:
+    """Rate limiting middleware.
+
+    Counts requests per client IP in a RateLimitStore: by default this
+    process's own counters, or a store shared by all machines (see
+    create_rate_limit_store).
     """
     def __init__(
         self,
@@ -61,50 +230,40 @@ class RateLimitMiddleware:
         limit: int = 100,
         window: int = 60,
         exempt_paths: List[str] = None,
+        max_clients: int = 100_000,
+        store: Optional[RateLimitStore] = None,
     ):
         self.app = app
         self.limit = limit  # requests per window
         self.window = window  # window in seconds
-        self.exempt_paths = exempt_paths or []
-        self.requests = {}
+        # An empty prefix would exempt every path
+        self.exempt_paths = tuple(path for path in exempt_paths or () if path)
+        self.store = store or MemoryRateLimitStore(limit, window, max_clients)
     
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http":
             return await self.app(scope, receive, send)
         
-        # Get client IP
-        client_ip = self._get_client_ip(scope)
-        path = scope["path"]
-        
         # Skip rate limiting for exempt paths
-        if any(path.startswith(exempt) for exempt in self.exempt_paths):
+        if self.exempt_paths and scope["path"].startswith(self.exempt_paths):
             return await self.app(scope, receive, send)
         
-        # Check rate limit
-        current_time = time.time()
-        if client_ip in self.requests:
-            requests_info = self.requests[client_ip]
-            # Clean up old requests
-            requests_info = [r for r in requests_info if current_time - r < self.window]
-            
-            if len(requests_info) >= self.limit:
-                # Rate limit exceeded
-                return await self._rate_limit_response(scope, receive, send)
-            
-            requests_info.append(current_time)
-            self.requests[client_ip] = requests_info
-        else:
-            self.requests[client_ip] = [current_time]
+        if not await self.store.hit(self._get_client_ip(scope), time.time()):
+            return await self._rate_limit_response(scope, receive, send)
         
         return await self.app(scope, receive, send)
     
     def _get_client_ip(self, scope):
         """Extract client IP from scope."""
-        headers = dict(scope.get("headers", []))
-        forwarded = headers.get(b"x-forwarded-for", b"").decode("utf8").split(",")[0].strip()
-        if forwarded:
-            return forwarded
-        return scope.get("client", ("", 0))[0] or "unknown"
+        # Scan the header list for the one header needed instead of building a dict
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                forwarded = value.split(b",", 1)[0].strip()
+                if forwarded:
+                    return forwarded.decode("latin-1")
+                break
+        client = scope.get("client")
+        return (client[0] if client else "") or "unknown"
     
     async def _rate_limit_response(self, scope, receive, send):
         """Send rate limit exceeded response."""
@@ -121,20 +280,267 @@ class RateLimitMiddleware:
             "body": b'{"detail":"Rate limit exceeded. Please try again later."}',
         })
 
+class CompressionMiddleware:
+    """Compresses responses with the best encoding the client accepts.
+
+    br, zstd or gzip is negotiated from Accept-Encoding (see compression).
+    Responses are sent as they are if their content type is not
+    compressible, they are smaller than minimum_size, they already have a
+    Content-Encoding (e.g. precompressed static files) or their
+    Cache-Control says no-transform.
+
+    Responses with an ETag (static files, versioned API responses) are
+    compressed through the cache, so identical bodies are compressed once.
+    Other responses are compressed per request at a fast level; streamed
+    ones chunk by chunk.
+    """
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1000,
+        cache: Optional[CompressionCache] = None,
+        max_cached_size: int = 8 * 1024 * 1024,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache or CompressionCache(32 * 1024 * 1024)
+        # Larger bodies are streamed instead of buffered for the cache
+        self.max_cached_size = max_cached_size
+
+    async def __call__(self, scope, receive, send):
+        # HEAD responses carry the length of the uncompressed body
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+
+        encoding = None
+        for name, value in scope.get("headers", ()):
+            if name == b"accept-encoding":
+                encoding = negotiate_encoding(value)
+                break
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        extensions = scope.get("extensions")
+        if extensions and "http.response.pathsend" in extensions:
+            # File bodies have to pass through send to be compressed
+            extensions = {key: value for key, value in extensions.items() if key != "http.response.pathsend"}
+            scope = {**scope, "extensions": extensions}
+        await self.app(scope, receive, _CompressingSender(self, encoding, send).send)
+
+class _CompressingSender:
+    """Wraps send for one response of CompressionMiddleware.
+
+    The response start is held back until the first body message shows
+    whether the body comes whole or in chunks.
+    """
+    __slots__ = ("middleware", "encoding", "downstream", "start", "passthrough", "cacheable", "content_length",
+                 "chunks", "stream")
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start = None
+        self.passthrough = False
+        self.cacheable = False
+        self.content_length: Optional[int] = None
+        self.chunks: Optional[List[bytes]] = None
+        self.stream: Optional[StreamCompressor] = None
+
+    async def send(self, message):
+        if self.passthrough:
+            return await self.downstream(message)
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            if self._should_compress(message):
+                self.start = message
+            else:
+                self.passthrough = True
+                await self.downstream(message)
+            return
+        if message_type != "http.response.body":
+            return await self.downstream(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is None and self.chunks is None:
+            # First body message
+            if not more_body:
+                return await self._send_whole(body)
+            middleware = self.middleware
+            if self.cacheable and self.content_length is not None and self.content_length <= middleware.max_cached_size:
+                self.chunks = []
+            else:
+                self.stream = StreamCompressor(self.encoding, FAST_LEVELS[self.encoding])
+                await self.downstream(self._start_message(self.encoding, None))
+
+        if self.chunks is not None:
+            self.chunks.append(body)
+            if not more_body:
+                await self._send_whole(b"".join(self.chunks))
+            return
+        compressed = self.stream.compress(body) if body else b""
+        if not more_body:
+            compressed += self.stream.finish()
+        if compressed or not more_body:
+            await self.downstream({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    def _should_compress(self, start) -> bool:
+        status = start["status"]
+        if status < 200 or status in (204, 206, 304):
+            return False
+        content_type = None
+        for name, value in start.get("headers", ()):
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+            elif name == b"content-length":
+                self.content_length = int(value) if value.isdigit() else None
+            elif name == b"etag":
+                self.cacheable = True
+            elif name == b"cache-control" and b"no-transform" in value.lower():
+                return False
+        if content_type is None or not is_compressible(content_type):
+            return False
+        return self.content_length is None or self.content_length >= self.middleware.minimum_size
+
+    async def _send_whole(self, body: bytes) -> None:
+        middleware = self.middleware
+        encoding = self.encoding
+        compressed = None
+        if len(body) >= middleware.minimum_size:
+            if self.cacheable and len(body) <= middleware.max_cached_size:
+                compressed = await middleware.cache.compress(body, encoding)
+            elif len(body) >= THREAD_MINIMUM_SIZE:
+                compressed = await asyncio.to_thread(compress, body, encoding, FAST_LEVELS[encoding])
+            else:
+                compressed = compress(body, encoding, FAST_LEVELS[encoding])
+        if compressed is None or len(compressed) >= len(body):
+            await self.downstream(self._start_message(None, len(body)))
+            await self.downstream({"type": "http.response.body", "body": body})
+        else:
+            await self.downstream(self._start_message(encoding, len(compressed)))
+            await self.downstream({"type": "http.response.body", "body": compressed})
+
+    def _start_message(self, encoding: Optional[str], content_length: Optional[int]):
+        headers = []
+        varies = False
+        for name, value in self.start.get("headers", ()):
+            if name == b"content-length":
+                continue
+            if name == b"vary":
+                varies = varies or b"accept-encoding" in value.lower() or value.strip() == b"*"
+            elif name == b"etag" and encoding and not value.startswith(b"W/"):
+                # The compressed body is a different representation
+                value = b"W/" + value
+            headers.append((name, value))
+        if not varies:
+            headers.append((b"vary", b"Accept-Encoding"))
+        if encoding:
+            headers.append((b"content-encoding", encoding.encode("ascii")))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("ascii")))
+        return {**self.start, "headers": headers}
+
+class MetricsMiddleware:
+    """Records the latency, status and size of every HTTP response.
+
+    Requests are labelled with the template of the route that handled them,
+    which the router leaves in the scope, so /product/1 and /product/2 are
+    one series.
+    """
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        status = 500  # Reported if the app fails before responding
+        bytes_sent = 0
+        
+        async def send_and_measure(message):
+            nonlocal status, bytes_sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                bytes_sent += len(message.get("body", b""))
+            await send(message)
+        
+        root_path = scope.get("root_path", "")
+        registry = self.registry
+        registry.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+            registry.record(scope["method"], self._route_label(scope, root_path), status, elapsed, bytes_sent)
+    
+    def _route_label(self, scope, root_path: str) -> str:
+        """Route template that handled the request, with the prefixes of mounts it passed."""
+        # Each mount passed appends its path to root_path
+        prefix = scope.get("root_path", "")[len(root_path):]
+        route = scope.get("route")
+        path = getattr(route, "path", None)
+        if path is None or isinstance(route, Mount):
+            # Mounted apps without routes of their own, e.g. static files
+            return f"{prefix}/{{path}}" if prefix else "unmatched"
+        return prefix + path
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Serve the request metrics of this process to Prometheus."""
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def add_metrics(app: FastAPI, path: Optional[str] = None) -> None:
+    """Measure every request and serve the metrics.
+    
+    Args:
+        app: The FastAPI application
+        path: Endpoint for the metrics; defaults to METRICS_PATH, empty to only measure
+    """
+    app.add_middleware(MetricsMiddleware)
+    path = settings.metrics_path if path is None else path
+    if path:
+        app.add_route(path, metrics_endpoint, include_in_schema=False)
+    app_logger.info(f"Request metrics configured{f' at {path}' if path else ''}")
+
 # Helper function to add rate limiting
-def add_rate_limiting(app: FastAPI, limit: int = 100, window: int = 60, exempt_paths: List[str] = None) -> None:
+def add_rate_limiting(
+    app: FastAPI,
+    limit: int = 100,
+    window: int = 60,
+    exempt_paths: List[str] = None,
+    max_clients: int = 100_000,
+) -> RateLimitStore:
     """Add rate limiting middleware to the application.
+
+    Counters live in the store selected by RATE_LIMIT_STORE.
     
     Args:
         app: The FastAPI application
         limit: Maximum number of requests per window
         window: Time window in seconds
         exempt_paths: List of path prefixes to exempt from rate limiting
+        max_clients: Most clients tracked at once; the least recently seen are evicted
+
+    Returns:
+        The store holding the counters; close_middleware() closes it
     """
+    store = create_rate_limit_store(limit, window, max_clients)
+    _rate_limit_stores.append(store)
     app.add_middleware(
         RateLimitMiddleware,
         limit=limit,
         window=window,
-        exempt_paths=exempt_paths or ["/static", "/docs", "/redoc", "/openapi.json"],
+        # NiceGUI serves its assets and websocket polling under /_nicegui
+        exempt_paths=exempt_paths or ["/static", "/_nicegui", "/docs", "/redoc", "/openapi.json", settings.metrics_path],
+        store=store,
     )
-    app_logger.info(f"Rate limiting configured: {limit} requests per {window} seconds")
\ No newline at end of file
+    app_logger.info(f"Rate limiting configured: {limit} requests per {window} seconds ({store.name})")
+    return store
\ No newline at end of file
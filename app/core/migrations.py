@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.exceptions import DatabaseError
+from app.core.logging import app_logger
+
+
+@dataclass(frozen=True)
+class Migration:
+    """A single schema migration.
+
+    Attributes:
+        version: Monotonically increasing schema version
+        description: Human readable summary of the change
+        upgrade: Callable applying the change on an open connection
+    """
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+# Bookkeeping table recording which migrations have been applied
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def get_schema_version(connection: Connection) -> int:
+    """Return the highest applied migration version (0 for a new database)."""
+    _metadata.create_all(connection, tables=[schema_migrations])
+    version = connection.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc())).scalar()
+    return version or 0
+
+
+def migrate(engine: Engine, migrations: Iterable[Migration], target: Optional[int] = None) -> int:
+    """Apply pending migrations in version order.
+
+    Each migration runs in its own transaction together with its bookkeeping
+    row, so on backends with transactional DDL a failed migration leaves the
+    schema at the previous version.
+
+    Args:
+        engine: The engine to migrate
+        migrations: All known migrations
+        target: Optional version to stop at (defaults to the latest)
+
+    Returns:
+        The schema version after migrating
+
+    Raises:
+        DatabaseError: If a migration fails
+    """
+    ordered: List[Migration] = sorted(migrations, key=lambda m: m.version)
+    versions = [m.version for m in ordered]
+    if len(versions) != len(set(versions)):
+        raise DatabaseError(detail="Duplicate migration versions")
+
+    with engine.begin() as connection:
+        current = get_schema_version(connection)
+
+    for migration in ordered:
+        if migration.version <= current or (target is not None and migration.version > target):
+            continue
+        try:
+            with engine.begin() as connection:
+                migration.upgrade(connection)
+                connection.execute(schema_migrations.insert().values(
+                    version=migration.version,
+                    description=migration.description,
+                    applied_at=datetime.utcnow(),
+                ))
+        except Exception as e:
+            app_logger.error(f"Migration {migration.version} ({migration.description}) failed: {e}")
+            raise DatabaseError(detail=f"Migration {migration.version} failed") from e
+        current = migration.version
+        app_logger.info(f"Applied migration {migration.version}: {migration.description}")
+
+    return current
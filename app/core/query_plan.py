@@ -0,0 +1,61 @@
+from typing import Any, Dict, List
+
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.exceptions import DatabaseError
+from app.core.logging import app_logger
+
+
+def explain_query_plan(connection: Connection, statement: Any) -> List[str]:
+    """Return the SQLite query plan for a statement.
+
+    Args:
+        connection: An open SQLite connection
+        statement: A SQLAlchemy selectable
+
+    Returns:
+        The ``detail`` column of each EXPLAIN QUERY PLAN row
+    """
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").fetchall()
+    return [row[-1] for row in rows]
+
+
+def find_full_scans(plan: List[str]) -> List[str]:
+    """Return the plan steps that scan a table without using an index.
+
+    Scans of a (covering) index are accepted, e.g. for DISTINCT queries.
+    """
+    return [step for step in plan if step.startswith("SCAN") and "INDEX" not in step]
+
+
+def check_query_plans(engine: Engine, statements: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Explain each statement and fail if any of them falls back to a table scan.
+
+    Args:
+        engine: A SQLite engine with the schema to check
+        statements: Mapping of query name to SQLAlchemy selectable
+
+    Returns:
+        Mapping of query name to its plan
+
+    Raises:
+        DatabaseError: If any statement performs a full table scan
+    """
+    if engine.dialect.name != "sqlite":
+        raise DatabaseError(detail="Query plan checks require SQLite")
+
+    plans: Dict[str, List[str]] = {}
+    failures: List[str] = []
+    with engine.connect() as connection:
+        for name, statement in statements.items():
+            plan = explain_query_plan(connection, statement)
+            plans[name] = plan
+            scans = find_full_scans(plan)
+            if scans:
+                failures.append(f"{name}: {'; '.join(scans)}")
+            app_logger.debug(f"Query plan for {name}: {plan}")
+
+    if failures:
+        raise DatabaseError(detail=f"Full table scans in query plans: {', '.join(failures)}")
+    return plans
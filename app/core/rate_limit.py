@@ -0,0 +1,301 @@
+"""Rate limit counters.
+
+SlidingWindowLimiter counts requests per client in process memory. A
+RateLimitStore puts it behind a common interface so the counters can
+instead be shared between machines in Redis. The Redis store checks and
+counts each request atomically in a Lua script, and sends all checks from
+one event loop iteration in a single pipeline. FallbackRateLimitStore waits
+at most a bounded time for the shared store. If it is slow or down, the
+request is decided on local counters.
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.exceptions import ConfigurationError, DatabaseError
+from app.core.logging import app_logger
+
+# Redis is only needed for the redis backend
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import NoScriptError
+except ImportError:  # pragma: no cover
+    aioredis = None
+
+    class NoScriptError(Exception):
+        pass
+
+REDIS_KEY_PREFIX = "ratelimit:"
+# Most checks sent in one pipeline
+REDIS_MAX_BATCH = 512
+# Seconds local counters decide alone after the shared store failed
+FALLBACK_PERIOD = 5.0
+# A stalled connection fails after this many seconds instead of blocking
+# the batches behind it
+REDIS_SOCKET_TIMEOUT = 1.0
+
+# Sliding window counter, checked and counted in one step.
+# KEYS: counter of the current window, counter of the previous window
+# ARGV: limit, weight of the previous window, counter TTL in seconds
+_SLIDING_WINDOW_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if current + previous * tonumber(ARGV[2]) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+if current == 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+
+class SlidingWindowLimiter:
+    """Per-client request limits with a sliding window counter.
+
+    Each client keeps two counters: requests in the current fixed window and
+    in the previous one. The previous count is weighted by how much of it
+    still overlaps the sliding window, so a check costs O(1) no matter how
+    high the limit is.
+
+    Clients are kept in least-recently-seen order. Clients idle for two
+    windows no longer affect any limit and are evicted as they reach the
+    front, and past max_clients the least recently seen client is evicted,
+    so memory stays bounded under floods of distinct IPs.
+    """
+    def __init__(self, limit: int, window: float, max_clients: int = 100_000):
+        self.limit = limit
+        self.window = window
+        self.max_clients = max_clients
+        self.evictions = 0
+        # client -> [window index, count in that window, count in the window before]
+        self._clients: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def hit(self, client: str, now: Optional[float] = None) -> bool:
+        """Count a request from a client unless it is over the limit.
+
+        Returns:
+            True if the request is allowed
+        """
+        now = time.time() if now is None else now
+        index = int(now // self.window)
+        clients = self._clients
+        state = clients.get(client)
+        if state is None:
+            state = clients[client] = [index, 0, 0]
+            self._evict(index)
+        else:
+            clients.move_to_end(client)
+            if state[0] != index:
+                state[2] = state[1] if state[0] == index - 1 else 0
+                state[0] = index
+                state[1] = 0
+        overlap = 1.0 - (now - index * self.window) / self.window
+        if state[1] + state[2] * overlap >= self.limit:
+            return False
+        state[1] += 1
+        return True
+
+    def _evict(self, index: int) -> None:
+        clients = self._clients
+        # Least recently seen first. Dropping up to two idle clients per new
+        # one drains them without ever scanning the whole table.
+        for _ in range(2):
+            if len(clients) < 2 or next(iter(clients.values()))[0] >= index - 1:
+                break
+            clients.popitem(last=False)
+            self.evictions += 1
+        while len(clients) > self.max_clients:
+            clients.popitem(last=False)
+            self.evictions += 1
+
+
+class RateLimitStore(ABC):
+    """Backend counting requests per client against one limit and window."""
+    name = "store"
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+
+    @abstractmethod
+    async def hit(self, client: str, now: float) -> bool:
+        """Count a request unless the client is over the limit.
+
+        Returns:
+            True if the request is allowed
+
+        Raises:
+            DatabaseError: If the store cannot be reached
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Counters of this process only."""
+    name = "memory"
+
+    def __init__(self, limit: int, window: float, max_clients: int = 100_000):
+        super().__init__(limit, window)
+        self.limiter = SlidingWindowLimiter(limit, window, max_clients)
+
+    def __len__(self) -> int:
+        return len(self.limiter)
+
+    async def hit(self, client: str, now: float) -> bool:
+        return self.limiter.hit(client, now)
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Counters shared by every machine, as Redis keys that expire after two windows.
+
+    Checks are queued and sent by one flusher task: everything queued while
+    the previous pipeline was in flight goes out in the next one, so a busy
+    process makes one round trip per batch rather than per request.
+    """
+    name = "redis"
+
+    def __init__(self, limit: int, window: float, url: Optional[str] = None, client: Any = None):
+        """
+        Args:
+            limit: Requests allowed per window
+            window: Window in seconds
+            url: Redis URL, e.g. redis://localhost:6379/0
+            client: A ready redis.asyncio.Redis-compatible client, used instead of url
+
+        Raises:
+            ConfigurationError: If neither is usable
+        """
+        super().__init__(limit, window)
+        if client is None:
+            if aioredis is None:
+                raise ConfigurationError(detail="The redis package is required for RATE_LIMIT_STORE=redis")
+            if not url:
+                raise ConfigurationError(detail="REDIS_URL is required for RATE_LIMIT_STORE=redis")
+            client = aioredis.Redis.from_url(
+                url, socket_timeout=REDIS_SOCKET_TIMEOUT, socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+            )
+        self._client = client
+        self._sha: Optional[str] = None
+        self._ttl = int(2 * window) + 1
+        self._queue: List[Tuple[str, float, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self.batches = 0
+
+    async def hit(self, client: str, now: float) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((client, now, future))
+        if self._flusher is None or self._flusher.done():
+            # Starts after this loop iteration, so concurrent requests join the batch
+            self._flusher = asyncio.create_task(self._flush())
+        return await future
+
+    async def _execute(self, batch: List[Tuple[str, float, asyncio.Future]]) -> List[Any]:
+        if self._sha is None:
+            self._sha = await self._client.script_load(_SLIDING_WINDOW_SCRIPT)
+        # EVALSHA directly: a registered Script would check SCRIPT EXISTS on
+        # every execute, a second round trip per batch
+        pipeline = self._client.pipeline(transaction=False)
+        for client, now, _ in batch:
+            index = int(now // self.window)
+            overlap = 1.0 - (now - index * self.window) / self.window
+            key = f"{REDIS_KEY_PREFIX}{{{client}}}:"  # Hash tag: both windows in one cluster slot
+            pipeline.evalsha(self._sha, 2, f"{key}{index}", f"{key}{index - 1}", self.limit, overlap, self._ttl)
+        return await pipeline.execute()
+
+    async def _flush(self) -> None:
+        while self._queue:
+            batch, self._queue = self._queue[:REDIS_MAX_BATCH], self._queue[REDIS_MAX_BATCH:]
+            try:
+                try:
+                    results = await self._execute(batch)
+                except NoScriptError:
+                    # The server lost the script, e.g. after a restart
+                    self._sha = None
+                    results = await self._execute(batch)
+            except Exception as e:
+                error = DatabaseError(detail=f"Rate limit store failed: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batches += 1
+            for (_, _, future), allowed in zip(batch, results):
+                # Callers that timed out have cancelled their future
+                if not future.done():
+                    future.set_result(bool(allowed))
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self._client.aclose()
+
+
+class FallbackRateLimitStore(RateLimitStore):
+    """A shared store with local counters to fall back on.
+
+    Every request is also counted locally. If the shared store does not
+    answer within `timeout` seconds or fails, the local counters decide,
+    and keep deciding for FALLBACK_PERIOD seconds before the shared store
+    is tried again. A request is never delayed by more than `timeout`.
+    """
+    def __init__(self, shared: RateLimitStore, local: MemoryRateLimitStore, timeout: float):
+        super().__init__(shared.limit, shared.window)
+        self.name = f"{shared.name} (local fallback)"
+        self.shared = shared
+        self.local = local
+        self.timeout = timeout
+        self.fallbacks = 0
+        self._fallback_until = 0.0
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    async def hit(self, client: str, now: float) -> bool:
+        allowed_locally = await self.local.hit(client, now)
+        if now < self._fallback_until:
+            return allowed_locally
+        try:
+            return await asyncio.wait_for(self.shared.hit(client, now), self.timeout)
+        except (asyncio.TimeoutError, DatabaseError) as e:
+            self.fallbacks += 1
+            if self._fallback_until <= now:
+                # Only the first of the concurrent failures logs
+                reason = "timed out" if isinstance(e, asyncio.TimeoutError) else e.detail
+                app_logger.warning(f"Rate limit store {reason}; using local counters for {FALLBACK_PERIOD}s")
+            self._fallback_until = now + FALLBACK_PERIOD
+            return allowed_locally
+
+    async def close(self) -> None:
+        await self.shared.close()
+
+
+def create_rate_limit_store(
+    limit: int,
+    window: float,
+    max_clients: int = 100_000,
+    backend: Optional[str] = None,
+) -> RateLimitStore:
+    """Create the configured rate limit store.
+
+    Raises:
+        ConfigurationError: If the backend is unknown or not usable
+    """
+    backend = backend or settings.rate_limit_store
+    local = MemoryRateLimitStore(limit, window, max_clients)
+    if backend == "memory":
+        return local
+    if backend == "redis":
+        shared = RedisRateLimitStore(limit, window, settings.redis_url)
+        return FallbackRateLimitStore(shared, local, settings.rate_limit_timeout)
+    raise ConfigurationError(detail=f"Unknown rate limit store: {backend}")
@@ -0,0 +1,79 @@
+import os
+import stat
+from mimetypes import guess_type
+from typing import Any, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from app.core.compression import ALL_ENCODINGS, PRECOMPRESSED_SUFFIXES, accepted_encodings, is_compressible
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves precompressed siblings of compressible files.
+
+    A request for app.js from a client accepting br is answered with
+    app.js.br, if it exists and is not older than app.js, sent with
+    Content-Encoding: br (likewise .zst for zstd and .gz for gzip). Each
+    sibling has its own ETag. See compression.precompress_directory().
+    """
+    def file_response(
+        self,
+        full_path: Any,
+        stat_result: os.stat_result,
+        scope: Any,
+        status_code: int = 200,
+    ) -> Response:
+        media_type = guess_type(str(full_path))[0]
+        if status_code != 200 or media_type is None or not is_compressible(media_type):
+            return super().file_response(full_path, stat_result, scope, status_code)
+        variant = self._precompressed_variant(full_path, stat_result, scope)
+        if variant is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            # Other clients may get a precompressed variant of the same URL
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+        encoding, variant_path, variant_stat = variant
+        response = FileResponse(
+            variant_path,
+            stat_result=variant_stat,
+            media_type=media_type,
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _precompressed_variant(
+        self, full_path: Any, stat_result: os.stat_result, scope: Any
+    ) -> Optional[Tuple[str, str, os.stat_result]]:
+        accept_encoding = next((value for name, value in scope["headers"] if name == b"accept-encoding"), b"")
+        # Serving a precompressed file needs no compression library
+        for encoding in accepted_encodings(accept_encoding, ALL_ENCODINGS):
+            variant_path = f"{full_path}{PRECOMPRESSED_SUFFIXES[encoding]}"
+            try:
+                # A stat on local disk, cheap enough to run on the event loop
+                variant_stat = os.stat(variant_path)
+            except OSError:
+                continue
+            if stat.S_ISREG(variant_stat.st_mode) and variant_stat.st_mtime >= stat_result.st_mtime:
+                return encoding, variant_path, variant_stat
+        return None
+
+
+class CachedStaticFiles(PrecompressedStaticFiles):
+    """StaticFiles that sends a fixed Cache-Control header.
+
+    Use it for directories whose filenames change with their content (e.g.
+    content-hashed image variants), so browsers and proxies can cache every
+    file for good.
+    """
+    def __init__(self, *args: Any, cache_control: str, **kwargs: Any):
+        self.cache_control = cache_control
+        super().__init__(*args, **kwargs)
+
+    def file_response(self, *args: Any, **kwargs: Any) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = self.cache_control
+        return response
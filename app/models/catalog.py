@@ -0,0 +1,98 @@
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Optional
+
+
+class ProductResponse(BaseModel):
+    """Response model for a catalog product."""
+    id: int = Field(..., description="The unique identifier for the product")
+    name: str = Field(..., description="Product name")
+    brand: str = Field(..., description="Watch brand")
+    category: str = Field(..., description="Watch category")
+    price: float = Field(..., description="Price in USD")
+    description: str = Field(..., description="Product description")
+    image_url: str = Field(..., description="URL of the main product image")
+    stock: Optional[int] = Field(None, description="Units in stock")
+    features: Optional[str] = Field(None, description="Comma-separated list of features")
+
+    class Config:
+        from_attributes = True
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "name": "Submariner Date",
+                "brand": "Rolex",
+                "category": "Dive",
+                "price": 9950.0,
+                "description": "The Rolex Submariner Date is a reference among diving watches.",
+                "image_url": "https://example.com/submariner.jpg",
+                "stock": 10,
+                "features": "Automatic movement, Sapphire crystal"
+            }
+        }
+
+
+class ProductPageResponse(BaseModel):
+    """Response model for one keyset-paginated page of products."""
+    items: List[ProductResponse] = Field(default_factory=list, description="Products on this page")
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page; null on the last page")
+    sort: str = Field(..., description="Sort order of the listing")
+
+
+class PriceRangeResponse(BaseModel):
+    """A price band usable as min_price/max_price filter."""
+    key: str
+    label: str
+    min_price: float
+    max_price: float
+    count: int = Field(..., description="Number of products in the band")
+
+
+class FacetValueResponse(BaseModel):
+    """A facet value with its live product count."""
+    value: str
+    count: int
+    selected: bool = False
+
+
+class SearchResponse(BaseModel):
+    """Response model for a faceted catalog search."""
+    total: int = Field(..., description="Number of products matching the selection")
+    items: List[ProductResponse] = Field(default_factory=list, description="The requested page of products")
+    facets: Dict[str, List[FacetValueResponse]] = Field(default_factory=dict, description="Counts per facet value")
+
+
+class SuggestionResponse(BaseModel):
+    """A typeahead suggestion."""
+    id: int
+    name: str
+    brand: str
+
+
+class ProductImportRow(BaseModel):
+    """One product row of a catalog import feed (CSV or JSONL).
+
+    Rows with an id update that product. Rows without one update the product
+    with the same brand and name, or are inserted if there is none.
+    """
+    id: Optional[int] = Field(None, gt=0, description="Existing product id to update")
+    name: str = Field(..., min_length=1, max_length=100)
+    brand: str = Field(..., min_length=1, max_length=50)
+    category: str = Field(..., min_length=1, max_length=50)
+    price: float = Field(..., ge=0)
+    description: str = Field("", description="Product description")
+    image_url: str = Field(..., min_length=1, max_length=255)
+    stock: Optional[int] = Field(None, ge=0, description="Units in stock; kept as is on update when omitted")
+    features: Optional[str] = Field(None, description="Comma-separated features (JSONL may use a list)")
+
+    @field_validator("id", "stock", "features", mode="before")
+    @classmethod
+    def _blank_to_none(cls, value):
+        # CSV has no nulls; empty cells mean "not given"
+        return None if value == "" else value
+
+    @field_validator("features", mode="before")
+    @classmethod
+    def _join_features(cls, value):
+        if isinstance(value, (list, tuple)):
+            return ", ".join(str(feature).strip() for feature in value)
+        return value
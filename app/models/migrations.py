@@ -0,0 +1,259 @@
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, delete, inspect, or_, select, update,
+)
+from sqlalchemy.engine import Connection
+
+from app.core.logging import app_logger
+from app.core.migrations import Migration
+
+# Migrations describe the schema as it was at each version, so they must not
+# import the ORM models (which always reflect the latest schema).
+
+
+def _create_products(connection: Connection) -> None:
+    metadata = MetaData()
+    Table(
+        "products",
+        metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("name", String(100), nullable=False),
+        Column("brand", String(50), nullable=False),
+        Column("category", String(50), nullable=False),
+        Column("price", Float, nullable=False),
+        Column("description", Text, nullable=False),
+        Column("image_url", String(255), nullable=False),
+        Column("stock", Integer),
+        Column("features", Text, nullable=True),
+    )
+    # checkfirst keeps databases created by the old create_all() call intact
+    metadata.create_all(connection, checkfirst=True)
+
+
+def _index_products(connection: Connection) -> None:
+    products = Table("products", MetaData(), autoload_with=connection)
+    indexes = [
+        ("ix_products_category", ["category"]),
+        ("ix_products_brand", ["brand"]),
+        ("ix_products_price", ["price"]),
+        ("ix_products_category_price", ["category", "price"]),
+        ("ix_products_brand_price", ["brand", "price"]),
+    ]
+    for name, columns in indexes:
+        Index(name, *[products.c[column] for column in columns]).create(connection, checkfirst=True)
+
+
+def _create_products_fts(connection: Connection) -> None:
+    # External-content FTS5 index over the searchable product columns, kept in
+    # sync by triggers. The prefix indexes make typeahead queries cheap.
+    if connection.dialect.name != "sqlite":
+        app_logger.warning("Skipping products_fts: full-text search requires SQLite FTS5")
+        return
+    columns = "name, brand, category, description, features"
+    new_values = "new.name, new.brand, new.category, new.description, new.features"
+    old_values = "old.name, old.brand, old.category, old.description, old.features"
+    statements = [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            {columns},
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF {columns} ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO products_fts(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+        "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def _create_related_products(connection: Connection) -> None:
+    metadata = MetaData()
+    Table("products", metadata, autoload_with=connection)
+    Table(
+        "related_products",
+        metadata,
+        Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True),
+        Column("related_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True),
+        Column("rank", Integer, nullable=False),
+        Column("score", Float, nullable=False),
+        Index("ix_related_products_product_rank", "product_id", "rank"),
+        Index("ix_related_products_related_id", "related_id"),
+    )
+    metadata.create_all(connection, tables=[metadata.tables["related_products"]], checkfirst=True)
+
+
+def _normalize_features(connection: Connection) -> None:
+    metadata = MetaData()
+    products = Table("products", metadata, autoload_with=connection)
+    features = Table(
+        "features",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String(100), nullable=False, unique=True),
+    )
+    product_features = Table(
+        "product_features",
+        metadata,
+        Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True),
+        Column("feature_id", Integer, ForeignKey("features.id", ondelete="CASCADE"), primary_key=True),
+        Index("ix_product_features_feature_id", "feature_id", "product_id"),
+    )
+    metadata.create_all(connection, tables=[features, product_features], checkfirst=True)
+
+    # Backfill from the comma-joined column
+    product_names = {}
+    for product_id, value in connection.execute(select(products.c.id, products.c.features)):
+        product_names[product_id] = {name.strip() for name in (value or "").split(",") if name.strip()}
+    names = sorted(set().union(*product_names.values())) if product_names else []
+    if not names:
+        return
+    connection.execute(features.insert(), [{"name": name} for name in names])
+    ids = dict(connection.execute(select(features.c.name, features.c.id)).all())
+    connection.execute(product_features.insert(), [
+        {"product_id": product_id, "feature_id": ids[name]}
+        for product_id, feature_names in product_names.items()
+        for name in feature_names
+    ])
+
+
+def _add_image_hash(connection: Connection) -> None:
+    columns = {column["name"] for column in inspect(connection).get_columns("products")}
+    if "image_hash" not in columns:
+        connection.exec_driver_sql("ALTER TABLE products ADD COLUMN image_hash VARCHAR(16)")
+
+
+def _add_image_placeholder(connection: Connection) -> None:
+    columns = {column["name"] for column in inspect(connection).get_columns("products")}
+    if "image_placeholder" not in columns:
+        connection.exec_driver_sql("ALTER TABLE products ADD COLUMN image_placeholder TEXT")
+
+
+def _create_orders(connection: Connection) -> None:
+    metadata = MetaData()
+    Table("products", metadata, autoload_with=connection)
+    orders = Table(
+        "orders",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("order_number", String(20), nullable=False, unique=True),
+        Column("idempotency_key", String(64), nullable=True, unique=True),
+        Column("customer_id", String(64), nullable=True),
+        Column("status", String(20), nullable=False),
+        Column("subtotal_cents", Integer, nullable=False),
+        Column("shipping_cents", Integer, nullable=False),
+        Column("tax_cents", Integer, nullable=False),
+        Column("total_cents", Integer, nullable=False),
+        Column("created_at", DateTime, nullable=False),
+        Index("ix_orders_customer_id", "customer_id"),
+    )
+    order_lines = Table(
+        "order_lines",
+        metadata,
+        Column("order_id", Integer, ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True),
+        Column("product_id", Integer, ForeignKey("products.id"), primary_key=True),
+        Column("quantity", Integer, nullable=False),
+        Column("unit_price_cents", Integer, nullable=False),
+        Index("ix_order_lines_product_id", "product_id"),
+    )
+    metadata.create_all(connection, tables=[orders, order_lines], checkfirst=True)
+
+
+def _create_catalog_state(connection: Connection) -> None:
+    metadata = MetaData()
+    catalog_state = Table(
+        "catalog_state",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("revision", Integer, nullable=False),
+        Column("related_revision", Integer, nullable=True),
+    )
+    metadata.create_all(connection, tables=[catalog_state], checkfirst=True)
+    if connection.execute(select(catalog_state.c.id)).first() is None:
+        # Existing related lists match the existing catalog
+        connection.execute(catalog_state.insert().values(id=1, revision=0, related_revision=0))
+
+
+def _create_reservations(connection: Connection) -> None:
+    metadata = MetaData()
+    Table("products", metadata, autoload_with=connection)
+    reservations = Table(
+        "reservations",
+        metadata,
+        Column("holder", String(64), primary_key=True),
+        Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True),
+        Column("quantity", Integer, nullable=False),
+        Column("expires_at", Float, nullable=False),
+        Index("ix_reservations_product_id", "product_id", "expires_at"),
+        Index("ix_reservations_expires_at", "expires_at"),
+    )
+    metadata.create_all(connection, tables=[reservations], checkfirst=True)
+
+
+def _unique_brand_name(connection: Connection) -> None:
+    # Imports without ids used to insert a new row on every run; merge those
+    # duplicates into the oldest row before (brand, name) becomes unique
+    metadata = MetaData()
+    products = Table("products", metadata, autoload_with=connection)
+    order_lines = Table("order_lines", metadata, autoload_with=connection)
+    dependents = [
+        Table(name, metadata, autoload_with=connection)
+        for name in ("related_products", "product_features", "reservations")
+    ]
+    kept = {}
+    duplicates = {}
+    rows = connection.execute(select(products.c.id, products.c.brand, products.c.name).order_by(products.c.id))
+    for product_id, brand, name in rows:
+        keep = kept.setdefault((brand, name), product_id)
+        if keep != product_id:
+            duplicates[product_id] = keep
+    for duplicate, keep in duplicates.items():
+        # Order history moves to the kept row; an order holding both rows gets one line
+        for order_id, quantity in connection.execute(
+            select(order_lines.c.order_id, order_lines.c.quantity).where(order_lines.c.product_id == duplicate)
+        ).all():
+            line = order_lines.c.order_id == order_id
+            merged = connection.execute(
+                update(order_lines)
+                .where(line, order_lines.c.product_id == keep)
+                .values(quantity=order_lines.c.quantity + quantity)
+            ).rowcount
+            if merged:
+                connection.execute(delete(order_lines).where(line, order_lines.c.product_id == duplicate))
+            else:
+                connection.execute(
+                    update(order_lines).where(line, order_lines.c.product_id == duplicate).values(product_id=keep)
+                )
+    ids = list(duplicates)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        for table in dependents:
+            condition = table.c.product_id.in_(chunk)
+            if "related_id" in table.c:
+                condition = or_(condition, table.c.related_id.in_(chunk))
+            connection.execute(delete(table).where(condition))
+        connection.execute(delete(products).where(products.c.id.in_(chunk)))
+    if duplicates:
+        app_logger.warning(f"Merged {len(duplicates)} duplicate products into the oldest of each brand and name")
+    Index("ix_products_brand_name", products.c.brand, products.c.name, unique=True).create(connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    Migration(1, "Create products table", _create_products),
+    Migration(2, "Index products by category, brand and price", _index_products),
+    Migration(3, "Add FTS5 full-text index over products", _create_products_fts),
+    Migration(4, "Create related_products table", _create_related_products),
+    Migration(5, "Normalize product features into features and product_features", _normalize_features),
+    Migration(6, "Add products.image_hash for locally served image variants", _add_image_hash),
+    Migration(7, "Add products.image_placeholder for inline LQIP placeholders", _add_image_placeholder),
+    Migration(8, "Create orders and order_lines tables", _create_orders),
+    Migration(9, "Create catalog_state table for cross-process catalog reloads", _create_catalog_state),
+    Migration(10, "Create reservations table for stock holds shared across servers", _create_reservations),
+    Migration(11, "Make (brand, name) the natural key of products", _unique_brand_name),
+]
@@ -0,0 +1,61 @@
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, String
+
+from app.core.database import Base
+
+
+class Order(Base):
+    """SQLAlchemy model for a placed order; amounts are integer cents.
+
+    The schema is managed by app.models.migrations. Orders are written by
+    app.services.orders, which decrements stock in the same transaction.
+    """
+    __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_customer_id", "customer_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    order_number = Column(String(20), nullable=False, unique=True)
+    # Client-chosen key; retrying a placement with it returns the same order
+    idempotency_key = Column(String(64), nullable=True, unique=True)
+    # Browser storage id of the customer
+    customer_id = Column(String(64), nullable=True)
+    status = Column(String(20), nullable=False)
+    subtotal_cents = Column(Integer, nullable=False)
+    shipping_cents = Column(Integer, nullable=False)
+    tax_cents = Column(Integer, nullable=False)
+    total_cents = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+class OrderLine(Base):
+    """One product of an order, priced as it was when the order was placed."""
+    __tablename__ = "order_lines"
+    __table_args__ = (
+        Index("ix_order_lines_product_id", "product_id"),
+    )
+
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+    unit_price_cents = Column(Integer, nullable=False)
+
+
+class Reservation(Base):
+    """Units of a product held by a cart, maintained by app.services.reservations.
+
+    Holds past expires_at no longer count against stock; the sweeper deletes
+    them by the expires_at index.
+    """
+    __tablename__ = "reservations"
+    __table_args__ = (
+        Index("ix_reservations_product_id", "product_id", "expires_at"),
+        Index("ix_reservations_expires_at", "expires_at"),
+    )
+
+    # Browser storage id of the cart
+    holder = Column(String(64), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+    # Unix time; shared by every app server, unlike a monotonic clock
+    expires_at = Column(Float, nullable=False)
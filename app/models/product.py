@@ -0,0 +1,80 @@
+from sqlalchemy import Column, Integer, String, Float, Text, Index, ForeignKey
+
+from app.core.database import Base
+
+
+class Product(Base):
+    """SQLAlchemy model for a watch in the catalog.
+
+    The schema is managed by app.models.migrations; keep the indexes declared
+    here in sync with the latest migration.
+    """
+    __tablename__ = "products"
+    __table_args__ = (
+        # Listing pages filter on category/brand and sort or range on price
+        Index("ix_products_category_price", "category", "price"),
+        Index("ix_products_brand_price", "brand", "price"),
+        # Natural key of feed rows without an id; imports upsert on it
+        Index("ix_products_brand_name", "brand", "name", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    brand = Column(String(50), nullable=False, index=True)
+    category = Column(String(50), nullable=False, index=True)
+    price = Column(Float, nullable=False, index=True)
+    description = Column(Text, nullable=False)
+    image_url = Column(String(255), nullable=False)
+    stock = Column(Integer, default=10)
+    features = Column(Text, nullable=True)
+    # Content hash of the ingested image; variants live in app/static/products
+    image_hash = Column(String(16), nullable=True)
+    # Tiny inline data URI shown while the image loads
+    image_placeholder = Column(Text, nullable=True)
+
+
+class RelatedProduct(Base):
+    """Precomputed "you may also like" entry, maintained by app.services.related."""
+    __tablename__ = "related_products"
+    __table_args__ = (
+        Index("ix_related_products_product_rank", "product_id", "rank"),
+        Index("ix_related_products_related_id", "related_id"),
+    )
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    related_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+
+
+class CatalogState(Base):
+    """Single row tracking catalog data across processes.
+
+    revision is bumped by every bulk import, so running servers notice
+    writes from other processes; related_revision is the revision the
+    related_products table was last rebuilt for.
+    """
+    __tablename__ = "catalog_state"
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False, default=0)
+    related_revision = Column(Integer, nullable=True)
+
+
+class Feature(Base):
+    """Normalized feature name, e.g. "Sapphire crystal"."""
+    __tablename__ = "features"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False, unique=True)
+
+
+class ProductFeature(Base):
+    """Join table derived from Product.features, kept in sync on flush."""
+    __tablename__ = "product_features"
+    __table_args__ = (
+        Index("ix_product_features_feature_id", "feature_id", "product_id"),
+    )
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    feature_id = Column(Integer, ForeignKey("features.id", ondelete="CASCADE"), primary_key=True)
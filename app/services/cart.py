@@ -0,0 +1,245 @@
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.exceptions import ValidationError
+from app.core.logging import app_logger
+
+# Order pricing, in integer cents
+FREE_SHIPPING_THRESHOLD_CENTS = 50000
+SHIPPING_CENTS = 2500
+TAX_RATE_PERCENT = 8
+
+# Carts kept decoded in memory, least recently used evicted first
+CART_CACHE_SIZE = 10000
+
+
+def to_cents(amount: float) -> int:
+    """Convert a dollar amount to integer cents, rounding half up."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents: int) -> str:
+    sign = "-" if cents < 0 else ""
+    dollars, remainder = divmod(abs(cents), 100)
+    return f"{sign}${dollars:,}.{remainder:02d}"
+
+
+@dataclass
+class CartLine:
+    """One product in a cart, priced as it was when added."""
+    product_id: int
+    quantity: int
+    unit_price_cents: int
+
+    @property
+    def total_cents(self) -> int:
+        return self.quantity * self.unit_price_cents
+
+
+class Cart:
+    """Shopping cart keyed by product id.
+
+    Lines keep insertion order. The item count and subtotal are maintained on
+    every change, so lookups, single-line updates and totals are O(1) and
+    amounts never drift.
+    """
+    def __init__(self, lines: Iterable[CartLine] = ()):
+        self._lines: Dict[int, CartLine] = {}
+        self._item_count = 0
+        self._subtotal_cents = 0
+        for line in lines:
+            self.add(line.product_id, line.unit_price_cents, line.quantity)
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __iter__(self) -> Iterator[CartLine]:
+        return iter(list(self._lines.values()))
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._lines
+
+    def get(self, product_id: int) -> Optional[CartLine]:
+        return self._lines.get(product_id)
+
+    @property
+    def item_count(self) -> int:
+        return self._item_count
+
+    @property
+    def subtotal_cents(self) -> int:
+        return self._subtotal_cents
+
+    def _adjust(self, line: CartLine, sign: int) -> None:
+        self._item_count += sign * line.quantity
+        self._subtotal_cents += sign * line.total_cents
+
+    def add(self, product_id: int, unit_price_cents: int, quantity: int = 1) -> CartLine:
+        """Add units of a product; an existing line is repriced at the new price.
+
+        Raises:
+            ValidationError: If the quantity is not positive
+        """
+        if quantity <= 0:
+            raise ValidationError(detail=f"Quantity must be positive, got {quantity}")
+        line = self._lines.get(product_id)
+        if line is None:
+            line = self._lines[product_id] = CartLine(product_id, 0, unit_price_cents)
+        self._adjust(line, -1)
+        line.quantity += quantity
+        line.unit_price_cents = unit_price_cents
+        self._adjust(line, 1)
+        return line
+
+    def add_many(self, items: Iterable[Tuple[int, int, int]]) -> None:
+        """Add several products, given as (product_id, unit_price_cents, quantity)."""
+        for product_id, unit_price_cents, quantity in items:
+            self.add(product_id, unit_price_cents, quantity)
+
+    def merge(self, other: "Cart") -> None:
+        """Add every line of another cart, e.g. a guest cart on login."""
+        self.add_many((line.product_id, line.unit_price_cents, line.quantity) for line in other)
+
+    def set_quantity(self, product_id: int, quantity: int) -> bool:
+        """Set the quantity of a line, removing it when quantity <= 0.
+
+        Returns:
+            False if the product is not in the cart
+        """
+        if quantity <= 0:
+            return self.remove(product_id)
+        line = self._lines.get(product_id)
+        if line is None:
+            return False
+        self._adjust(line, -1)
+        line.quantity = quantity
+        self._adjust(line, 1)
+        return True
+
+    def remove(self, product_id: int) -> bool:
+        line = self._lines.pop(product_id, None)
+        if line is None:
+            return False
+        self._adjust(line, -1)
+        return True
+
+    def clear(self) -> None:
+        self._lines.clear()
+        self._item_count = 0
+        self._subtotal_cents = 0
+
+    def to_storage(self) -> List[List[int]]:
+        """Compact JSON-serializable form: [[product_id, quantity, unit_price_cents], ...]."""
+        return [[line.product_id, line.quantity, line.unit_price_cents] for line in self._lines.values()]
+
+    @classmethod
+    def from_storage(cls, data: Any) -> "Cart":
+        """Decode to_storage() output; also reads the legacy list-of-dicts format."""
+        cart = cls()
+        for entry in data or ():
+            try:
+                if isinstance(entry, dict):
+                    cart.add(int(entry["id"]), to_cents(entry["price"]), int(entry["quantity"]))
+                else:
+                    product_id, quantity, unit_price_cents = entry
+                    cart.add(int(product_id), int(unit_price_cents), int(quantity))
+            except (KeyError, TypeError, ValueError, ValidationError) as e:
+                app_logger.warning(f"Dropping unreadable cart entry {entry!r}: {e}")
+        return cart
+
+
+@dataclass(frozen=True)
+class CartTotals:
+    subtotal_cents: int
+    shipping_cents: int
+    tax_cents: int
+
+    @property
+    def total_cents(self) -> int:
+        return self.subtotal_cents + self.shipping_cents + self.tax_cents
+
+
+def cart_totals(cart: Cart) -> CartTotals:
+    """Shipping and tax for a cart, in exact integer cents."""
+    subtotal = cart.subtotal_cents
+    shipping = 0 if subtotal >= FREE_SHIPPING_THRESHOLD_CENTS else SHIPPING_CENTS
+    tax = (subtotal * TAX_RATE_PERCENT + 50) // 100
+    return CartTotals(subtotal_cents=subtotal, shipping_cents=shipping, tax_cents=tax)
+
+
+class CartCache:
+    """Decoded carts by storage id, so helpers do not re-parse stored carts.
+
+    Only valid while this process is the only writer of the carts, i.e. with
+    a store that is not shared (see CartStore.shared).
+    """
+    def __init__(self, max_size: int = CART_CACHE_SIZE):
+        self.max_size = max_size
+        self._carts: "OrderedDict[str, Cart]" = OrderedDict()
+
+    def get(self, storage_id: str, load: Callable[[], Any]) -> Cart:
+        """Return the cart of a user, decoding load() on a miss."""
+        cart = self._carts.get(storage_id)
+        if cart is None:
+            cart = self._carts[storage_id] = Cart.from_storage(load())
+            if len(self._carts) > self.max_size:
+                self._carts.popitem(last=False)
+        else:
+            self._carts.move_to_end(storage_id)
+        return cart
+
+
+cart_cache = CartCache()
+
+
+# Cart change notifications. Subscribers are keyed by the browser storage id
+# that app.storage.user is keyed by, so a change made in one tab reaches every
+# tab of the same user, and nobody else. Subscribers live in this process; with
+# a shared cart store, changes reach the other app servers through the store
+# (see app.services.cart_store).
+CartSubscriber = Callable[[int], None]
+
+_subscribers: Dict[str, List[CartSubscriber]] = defaultdict(list)
+
+
+def subscribe_cart(storage_id: str, callback: CartSubscriber) -> Callable[[], None]:
+    """Register a callback for changes to one user's cart.
+
+    Args:
+        storage_id: Browser storage id of the user
+        callback: Called with the new number of items in the cart
+
+    Returns:
+        A function that removes the subscription
+    """
+    _subscribers[storage_id].append(callback)
+
+    def unsubscribe() -> None:
+        callbacks = _subscribers.get(storage_id)
+        if callbacks is None:
+            return
+        try:
+            callbacks.remove(callback)
+        except ValueError:
+            pass
+        if not callbacks:
+            del _subscribers[storage_id]
+
+    return unsubscribe
+
+
+def publish_cart_changed(storage_id: str, item_count: int) -> None:
+    """Notify every subscriber of a user's cart that it changed."""
+    # Copy, so callbacks may unsubscribe while being notified
+    for callback in list(_subscribers.get(storage_id, ())):
+        try:
+            callback(item_count)
+        except Exception as e:
+            app_logger.error(f"Cart subscriber {callback.__name__} failed: {e}")
+
+
+def subscriber_count() -> int:
+    """Number of live cart subscriptions, across all users."""
+    return sum(len(callbacks) for callbacks in _subscribers.values())
@@ -0,0 +1,371 @@
+"""Cart persistence.
+
+Carts are stored under the browser storage id in a CartStore backend (SQLite
+in WAL mode, or Redis). Writes go through a CoalescingCartWriter, which keeps
+only the latest state of each cart and writes all dirty carts in one batch
+after a short delay, so a burst of clicks costs one write instead of one per
+click. Redis is shared by every app server and is written through instead.
+
+Cart change notifications (the cart badge of every open tab) are delivered
+in-process by app.services.cart. With Redis, the tabs of one user may be
+served by different app servers, so changes are published on the Redis
+channel cart:<storage id> instead, and every server delivers the messages
+for the tabs it serves.
+"""
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from app.core.config import settings
+from app.core.exceptions import ConfigurationError, DatabaseError
+from app.core.logging import app_logger
+
+# Redis is only needed for the redis backend
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+# Stored carts: the compact form of Cart.to_storage(); None deletes the cart
+StoredCart = Optional[List[List[int]]]
+
+# Receives the storage id and new item count of a changed cart
+CartListener = Callable[[str, int], None]
+
+REDIS_KEY_PREFIX = "cart:"
+# Abandoned carts expire from Redis after this many seconds
+REDIS_CART_TTL = 30 * 24 * 3600
+
+
+def _encode(data: List[List[int]]) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+@dataclass
+class CartStoreStats:
+    """Physical writes issued by a store."""
+    writes: int = 0
+    rows: int = 0
+    bytes: int = 0
+
+
+class CartStore(ABC):
+    """Backend holding carts by browser storage id.
+
+    Attributes:
+        shared: Whether other processes or machines write the same carts. A
+            shared store is the only up-to-date copy of a cart, so readers
+            must not keep carts in memory between requests.
+    """
+    name = "store"
+    shared = False
+
+    def __init__(self):
+        self.stats = CartStoreStats()
+
+    @abstractmethod
+    def load(self, storage_id: str) -> StoredCart:
+        """Return the stored cart, or None if there is none."""
+
+    @abstractmethod
+    def _write(self, carts: Mapping[str, StoredCart], encoded: Mapping[str, str]) -> None:
+        ...
+
+    def write_many(self, carts: Mapping[str, StoredCart]) -> None:
+        """Write several carts in one transaction or round trip.
+
+        Raises:
+            DatabaseError: If the backend rejects the write
+        """
+        if not carts:
+            return
+        encoded = {storage_id: _encode(data) for storage_id, data in carts.items() if data is not None}
+        self._write(carts, encoded)
+        self.stats.writes += 1
+        self.stats.rows += len(carts)
+        self.stats.bytes += sum(len(value) for value in encoded.values())
+
+    def publish(self, storage_id: str, item_count: int) -> bool:
+        """Announce a cart change to every app server sharing the store.
+
+        Returns:
+            Whether the change was published; if not, the caller notifies
+            the subscribers of this process itself
+        """
+        return False
+
+    def listen(self, listener: CartListener) -> None:
+        """Call listener for every change published by any app server.
+
+        Listeners run on a background thread.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteCartStore(CartStore):
+    """Carts in a SQLite file in WAL mode.
+
+    A batch is one transaction: a few appended WAL pages and one fsync at
+    checkpoint time, instead of one file rewrite per cart change.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # WAL stays consistent without an fsync per commit
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS carts ("
+            "storage_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def load(self, storage_id: str) -> StoredCart:
+        with self._lock:
+            row = self._connection.execute("SELECT data FROM carts WHERE storage_id = ?", (storage_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, carts: Mapping[str, StoredCart], encoded: Mapping[str, str]) -> None:
+        now = time.time()
+        deleted = [(storage_id,) for storage_id, data in carts.items() if data is None]
+        with self._lock:
+            try:
+                self._connection.execute("BEGIN")
+                self._connection.executemany(
+                    "INSERT INTO carts (storage_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(storage_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    [(storage_id, value, now) for storage_id, value in encoded.items()],
+                )
+                self._connection.executemany("DELETE FROM carts WHERE storage_id = ?", deleted)
+                self._connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._connection.in_transaction:
+                    self._connection.execute("ROLLBACK")
+                raise DatabaseError(detail=f"Could not write carts: {e}") from e
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class RedisCartStore(CartStore):
+    """Carts as Redis strings under cart:<storage id>; a batch is one pipeline."""
+    name = "redis"
+    # Every app server of a deployment shares the same Redis
+    shared = True
+
+    def __init__(self, url: Optional[str] = None, client: Any = None):
+        """
+        Args:
+            url: Redis URL, e.g. redis://localhost:6379/0
+            client: A ready redis.Redis-compatible client, used instead of url
+
+        Raises:
+            ConfigurationError: If neither is usable
+        """
+        super().__init__()
+        if client is None:
+            if redis is None:
+                raise ConfigurationError(detail="The redis package is required for CART_STORE=redis")
+            if not url:
+                raise ConfigurationError(detail="REDIS_URL is required for CART_STORE=redis")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._listener_thread = None
+
+    def load(self, storage_id: str) -> StoredCart:
+        value = self._client.get(REDIS_KEY_PREFIX + storage_id)
+        return json.loads(value) if value is not None else None
+
+    def _write(self, carts: Mapping[str, StoredCart], encoded: Mapping[str, str]) -> None:
+        pipeline = self._client.pipeline(transaction=False)
+        for storage_id in carts:
+            if storage_id in encoded:
+                pipeline.set(REDIS_KEY_PREFIX + storage_id, encoded[storage_id], ex=REDIS_CART_TTL)
+            else:
+                pipeline.delete(REDIS_KEY_PREFIX + storage_id)
+        try:
+            pipeline.execute()
+        except Exception as e:
+            raise DatabaseError(detail=f"Could not write carts: {e}") from e
+
+    def publish(self, storage_id: str, item_count: int) -> bool:
+        try:
+            self._client.publish(REDIS_KEY_PREFIX + storage_id, item_count)
+        except Exception as e:
+            app_logger.error(f"Could not publish cart change: {e}")
+            return False
+        return True
+
+    def listen(self, listener: CartListener) -> None:
+        # One pattern subscription per server: every server hears every cart
+        # change and drops those without tabs on it, which keeps the
+        # subscription independent of the tabs that come and go
+        def handle(message) -> None:
+            channel = message["channel"]
+            channel = channel.decode() if isinstance(channel, bytes) else channel
+            listener(channel[len(REDIS_KEY_PREFIX):], int(message["data"]))
+
+        def log_error(error, pubsub, thread) -> None:
+            # The worker keeps polling, which reconnects and resubscribes
+            app_logger.error(f"Cart change subscription failed: {error}")
+            time.sleep(1.0)
+
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(**{REDIS_KEY_PREFIX + "*": handle})
+        self._listener_thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=log_error)
+
+    def close(self) -> None:
+        if self._listener_thread is not None:
+            self._listener_thread.stop()
+            self._listener_thread = None
+        self._client.close()
+
+
+class CoalescingCartWriter:
+    """Write-behind buffer in front of a CartStore.
+
+    save() only records the latest state of a cart. A background thread
+    writes every dirty cart in one batch once `delay` seconds have passed
+    since the first unsaved change, so the number of writes depends on
+    the number of bursts, not the number of clicks.
+
+    With delay=0, save() writes through to the store and raises if the
+    write fails. Shared stores always run this way: a buffered cart would be
+    invisible to other servers until flushed, and whichever server flushed
+    last would overwrite the whole cart.
+    """
+    def __init__(self, store: CartStore, delay: float):
+        self.store = store
+        self.delay = delay
+        self.mutations = 0
+        self._pending: Dict[str, StoredCart] = {}
+        # The batch being written, still served to readers until it is stored
+        self._writing: Dict[str, StoredCart] = {}
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def load(self, storage_id: str) -> StoredCart:
+        """Return a cart, including changes that are not written yet."""
+        with self._condition:
+            for buffer in (self._pending, self._writing):
+                if storage_id in buffer:
+                    return buffer[storage_id]
+        return self.store.load(storage_id)
+
+    def save(self, storage_id: str, data: StoredCart) -> None:
+        """Record the new state of a cart (None deletes it).
+
+        Raises:
+            DatabaseError: If the writer is closed, or a write-through fails
+        """
+        with self._condition:
+            if self._closed:
+                raise DatabaseError(detail="Cart writer is closed")
+            self.mutations += 1
+            if self.delay > 0:
+                self._pending[storage_id] = data
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="cart-writer", daemon=True)
+                    self._thread.start()
+                self._condition.notify()
+                return
+        # Not queued for a retry: a later retry could overwrite newer changes
+        self.store.write_many({storage_id: data})
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+            # Let the rest of the burst arrive before writing
+            time.sleep(self.delay)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all pending carts now."""
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending = self._pending, {}
+                self._writing = batch
+            if not batch:
+                return
+            try:
+                self.store.write_many(batch)
+            except DatabaseError as e:
+                app_logger.error(f"{e.detail}; retrying {len(batch)} carts")
+                with self._condition:
+                    for storage_id, data in batch.items():
+                        # Newer changes win over the failed batch
+                        self._pending.setdefault(storage_id, data)
+            finally:
+                with self._condition:
+                    self._writing = {}
+
+    def close(self) -> None:
+        """Stop the background thread, write what is pending and close the store."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self.store.close()
+
+
+def create_cart_store(backend: Optional[str] = None) -> CartStore:
+    """Create the configured cart store backend.
+
+    Raises:
+        ConfigurationError: If the backend is unknown or not usable
+    """
+    backend = backend or settings.cart_store
+    if backend == "sqlite":
+        return SQLiteCartStore(settings.cart_store_path)
+    if backend == "redis":
+        return RedisCartStore(settings.redis_url)
+    raise ConfigurationError(detail=f"Unknown cart store: {backend}")
+
+
+_writer: Optional[CoalescingCartWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_cart_writer() -> CoalescingCartWriter:
+    """Return the process-wide cart writer, opening the store on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                store = create_cart_store()
+                # Other servers read a shared store directly, so it is written through
+                delay = 0.0 if store.shared else settings.cart_write_delay
+                app_logger.info(
+                    f"Cart store: {store.name}, "
+                    + (f"writes coalesced over {delay}s" if delay else "writes sent immediately")
+                )
+                _writer = CoalescingCartWriter(store, delay)
+    return _writer
+
+
+def close_cart_writer() -> None:
+    """Write pending carts and close the store (call on shutdown)."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
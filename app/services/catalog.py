@@ -0,0 +1,970 @@
+import asyncio
+import base64
+import binascii
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, replace
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import create_engine, delete, event, insert, inspect, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal, get_async_db_context, get_db_context
+from app.core.exceptions import ValidationError
+from app.core.logging import app_logger
+from app.core.migrations import migrate
+from app.core.query_plan import check_query_plans
+from app.models.migrations import MIGRATIONS
+from app.models.product import CatalogState, Feature, Product, ProductFeature, RelatedProduct
+
+
+def split_features(features: Optional[str]) -> List[str]:
+    """Split the comma-joined features column into individual features."""
+    if not features:
+        return []
+    return [feature.strip() for feature in features.split(",") if feature.strip()]
+
+
+class FeatureDictionary:
+    """Append-only mapping of feature names to bit positions.
+
+    Bits are never reassigned, so feature masks stay comparable across
+    catalog snapshots for the life of the process.
+    """
+    def __init__(self):
+        self._bits: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._bits)
+
+    def bit(self, name: str) -> int:
+        """Return the bit for a feature, assigning the next free one if new."""
+        bit = self._bits.get(name)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.setdefault(name, len(self._bits))
+        return bit
+
+    def names(self) -> List[str]:
+        """All registered feature names, in bit order."""
+        return list(self._bits)
+
+    def mask(self, names: Iterable[str]) -> Optional[int]:
+        """Mask with the bits of all given features set.
+
+        Returns:
+            The mask, or None if a feature is unknown (no product can match)
+        """
+        mask = 0
+        for name in names:
+            bit = self._bits.get(name)
+            if bit is None:
+                return None
+            mask |= 1 << bit
+        return mask
+
+    def encode(self, names: Iterable[str]) -> int:
+        """Mask for a product's features, registering new ones."""
+        mask = 0
+        for name in names:
+            mask |= 1 << self.bit(name)
+        return mask
+
+
+# Process-wide feature dictionary shared by every snapshot
+feature_dictionary = FeatureDictionary()
+
+
+@dataclass(frozen=True)
+class CatalogProduct:
+    """Immutable, session-independent copy of a Product row.
+
+    ``feature_list`` holds the parsed features and ``feature_mask`` their
+    bits in feature_dictionary, so renders and filters never split strings.
+    """
+    id: int
+    name: str
+    brand: str
+    category: str
+    price: float
+    description: str
+    image_url: str
+    stock: int
+    features: Optional[str]
+    feature_list: Tuple[str, ...] = ()
+    feature_mask: int = 0
+    image_hash: Optional[str] = None
+    image_placeholder: Optional[str] = None
+
+    def has_features(self, mask: int) -> bool:
+        """Whether the product has every feature in the mask."""
+        return self.feature_mask & mask == mask
+
+    @classmethod
+    def from_model(cls, product: Product) -> "CatalogProduct":
+        """Copy the column values of a Product instance."""
+        feature_list = tuple(split_features(product.features))
+        return cls(
+            id=product.id,
+            name=product.name,
+            brand=product.brand,
+            category=product.category,
+            price=product.price,
+            description=product.description,
+            image_url=product.image_url,
+            stock=product.stock,
+            features=product.features,
+            feature_list=feature_list,
+            feature_mask=feature_dictionary.encode(feature_list),
+            image_hash=product.image_hash,
+            image_placeholder=product.image_placeholder,
+        )
+
+
+# Keyset pagination. Listings are ordered by a unique (value, id) key and a
+# cursor encodes the key of the last item shown, so each page costs
+# O(log n + page size) and stays stable while products are added or removed.
+DEFAULT_PAGE_SIZE = 24
+
+# Larger snapshot patches are rebuilt from scratch, which is cheaper than
+# moving each product through every index
+MAX_PATCH_SIZE = 1000
+
+SORT_KEYS: Dict[str, Callable[[CatalogProduct], tuple]] = {
+    "price": lambda p: (p.price, p.id),
+    "name": lambda p: (p.name, p.id),
+}
+
+
+@dataclass(frozen=True)
+class ProductPage:
+    """One page of a keyset-paginated listing."""
+    items: Tuple[CatalogProduct, ...]
+    next_cursor: Optional[str]
+    sort: str
+
+
+def encode_cursor(key: tuple) -> str:
+    """Encode a sort key as an opaque, URL-safe cursor."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_cursor().
+
+    Raises:
+        ValidationError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError) as e:
+        raise ValidationError(detail="Invalid pagination cursor") from e
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[1], int):
+        raise ValidationError(detail="Invalid pagination cursor")
+    return tuple(key)
+
+
+class CatalogSnapshot:
+    """Versioned, read-only view of the catalog with secondary indexes.
+
+    A snapshot is never mutated after construction. Writes produce a new
+    snapshot with a higher version that replaces the current one, so readers
+    always see a consistent catalog without locking.
+
+    version counts snapshots in this process. index_version only changes
+    when something other than stock changes, so indexes and caches that do
+    not show stock (facets, product views, most API bodies) key on it and
+    survive the stock updates of every order. revision is the catalog_state
+    revision of the database the products were loaded from.
+    """
+    def __init__(self, products: Iterable[CatalogProduct], version: int = 1, revision: int = 0):
+        self.version = version
+        self.index_version = version
+        self.revision = revision
+        # (index_version patched from, [(old, new), ...]) when this snapshot's
+        # index_version came from a patch, so derived indexes can follow it
+        self.index_changes: Optional[Tuple[int, List[Tuple[Optional[CatalogProduct], Optional[CatalogProduct]]]]] = None
+
+        # Primary index, ordered by id like the table scan it replaces
+        self.by_id: Dict[int, CatalogProduct] = {p.id: p for p in sorted(products, key=lambda p: p.id)}
+        self.products: Tuple[CatalogProduct, ...] = tuple(self.by_id.values())
+
+        # Hash indexes by category and brand (insertion order follows id order)
+        by_category: Dict[str, List[CatalogProduct]] = {}
+        by_brand: Dict[str, List[CatalogProduct]] = {}
+        for product in self.products:
+            by_category.setdefault(product.category, []).append(product)
+            by_brand.setdefault(product.brand, []).append(product)
+        self.by_category: Dict[str, Tuple[CatalogProduct, ...]] = {k: tuple(v) for k, v in by_category.items()}
+        self.by_brand: Dict[str, Tuple[CatalogProduct, ...]] = {k: tuple(v) for k, v in by_brand.items()}
+
+        # Feature names carried by at least one product, alphabetically
+        self._feature_bits = 0
+        for product in self.products:
+            self._feature_bits |= product.feature_mask
+        self.features: Tuple[str, ...] = _feature_names(self._feature_bits)
+
+        # Sorted price index for range lookups with bisect
+        self.by_price: Tuple[CatalogProduct, ...] = tuple(sorted(self.products, key=_price_key))
+        self._prices: List[float] = [p.price for p in self.by_price]
+
+        # Sorted views for pagination, built lazily per (category, brand, sort).
+        # Safe to cache because the snapshot never changes.
+        self._sorted_views: Dict[tuple, Tuple[Tuple[CatalogProduct, ...], List[tuple]]] = {}
+        # Views of the snapshot this one was patched from, with the batches
+        # of changes still to apply to them on first use
+        self._stale_views: Dict[tuple, Tuple[Tuple[Tuple[CatalogProduct, ...], List[tuple]], List[list]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def price_range(self, min_price: float, max_price: float) -> Tuple[CatalogProduct, ...]:
+        """Return products with min_price <= price <= max_price, cheapest first."""
+        lo = bisect_left(self._prices, min_price)
+        hi = bisect_right(self._prices, max_price)
+        return self.by_price[lo:hi]
+
+    def with_features(self, features: Iterable[str]) -> Tuple[CatalogProduct, ...]:
+        """Return products that have all of the given features, in id order."""
+        mask = feature_dictionary.mask(features)
+        if mask is None:
+            return ()
+        return tuple(p for p in self.products if p.has_features(mask))
+
+    def sorted_view(
+        self,
+        category: Optional[str] = None,
+        brand: Optional[str] = None,
+        sort: str = "price",
+    ) -> Tuple[Tuple[CatalogProduct, ...], List[tuple]]:
+        """Return the products in scope ordered by sort key, with their keys."""
+        view_key = (category, brand, sort)
+        view = self._sorted_views.get(view_key)
+        if view is None and view_key in self._stale_views:
+            view, batches = self._stale_views[view_key]
+            for changes in batches:
+                view = _patched_view(view, changes, category, brand, SORT_KEYS[sort])
+            self._sorted_views[view_key] = view
+        if view is None:
+            if category is not None:
+                products: Iterable[CatalogProduct] = self.by_category.get(category, ())
+            elif brand is not None:
+                products = self.by_brand.get(brand, ())
+            elif sort == "price":
+                products = self.by_price
+            else:
+                products = self.products
+            if category is not None and brand is not None:
+                products = [p for p in products if p.brand == brand]
+            key = SORT_KEYS[sort]
+            ordered = tuple(sorted(products, key=key))
+            view = (ordered, [key(p) for p in ordered])
+            # Scopes come from URLs; only cache the ones that exist
+            if (category is None or category in self.by_category) and (brand is None or brand in self.by_brand):
+                self._sorted_views[view_key] = view
+        return view
+
+    def paginate(
+        self,
+        category: Optional[str] = None,
+        brand: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = "price",
+        cursor: Optional[str] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        features: Iterable[str] = (),
+    ) -> ProductPage:
+        """Return one page of products matching the filters.
+
+        Args:
+            category: Optional category filter
+            brand: Optional brand filter
+            min_price: Optional inclusive lower price bound
+            max_price: Optional inclusive upper price bound
+            sort: Sort order, one of SORT_KEYS
+            cursor: Cursor returned with the previous page
+            limit: Maximum number of products to return
+            features: Features every product must have
+
+        Returns:
+            The page of products and the cursor for the next one
+
+        Raises:
+            ValidationError: If the sort order or cursor is invalid
+        """
+        if sort not in SORT_KEYS:
+            raise ValidationError(detail=f"Unsupported sort order: {sort}")
+        feature_mask = feature_dictionary.mask(features)
+        if feature_mask is None:
+            return ProductPage(items=(), next_cursor=None, sort=sort)
+        products, keys = self.sorted_view(category, brand, sort)
+        lo, hi = 0, len(products)
+        has_price_filter = min_price is not None or max_price is not None
+        if has_price_filter and sort == "price":
+            # Price ranges are contiguous in a price-ordered view
+            if min_price is not None:
+                lo = bisect_left(keys, (min_price,))
+            if max_price is not None:
+                hi = bisect_right(keys, (max_price, float("inf")))
+        if cursor is not None:
+            try:
+                lo = max(lo, bisect_right(keys, decode_cursor(cursor), lo, hi))
+            except TypeError as e:
+                # Cursor from a listing with a different sort order
+                raise ValidationError(detail="Invalid pagination cursor") from e
+
+        items: List[CatalogProduct] = []
+        index = lo
+        while index < hi and len(items) < limit:
+            product = products[index]
+            index += 1
+            if has_price_filter and sort != "price":
+                if (min_price is not None and product.price < min_price) or (max_price is not None and product.price > max_price):
+                    continue
+            if feature_mask and not product.has_features(feature_mask):
+                continue
+            items.append(product)
+
+        next_cursor = None
+        if len(items) == limit and index < hi:
+            next_cursor = encode_cursor(keys[index - 1])
+        return ProductPage(items=tuple(items), next_cursor=next_cursor, sort=sort)
+
+    def patched(
+        self,
+        upserts: Iterable[CatalogProduct] = (),
+        deleted_ids: Iterable[int] = (),
+    ) -> "CatalogSnapshot":
+        """Return a new snapshot with the given products replaced or removed.
+
+        Only the changed products are moved: their category and brand buckets
+        are rebuilt, and they are bisected out of and into the id order, the
+        price index and the cached sorted views. A patch costs a few pointer
+        copies of the catalog instead of re-sorting it; large patches fall
+        back to a full rebuild. Stock-only patches keep index_version.
+
+        Args:
+            upserts: Products to insert or replace
+            deleted_ids: Ids of products to remove
+
+        Returns:
+            A new snapshot with the next version number
+        """
+        new_products: Dict[int, Optional[CatalogProduct]] = {product_id: None for product_id in deleted_ids}
+        new_products.update((product.id, product) for product in upserts)
+        changes = [
+            (self.by_id.get(product_id), product)
+            for product_id, product in new_products.items()
+            if self.by_id.get(product_id) is not product
+        ]
+        stock_only = all(
+            old is not None and new is not None and replace(old, stock=new.stock) == new
+            for old, new in changes
+        )
+        if len(changes) > MAX_PATCH_SIZE:
+            by_id = dict(self.by_id)
+            for product_id, product in new_products.items():
+                if product is None:
+                    by_id.pop(product_id, None)
+                else:
+                    by_id[product_id] = product
+            snapshot = CatalogSnapshot(by_id.values(), self.version + 1, self.revision)
+        else:
+            snapshot = self._patch(changes)
+            snapshot.index_changes = (self.index_version, changes)
+        if stock_only:
+            snapshot.index_version = self.index_version
+            snapshot.index_changes = self.index_changes
+        return snapshot
+
+    def _patch(self, changes: List[Tuple[Optional[CatalogProduct], Optional[CatalogProduct]]]) -> "CatalogSnapshot":
+        snapshot = CatalogSnapshot.__new__(CatalogSnapshot)
+        snapshot.version = self.version + 1
+        snapshot.index_version = snapshot.version
+        snapshot.revision = self.revision
+
+        by_id = dict(self.by_id)
+        products = list(self.products)
+        by_price = list(self.by_price)
+        prices = list(self._prices)
+        in_id_order = True
+        removed_bits = added_bits = 0
+        for old, new in changes:
+            if old is not None:
+                removed_bits |= old.feature_mask
+            if new is not None:
+                added_bits |= new.feature_mask
+            if old is not None and new is not None and _price_key(old) == _price_key(new):
+                by_price[bisect_left(by_price, _price_key(old), key=_price_key)] = new
+            else:
+                if old is not None:
+                    position = bisect_left(by_price, _price_key(old), key=_price_key)
+                    del by_price[position]
+                    del prices[position]
+                if new is not None:
+                    position = bisect_left(by_price, _price_key(new), key=_price_key)
+                    by_price.insert(position, new)
+                    prices.insert(position, new.price)
+
+            product_id = (old or new).id
+            position = bisect_left(products, product_id, key=_product_id)
+            if new is None:
+                del products[position]
+                del by_id[product_id]
+            elif old is None:
+                products.insert(position, new)
+                by_id[product_id] = new
+                # by_id appends, so an id below the highest one breaks id order
+                in_id_order = in_id_order and position == len(products) - 1
+            else:
+                products[position] = new
+                by_id[product_id] = new
+        if not in_id_order:
+            by_id = {p.id: p for p in products}
+        snapshot.by_id = by_id
+        snapshot.products = tuple(products)
+        snapshot.by_price = tuple(by_price)
+        snapshot._prices = prices
+
+        snapshot.by_category = _patched_buckets(self.by_category, changes, attrgetter("category"))
+        snapshot.by_brand = _patched_buckets(self.by_brand, changes, attrgetter("brand"))
+
+        snapshot._feature_bits = self._feature_bits | added_bits
+        lost = removed_bits & ~added_bits
+        while lost:
+            # A feature may have lost its last product; any other one keeps it
+            bit = lost & -lost
+            lost ^= bit
+            if not any(product.feature_mask & bit for product in snapshot.products):
+                snapshot._feature_bits &= ~bit
+        if snapshot._feature_bits == self._feature_bits:
+            snapshot.features = self.features
+        else:
+            snapshot.features = _feature_names(snapshot._feature_bits)
+
+        # Cached views are carried over with the changes in their scope and
+        # only patched when read, so a patch does not pay for every view
+        snapshot._sorted_views = {}
+        snapshot._stale_views = {}
+        # list() copies atomically while readers may be adding views
+        carried = dict(list(self._stale_views.items()))
+        carried.update((view_key, (view, [])) for view_key, view in list(self._sorted_views.items()))
+        for view_key, (view, batches) in carried.items():
+            category, brand, _ = view_key
+            if (category is not None and category not in snapshot.by_category) or (
+                brand is not None and brand not in snapshot.by_brand
+            ):
+                continue
+            in_scope = [
+                (old, new) for old, new in changes
+                if _in_scope(old, category, brand) or _in_scope(new, category, brand)
+            ]
+            if not in_scope and not batches:
+                snapshot._sorted_views[view_key] = view
+            elif not in_scope:
+                snapshot._stale_views[view_key] = (view, batches)
+            elif sum(map(len, batches)) + len(in_scope) <= MAX_PATCH_SIZE:
+                snapshot._stale_views[view_key] = (view, batches + [in_scope])
+        return snapshot
+
+
+def _product_id(product: CatalogProduct) -> int:
+    return product.id
+
+
+def _price_key(product: CatalogProduct) -> Tuple[float, int]:
+    return (product.price, product.id)
+
+
+def _feature_names(bits: int) -> Tuple[str, ...]:
+    """Names of the features whose bits are set, alphabetically."""
+    return tuple(sorted(name for name in feature_dictionary.names() if bits >> feature_dictionary.bit(name) & 1))
+
+
+def _patched_buckets(
+    buckets: Dict[str, Tuple[CatalogProduct, ...]],
+    changes: List[Tuple[Optional[CatalogProduct], Optional[CatalogProduct]]],
+    attribute: Callable[[CatalogProduct], str],
+) -> Dict[str, Tuple[CatalogProduct, ...]]:
+    """Hash index with the changed products moved between their buckets."""
+    touched: Dict[str, List[CatalogProduct]] = {}
+    for pair in changes:
+        for product in pair:
+            if product is not None and attribute(product) not in touched:
+                touched[attribute(product)] = list(buckets.get(attribute(product), ()))
+    for old, _ in changes:
+        if old is not None:
+            bucket = touched[attribute(old)]
+            del bucket[bisect_left(bucket, old.id, key=_product_id)]
+    for _, new in changes:
+        if new is not None:
+            insort(touched[attribute(new)], new, key=_product_id)
+
+    patched = dict(buckets)
+    reorder = False
+    for key, bucket in touched.items():
+        first = buckets[key][0] if key in buckets else None
+        if bucket:
+            patched[key] = tuple(bucket)
+            reorder = reorder or first is None or bucket[0].id != first.id
+        else:
+            del patched[key]
+    if reorder:
+        # Keys stay in the order of their first product, as in a full build
+        patched = dict(sorted(patched.items(), key=lambda item: item[1][0].id))
+    return patched
+
+
+def _in_scope(product: Optional[CatalogProduct], category: Optional[str], brand: Optional[str]) -> bool:
+    """Whether a product belongs in the sorted view of a category and/or brand."""
+    return product is not None and (category is None or product.category == category) and (
+        brand is None or product.brand == brand
+    )
+
+
+def _patched_view(
+    view: Tuple[Tuple[CatalogProduct, ...], List[tuple]],
+    changes: List[Tuple[Optional[CatalogProduct], Optional[CatalogProduct]]],
+    category: Optional[str],
+    brand: Optional[str],
+    key: Callable[[CatalogProduct], tuple],
+) -> Tuple[Tuple[CatalogProduct, ...], List[tuple]]:
+    """Sorted view with the changed products bisected out and back in."""
+    def in_scope(product: Optional[CatalogProduct]) -> bool:
+        return _in_scope(product, category, brand)
+
+    changes = [(old, new) for old, new in changes if in_scope(old) or in_scope(new)]
+    if not changes:
+        return view
+    ordered, keys = list(view[0]), view[1]
+    moved = []
+    for old, new in changes:
+        if in_scope(old) and in_scope(new) and key(old) == key(new):
+            # Same place in the order (e.g. a stock change)
+            ordered[bisect_left(keys, key(old))] = new
+        else:
+            moved.append((old, new))
+    if moved:
+        keys = list(keys)
+        for old, _ in moved:
+            if in_scope(old):
+                position = bisect_left(keys, key(old))
+                del ordered[position]
+                del keys[position]
+        for _, new in moved:
+            if in_scope(new):
+                new_key = key(new)
+                position = bisect_left(keys, new_key)
+                ordered.insert(position, new)
+                keys.insert(position, new_key)
+    # Key lists are never mutated once published, so unchanged ones are shared
+    return tuple(ordered), keys
+
+
+# Current snapshot, swapped atomically under _lock by writers
+_snapshot: Optional[CatalogSnapshot] = None
+_lock = threading.RLock()
+
+# Callbacks notified after the snapshot changes. Used by derived indexes
+# that update incrementally.
+CatalogListener = Callable[[Optional[Set[int]], "CatalogSnapshot"], None]
+_change_listeners: List[CatalogListener] = []
+
+
+def add_catalog_listener(callback: CatalogListener) -> None:
+    """Register a callback for catalog changes.
+
+    Args:
+        callback: Called with the changed product ids (or None when the whole
+            catalog was reloaded) and the snapshot that was replaced
+    """
+    _change_listeners.append(callback)
+
+
+def _notify_listeners(changed_ids: Optional[Set[int]], previous: "CatalogSnapshot") -> None:
+    for callback in _change_listeners:
+        try:
+            callback(changed_ids, previous)
+        except Exception as e:
+            app_logger.error(f"Catalog change listener {callback.__name__} failed: {e}")
+
+
+# The one catalog_state row
+CATALOG_STATE_ID = 1
+
+
+def read_catalog_revision(db: Session) -> int:
+    """Return the catalog revision stored in the database."""
+    return db.scalar(select(CatalogState.revision).where(CatalogState.id == CATALOG_STATE_ID)) or 0
+
+
+async def read_catalog_revision_async(db: AsyncSession) -> int:
+    """Return the catalog revision stored in the database."""
+    return await db.scalar(select(CatalogState.revision).where(CatalogState.id == CATALOG_STATE_ID)) or 0
+
+
+def bump_catalog_revision(session: Session) -> None:
+    """Record a catalog write other processes must reload for.
+
+    Runs in the caller's transaction; bulk writes that bypass the ORM call
+    it so that running servers reload their snapshots (see
+    watch_catalog_revision()).
+    """
+    session.execute(
+        update(CatalogState)
+        .where(CatalogState.id == CATALOG_STATE_ID)
+        .values(revision=CatalogState.revision + 1)
+    )
+
+
+def refresh_catalog() -> CatalogSnapshot:
+    """Rebuild the catalog snapshot from the database.
+
+    Row-level ORM writes are picked up automatically on commit; call this
+    after bulk statements (e.g. ``query.update()``) that bypass the ORM.
+
+    Returns:
+        The freshly loaded snapshot
+    """
+    global _snapshot
+    with _lock:
+        with get_db_context() as db:
+            # Read first: a write after it bumps the revision again
+            revision = read_catalog_revision(db)
+            products = [CatalogProduct.from_model(p) for p in db.query(Product).all()]
+        previous = _snapshot
+        version = _snapshot.version + 1 if _snapshot else 1
+        _snapshot = CatalogSnapshot(products, version, revision)
+    app_logger.info(f"Catalog snapshot v{_snapshot.version} loaded with {len(_snapshot)} products")
+    if previous is not None:
+        _notify_listeners(None, previous)
+    return _snapshot
+
+
+def reload_products(product_ids: Iterable[int]) -> None:
+    """Re-read a few products into the snapshot after writes that bypass the ORM.
+
+    Much cheaper than refresh_catalog() for a handful of rows, e.g. the
+    conditional stock updates of an order. Rows are read under the snapshot
+    lock, so concurrent reloads never apply an older stock over a newer one.
+    """
+    global _snapshot
+    ids = set(product_ids)
+    if not ids:
+        return
+    with _lock:
+        if _snapshot is None:
+            # Nothing loaded yet; the first read will see the new rows
+            return
+        # Own session: this may run in a worker thread of a request
+        with SessionLocal() as db:
+            rows = {p.id: CatalogProduct.from_model(p) for p in db.query(Product).filter(Product.id.in_(ids))}
+        previous = _snapshot
+        _snapshot = _snapshot.patched(list(rows.values()), [i for i in ids if i not in rows])
+    app_logger.debug(f"Catalog snapshot patched to v{_snapshot.version} ({len(ids)} products reloaded)")
+    _notify_listeners(ids, previous)
+
+
+async def refresh_catalog_async() -> CatalogSnapshot:
+    """Rebuild the catalog snapshot without blocking the event loop.
+
+    Returns:
+        The freshly loaded snapshot
+    """
+    global _snapshot
+    async with get_async_db_context() as db:
+        revision = await read_catalog_revision_async(db)
+        result = await db.execute(select(Product).order_by(Product.id))
+        products = [CatalogProduct.from_model(p) for p in result.scalars()]
+    with _lock:
+        previous = _snapshot
+        version = _snapshot.version + 1 if _snapshot else 1
+        _snapshot = CatalogSnapshot(products, version, revision)
+    app_logger.info(f"Catalog snapshot v{_snapshot.version} loaded with {len(_snapshot)} products")
+    if previous is not None:
+        _notify_listeners(None, previous)
+    return _snapshot
+
+
+# Serializes concurrent first loads so N clients arriving at a cold start
+# share one query instead of issuing N
+_async_load_lock: Optional[asyncio.Lock] = None
+
+
+async def get_snapshot_async() -> CatalogSnapshot:
+    """Return the current catalog snapshot, loading it asynchronously on first use."""
+    global _async_load_lock
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+    if _async_load_lock is None:
+        _async_load_lock = asyncio.Lock()
+    async with _async_load_lock:
+        return _snapshot or await refresh_catalog_async()
+
+
+async def watch_catalog_revision(interval: float) -> None:
+    """Reload the snapshot whenever another process bumps the catalog revision.
+
+    Polls one row every interval seconds; runs until cancelled. Imports run
+    from the command line (app.services.catalog_import) reach running
+    servers this way.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = _snapshot
+        if snapshot is None:
+            # Nothing loaded yet; the first read loads the current revision
+            continue
+        try:
+            async with get_async_db_context() as db:
+                revision = await read_catalog_revision_async(db)
+            if revision != snapshot.revision:
+                app_logger.info(f"Catalog revision {revision} written by another process, reloading")
+                await refresh_catalog_async()
+        except Exception as e:
+            app_logger.warning(f"Catalog revision check failed: {e}")
+
+
+def get_snapshot() -> CatalogSnapshot:
+    """Return the current catalog snapshot, loading it on first use."""
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = refresh_catalog()
+    return snapshot
+
+
+def get_catalog_version() -> int:
+    """Return the version of the current catalog snapshot."""
+    return get_snapshot().version
+
+
+def _apply_changes(changes: Dict[int, Optional[CatalogProduct]]) -> None:
+    """Patch the current snapshot with committed product changes."""
+    global _snapshot
+    with _lock:
+        if _snapshot is None:
+            # Nothing loaded yet; the first read will see the new rows
+            return
+        upserts = [p for p in changes.values() if p is not None]
+        deleted_ids = [product_id for product_id, p in changes.items() if p is None]
+        previous = _snapshot
+        _snapshot = _snapshot.patched(upserts, deleted_ids)
+    app_logger.debug(f"Catalog snapshot patched to v{_snapshot.version} ({len(changes)} products)")
+    _notify_listeners(set(changes), previous)
+
+
+# Keep the snapshot in sync with ORM writes. Changes are collected per
+# session on flush and only applied once the transaction commits.
+@event.listens_for(Session, "after_flush")
+def _track_product_changes(session: Session, flush_context) -> None:
+    changes = session.info.setdefault("catalog_changes", {})
+    feature_changes: Dict[int, List[str]] = {}
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Product):
+            product = changes[obj.id] = CatalogProduct.from_model(obj)
+            if obj in session.new or inspect(obj).attrs.features.history.has_changes():
+                feature_changes[obj.id] = list(product.feature_list)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes[obj.id] = None
+            feature_changes[obj.id] = []
+    # Normalized rows are written in the same transaction as the product
+    sync_product_features(session.connection(), feature_changes)
+
+
+def _feature_ids(connection: Connection, names: Set[str]) -> Dict[str, int]:
+    """Return the features table ids for the given names, creating missing ones."""
+    ids: Dict[str, int] = {}
+    ordered = sorted(names)
+    for start in range(0, len(ordered), 500):
+        chunk = ordered[start:start + 500]
+        ids.update(connection.execute(select(Feature.name, Feature.id).where(Feature.name.in_(chunk))).all())
+    missing = [{"name": name} for name in ordered if name not in ids]
+    if missing:
+        connection.execute(insert(Feature), missing)
+        for start in range(0, len(missing), 500):
+            chunk = [row["name"] for row in missing[start:start + 500]]
+            ids.update(connection.execute(select(Feature.name, Feature.id).where(Feature.name.in_(chunk))).all())
+    return ids
+
+
+def sync_product_features(connection: Connection, product_features: Dict[int, Iterable[str]]) -> None:
+    """Rewrite the product_features rows of the given products.
+
+    Args:
+        connection: Connection of the transaction writing the products
+        product_features: Mapping of product id to its features (empty for
+            deleted products)
+    """
+    if not product_features:
+        return
+    ids = _feature_ids(connection, {name for names in product_features.values() for name in names})
+    product_ids = list(product_features)
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        connection.execute(delete(ProductFeature).where(ProductFeature.product_id.in_(chunk)))
+    rows = [
+        {"product_id": product_id, "feature_id": ids[name]}
+        for product_id, names in product_features.items()
+        for name in set(names)
+    ]
+    if rows:
+        connection.execute(insert(ProductFeature), rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_product_changes(session: Session) -> None:
+    changes = session.info.pop("catalog_changes", None)
+    if changes:
+        _apply_changes(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_product_changes(session: Session) -> None:
+    session.info.pop("catalog_changes", None)
+
+
+# Read helpers used by the storefront pages. None of these touch the database
+# once the snapshot is loaded.
+def get_all_products() -> Tuple[CatalogProduct, ...]:
+    return get_snapshot().products
+
+
+def get_products_by_category(category: str) -> Tuple[CatalogProduct, ...]:
+    return get_snapshot().by_category.get(category, ())
+
+
+def get_products_by_brand(brand: str) -> Tuple[CatalogProduct, ...]:
+    return get_snapshot().by_brand.get(brand, ())
+
+
+def get_products_by_price_range(min_price: float, max_price: float) -> Tuple[CatalogProduct, ...]:
+    return get_snapshot().price_range(min_price, max_price)
+
+
+def get_product_by_id(product_id: int) -> Optional[CatalogProduct]:
+    return get_snapshot().by_id.get(product_id)
+
+
+def get_unique_categories() -> List[str]:
+    return list(get_snapshot().by_category)
+
+
+def get_unique_brands() -> List[str]:
+    return list(get_snapshot().by_brand)
+
+
+def get_products_by_features(features: Iterable[str]) -> Tuple[CatalogProduct, ...]:
+    return get_snapshot().with_features(features)
+
+
+def get_unique_features() -> List[str]:
+    return list(get_snapshot().features)
+
+
+# Async variants for NiceGUI page handlers. Once the snapshot is loaded these
+# return immediately; only a cold load awaits the database.
+async def get_all_products_async() -> Tuple[CatalogProduct, ...]:
+    return (await get_snapshot_async()).products
+
+
+async def get_products_by_category_async(category: str) -> Tuple[CatalogProduct, ...]:
+    return (await get_snapshot_async()).by_category.get(category, ())
+
+
+async def get_products_by_brand_async(brand: str) -> Tuple[CatalogProduct, ...]:
+    return (await get_snapshot_async()).by_brand.get(brand, ())
+
+
+async def get_products_by_price_range_async(min_price: float, max_price: float) -> Tuple[CatalogProduct, ...]:
+    return (await get_snapshot_async()).price_range(min_price, max_price)
+
+
+async def get_product_by_id_async(product_id: int) -> Optional[CatalogProduct]:
+    return (await get_snapshot_async()).by_id.get(product_id)
+
+
+async def get_unique_categories_async() -> List[str]:
+    return list((await get_snapshot_async()).by_category)
+
+
+async def get_unique_brands_async() -> List[str]:
+    return list((await get_snapshot_async()).by_brand)
+
+
+async def get_products_by_features_async(features: Iterable[str]) -> Tuple[CatalogProduct, ...]:
+    return (await get_snapshot_async()).with_features(features)
+
+
+async def get_unique_features_async() -> List[str]:
+    return list((await get_snapshot_async()).features)
+
+
+def list_products(**filters: Any) -> ProductPage:
+    """Return one keyset-paginated page of products.
+
+    Accepts the keyword arguments of CatalogSnapshot.paginate().
+    """
+    return get_snapshot().paginate(**filters)
+
+
+async def list_products_async(**filters: Any) -> ProductPage:
+    """Async variant of list_products() for page handlers."""
+    return (await get_snapshot_async()).paginate(**filters)
+
+
+# SQL equivalents of the read helpers. The snapshot serves the hot path, but
+# loads, refreshes and the API still hit these access paths, so each one must
+# be backed by an index.
+def catalog_queries() -> Dict[str, object]:
+    """Return representative statements for each catalog access path."""
+    return {
+        "get_product_by_id": select(Product).where(Product.id == 1),
+        "get_products_by_category": select(Product).where(Product.category == "Dive"),
+        "get_products_by_brand": select(Product).where(Product.brand == "Rolex"),
+        "get_product_by_brand_and_name": select(Product).where(
+            Product.brand == "Rolex", Product.name == "Submariner Date"
+        ),
+        "get_products_by_price_range": select(Product).where(Product.price.between(1000, 5000)).order_by(Product.price),
+        "get_products_by_category_and_price": select(Product).where(
+            Product.category == "Dive", Product.price.between(1000, 5000)
+        ).order_by(Product.price),
+        "get_products_by_brand_and_price": select(Product).where(
+            Product.brand == "Rolex", Product.price.between(1000, 5000)
+        ).order_by(Product.price),
+        "get_unique_categories": select(Product.category).distinct(),
+        "get_unique_brands": select(Product.brand).distinct(),
+        "get_products_by_feature": select(Product).join(
+            ProductFeature, ProductFeature.product_id == Product.id
+        ).join(Feature, Feature.id == ProductFeature.feature_id).where(Feature.name == "Sapphire crystal"),
+        "get_related_products": select(RelatedProduct.related_id).where(
+            RelatedProduct.product_id == 1
+        ).order_by(RelatedProduct.rank).limit(4),
+    }
+
+
+def check_catalog_query_plans(engine: Optional[Engine] = None) -> Dict[str, List[str]]:
+    """Fail if any catalog query plan falls back to a full table scan.
+
+    Args:
+        engine: Engine to check; defaults to a scratch in-memory database
+            built from the migrations, so the schema itself is verified
+
+    Returns:
+        Mapping of query name to its plan
+
+    Raises:
+        DatabaseError: If any catalog query scans the products table
+    """
+    if engine is None:
+        engine = create_engine("sqlite://")
+        migrate(engine, MIGRATIONS)
+    return check_query_plans(engine, catalog_queries())
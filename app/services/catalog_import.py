@@ -0,0 +1,298 @@
+"""Streaming catalog import.
+
+Reads CSV or JSONL product feeds row by row, validates them in chunks and
+upserts each chunk with one executemany in its own transaction, so memory
+stays flat and a failure only loses the chunk being written.
+
+Usage:
+    python -m app.services.catalog_import feed.jsonl [--chunk-size 5000]
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional
+
+from pydantic import ValidationError as PydanticValidationError
+from sqlalchemy import Column, func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core import database
+from app.core.database import SessionLocal
+from app.core.exceptions import DatabaseError, ValidationError
+from app.core.logging import app_logger
+from app.core.migrations import migrate
+from app.models.catalog import ProductImportRow
+from app.models.migrations import MIGRATIONS
+from app.models.product import Product
+from app.services.catalog import bump_catalog_revision, refresh_catalog, split_features, sync_product_features
+
+# Rows validated and written per transaction
+DEFAULT_CHUNK_SIZE = 5000
+
+# Rejected rows kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+FEED_FORMATS = ("csv", "jsonl")
+
+_COLUMNS = ("name", "brand", "category", "price", "description", "image_url", "stock", "features")
+_DEFAULT_STOCK = 10
+_UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+@dataclass
+class ImportReport:
+    """Outcome and throughput of a catalog import."""
+    rows_read: int = 0
+    rows_written: int = 0
+    rows_rejected: int = 0
+    chunks: int = 0
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.rows_written} rows written, {self.rows_rejected} rejected "
+            f"of {self.rows_read} read in {self.chunks} chunks, "
+            f"{self.elapsed:.1f}s ({self.rows_per_second:,.0f} rows/s)"
+        )
+
+
+def read_feed(path: str, format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Stream raw rows from a CSV (with header) or JSONL feed.
+
+    Args:
+        path: Feed file
+        format: "csv" or "jsonl"; defaults to the file extension
+
+    Raises:
+        ValidationError: If the format is unsupported or a JSONL line is not an object
+    """
+    format = format or Path(path).suffix.lstrip(".").lower()
+    if format == "ndjson":
+        format = "jsonl"
+    if format not in FEED_FORMATS:
+        raise ValidationError(detail=f"Unsupported feed format: {format or path}")
+
+    with open(path, newline="", encoding="utf-8") as feed:
+        if format == "csv":
+            yield from csv.DictReader(feed)
+            return
+        for line_number, line in enumerate(feed, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValidationError(detail=f"Line {line_number}: invalid JSON ({e.msg})") from e
+            if not isinstance(row, dict):
+                raise ValidationError(detail=f"Line {line_number}: expected a JSON object")
+            yield row
+
+
+def _chunks(rows: Iterable[Mapping[str, Any]], size: int) -> Iterator[List[Mapping[str, Any]]]:
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _validate_chunk(
+    chunk: List[Mapping[str, Any]],
+    first_row: int,
+    report: ImportReport,
+) -> List[Dict[str, Any]]:
+    """Validate one chunk, recording rejected rows in the report."""
+    valid = []
+    for row_number, raw in enumerate(chunk, start=first_row):
+        try:
+            valid.append(ProductImportRow.model_validate(raw).model_dump())
+        except PydanticValidationError as e:
+            report.rows_rejected += 1
+            if len(report.errors) < MAX_REPORTED_ERRORS:
+                problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                report.errors.append(f"Row {row_number}: {problems}")
+    return valid
+
+
+def _existing_names(session: Session, keys: List[tuple]) -> set:
+    """The (brand, name) pairs among keys that already have a product."""
+    table = Product.__table__
+    existing = set()
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        existing.update((brand, name) for brand, name in session.execute(
+            select(table.c.brand, table.c.name).where(tuple_(table.c.brand, table.c.name).in_(chunk))
+        ))
+    return existing
+
+
+def _upsert(session: Session, conflict_columns: List[Column], rows: List[Dict[str, Any]]) -> Dict[int, List[str]]:
+    """Insert rows, updating the product that has the same conflict columns.
+
+    Returns:
+        The features of every written product by id
+    """
+    table = Product.__table__
+    dialect = session.get_bind().dialect.name
+    dialect_insert = _UPSERT_DIALECTS.get(dialect)
+    if dialect_insert is None:
+        raise DatabaseError(detail=f"Catalog import cannot upsert on {dialect}")
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=conflict_columns,
+        set_={column: statement.excluded[column] for column in _COLUMNS}
+        | {"stock": func.coalesce(statement.excluded.stock, table.c.stock)},
+    )
+    # Returning the features with the ids avoids needing the rows back in
+    # parameter order, which would force one statement per row
+    result = session.execute(statement.returning(table.c.id, table.c.features), rows)
+    return {product_id: split_features(features) for product_id, features in result}
+
+
+def _write_chunk(session: Session, rows: List[Dict[str, Any]]) -> None:
+    """Upsert one validated chunk and its normalized features.
+
+    Rows with an id are matched on it; the others on (brand, name), the
+    natural key of feeds, so importing a feed again updates its products.
+    """
+    table = Product.__table__
+    by_id = {row["id"]: row for row in rows if row["id"] is not None}
+    # One statement may not update a row twice; a later row of the same
+    # product wins, as it would in separate chunks
+    by_name = {
+        (row["brand"], row["name"]): {column: row[column] for column in _COLUMNS}
+        for row in rows if row["id"] is None
+    }
+    product_features: Dict[int, List[str]] = {}
+    if by_id:
+        product_features |= _upsert(session, [table.c.id], list(by_id.values()))
+    if by_name:
+        # New products start with the default stock; existing ones keep theirs
+        # when the feed has none, through the coalesce in the update
+        existing = _existing_names(session, list(by_name))
+        inserts = [
+            row | {"stock": _DEFAULT_STOCK} if row["stock"] is None and key not in existing else row
+            for key, row in by_name.items()
+        ]
+        product_features |= _upsert(session, [table.c.brand, table.c.name], inserts)
+
+    sync_product_features(session.connection(), product_features)
+
+
+def import_products(
+    rows: Iterable[Mapping[str, Any]],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    session: Optional[Session] = None,
+    refresh: bool = True,
+) -> ImportReport:
+    """Validate and upsert products in bounded transactions.
+
+    Writes bypass the ORM, so the catalog snapshot is reloaded once at the
+    end instead of being patched row by row. The catalog revision is bumped
+    once as well, so other running servers reload too.
+
+    Args:
+        rows: Raw product rows, e.g. from read_feed()
+        chunk_size: Rows per validation batch and transaction
+        session: Session to write with; a new one is used if omitted
+        refresh: Whether to reload the catalog snapshot afterwards
+
+    Returns:
+        Counts, rejected-row messages and throughput
+
+    Raises:
+        DatabaseError: If a chunk cannot be written (earlier chunks stay committed)
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    own_session = session is None
+    session = session or SessionLocal()
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            valid = _validate_chunk(chunk, report.rows_read + 1, report)
+            report.rows_read += len(chunk)
+            report.chunks += 1
+            if valid:
+                try:
+                    _write_chunk(session, valid)
+                    session.commit()
+                except DatabaseError:
+                    session.rollback()
+                    raise
+                except Exception as e:
+                    session.rollback()
+                    raise DatabaseError(
+                        detail=f"Import failed in rows {report.rows_read - len(chunk) + 1}-{report.rows_read}: {e}"
+                    ) from e
+                report.rows_written += len(valid)
+            report.elapsed = time.perf_counter() - started
+            app_logger.debug(f"Catalog import: {report.summary()}")
+    finally:
+        try:
+            if report.rows_written:
+                # Also after a failed chunk: the chunks before it are committed
+                bump_catalog_revision(session)
+                session.commit()
+        finally:
+            if own_session:
+                session.close()
+
+    report.elapsed = time.perf_counter() - started
+    app_logger.info(f"Catalog import finished: {report.summary()}")
+    if refresh and report.rows_written:
+        refresh_catalog()
+    return report
+
+
+def import_catalog_file(
+    path: str,
+    format: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    refresh: bool = True,
+) -> ImportReport:
+    """Stream a CSV or JSONL feed into the catalog.
+
+    Args:
+        path: Feed file
+        format: "csv" or "jsonl"; defaults to the file extension
+        chunk_size: Rows per validation batch and transaction
+        refresh: Whether to reload the catalog snapshot afterwards
+
+    Returns:
+        Counts, rejected-row messages and throughput
+    """
+    return import_products(read_feed(path, format), chunk_size=chunk_size, refresh=refresh)
+
+
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Import a CSV or JSONL product feed into the catalog.")
+    parser.add_argument("path", help="Feed file (.csv or .jsonl)")
+    parser.add_argument("--format", choices=FEED_FORMATS, help="Feed format (default: from extension)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    migrate(database.engine, MIGRATIONS)
+    # This process holds no snapshot worth refreshing. Running servers see
+    # the new catalog revision, reload and rebuild their related lists; a
+    # server started later rebuilds them because they lag the revision.
+    report = import_catalog_file(args.path, args.format, args.chunk_size, refresh=False)
+    print(report.summary())
+    for error in report.errors:
+        print(error, file=sys.stderr)
+    return 0 if not report.rows_rejected else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+import asyncio
+import copy
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from app.core.exceptions import ValidationError
+from app.services.catalog import CatalogProduct, CatalogSnapshot, get_snapshot, get_snapshot_async
+
+# Price bands offered as facet values: (key, label, min, max), bounds inclusive
+PRICE_BANDS: List[Tuple[str, str, float, float]] = [
+    ("0-1000", "Under $1,000", 0, 1000),
+    ("1000-5000", "$1,000 - $5,000", 1000, 5000),
+    ("5000-10000", "$5,000 - $10,000", 5000, 10000),
+    ("10000-20000", "$10,000 - $20,000", 10000, 20000),
+    ("20000-999999", "$20,000+", 20000, 999999),
+]
+
+# Facets in display order. Values within a disjunctive facet are OR-ed
+# ("Rolex or Omega"); feature values are AND-ed ("has all of these").
+FACETS = ("category", "brand", "price", "feature")
+DISJUNCTIVE_FACETS = ("category", "brand", "price")
+
+
+@dataclass(frozen=True)
+class FacetValue:
+    """A facet value with the number of matching products."""
+    value: str
+    count: int
+    selected: bool
+
+
+@dataclass(frozen=True)
+class FacetResult:
+    """Products matching a facet selection plus live counts for every facet."""
+    total: int
+    items: Tuple[CatalogProduct, ...]
+    facets: Dict[str, List[FacetValue]]
+    bits: int = 0
+
+
+def _bit_positions(bitmap: int) -> Iterable[int]:
+    """Yield the positions of the set bits in ascending order."""
+    while bitmap:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1
+        bitmap ^= low
+
+
+def _price(product: CatalogProduct) -> float:
+    return product.price
+
+
+def _order_key(product: CatalogProduct) -> Tuple[float, int]:
+    return (product.price, product.id)
+
+
+def _facet_values(product: CatalogProduct) -> Iterator[Tuple[str, str]]:
+    """(facet, value) pairs a product is listed under."""
+    yield "category", product.category
+    yield "brand", product.brand
+    for key, _, min_price, max_price in PRICE_BANDS:
+        if min_price <= product.price <= max_price:
+            yield "price", key
+    for feature in product.feature_list:
+        yield "feature", feature
+
+
+def _bitmap(positions: List[int], size: int) -> int:
+    """Int bitmap with the given bit positions set, built in one pass."""
+    buffer = bytearray(size)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class FacetIndex:
+    """Bitmap posting lists over one catalog snapshot.
+
+    Every product gets a bit position in (price, id) order, and each facet
+    value maps to an int bitmap of the products carrying it. Filtering is a
+    handful of AND/OR operations and counts are popcounts, so a click costs
+    O(values x products / 64) word operations instead of a GROUP BY per facet.
+    Results come out cheapest first because positions follow price order.
+
+    An index is never mutated; rebased() and patched() derive the index of a
+    newer snapshot from it.
+    """
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.version = snapshot.version
+        self.index_version = snapshot.index_version
+        self.products: Tuple[CatalogProduct, ...] = snapshot.by_price
+        self._by_id = snapshot.by_id
+        # id -> position, built by the first bulk lookup (see bitmap_for_ids)
+        self._positions: Optional[Dict[int, int]] = None
+        self.all_bits = (1 << len(self.products)) - 1
+
+        # Collect each value's positions first, then set all of its bits at
+        # once; OR-ing bits into growing ints would copy them once per product
+        positions: Dict[str, Dict[str, List[int]]] = {facet: defaultdict(list) for facet in FACETS}
+        categories, brands, features = positions["category"], positions["brand"], positions["feature"]
+        for position, product in enumerate(self.products):
+            categories[product.category].append(position)
+            brands[product.brand].append(position)
+            for feature in product.feature_list:
+                features[feature].append(position)
+        size = (len(self.products) + 7) // 8
+        self.postings: Dict[str, Dict[str, int]] = {
+            facet: {value: _bitmap(value_positions, size) for value, value_positions in values.items()}
+            for facet, values in positions.items()
+        }
+        # Products are in price order, so each band is a contiguous run of bits
+        for key, _, min_price, max_price in PRICE_BANDS:
+            start = bisect_left(self.products, min_price, key=_price)
+            end = bisect_right(self.products, max_price, key=_price)
+            if end > start:
+                self.postings["price"][key] = ((1 << (end - start)) - 1) << start
+
+    def rebased(self, snapshot: CatalogSnapshot) -> "FacetIndex":
+        """The index for a snapshot with the same index_version.
+
+        Such snapshots only differ in stock, which moves no product between
+        positions or postings, so everything but the products is shared.
+        """
+        index = copy.copy(self)
+        index.version = snapshot.version
+        index.products = snapshot.by_price
+        index._by_id = snapshot.by_id
+        return index
+
+    def patched(self, snapshot: CatalogSnapshot, changes: Iterable[Tuple[Optional[CatalogProduct], Optional[CatalogProduct]]]) -> "FacetIndex":
+        """The index for a snapshot patched from this index's index_version.
+
+        Args:
+            snapshot: The patched snapshot
+            changes: Its index_changes, (old, new) product pairs
+
+        Each change shifts the bitmaps above the product's old and new
+        positions by one bit, O(values x products / 64) per change.
+        """
+        postings = {facet: dict(values) for facet, values in self.postings.items()}
+        order = list(self.products)
+        for old, new in changes:
+            if old is not None and new is not None and _order_key(old) == _order_key(new):
+                position = bisect_left(order, _order_key(old), key=_order_key)
+                bit = 1 << position
+                for facet, value in _facet_values(old):
+                    postings[facet][value] &= ~bit
+                for facet, value in _facet_values(new):
+                    postings[facet][value] = postings[facet].get(value, 0) | bit
+                order[position] = new
+                continue
+            if old is not None:
+                position = bisect_left(order, _order_key(old), key=_order_key)
+                del order[position]
+                below = (1 << position) - 1
+                for values in postings.values():
+                    for value, bits in values.items():
+                        values[value] = bits & below | bits >> (position + 1) << position
+            if new is not None:
+                position = bisect_left(order, _order_key(new), key=_order_key)
+                order.insert(position, new)
+                below = (1 << position) - 1
+                for values in postings.values():
+                    for value, bits in values.items():
+                        values[value] = bits & below | (bits & ~below) << 1
+                for facet, value in _facet_values(new):
+                    postings[facet][value] = postings[facet].get(value, 0) | 1 << position
+
+        index = copy.copy(self)
+        index.version = snapshot.version
+        index.index_version = snapshot.index_version
+        index.products = snapshot.by_price
+        index._by_id = snapshot.by_id
+        index._positions = None
+        index.all_bits = (1 << len(index.products)) - 1
+        # Values without products are left out, as in a full build
+        index.postings = {facet: {value: bits for value, bits in values.items() if bits} for facet, values in postings.items()}
+        return index
+
+    def position(self, product_id: int) -> Optional[int]:
+        """Bit position of a product, or None if it is not in the index."""
+        if self._positions is not None:
+            return self._positions.get(product_id)
+        product = self._by_id.get(product_id)
+        if product is None:
+            return None
+        return bisect_left(self.products, _order_key(product), key=_order_key)
+
+    def bitmap_for_ids(self, product_ids: Iterable[int]) -> int:
+        """Bitmap of the given product ids (unknown ids are ignored).
+
+        The first call builds an id -> position table, O(products), instead
+        of bisecting once per id; text searches can match most of the catalog.
+        """
+        if self._positions is None:
+            self._positions = {product.id: position for position, product in enumerate(self.products)}
+        lookup = self._positions.get
+        positions = [position for position in map(lookup, product_ids) if position is not None]
+        return _bitmap(positions, (len(self.products) + 7) // 8)
+
+    def _facet_bits(self, facet: str, values: Iterable[str]) -> int:
+        """Bitmap of products matching the selected values of one facet."""
+        postings = self.postings[facet]
+        if facet in DISJUNCTIVE_FACETS:
+            bits = 0
+            for value in values:
+                bits |= postings.get(value, 0)
+            return bits
+        bits = self.all_bits
+        for value in values:
+            bits &= postings.get(value, 0)
+        return bits
+
+    def match(self, selection: Mapping[str, Iterable[str]], exclude: Optional[str] = None) -> int:
+        """Bitmap of products matching the selection, optionally ignoring one facet."""
+        bits = self.all_bits
+        for facet, values in selection.items():
+            values = list(values)
+            if facet == exclude or not values:
+                continue
+            bits &= self._facet_bits(facet, values)
+        return bits
+
+    def search(
+        self,
+        selection: Mapping[str, Iterable[str]],
+        limit: int = 24,
+        offset: int = 0,
+        within: Optional[int] = None,
+    ) -> FacetResult:
+        """Apply a facet selection and compute counts for every facet value.
+
+        Counts for a disjunctive facet ignore that facet's own selection, so
+        customers can see how many products picking another brand would add.
+
+        Args:
+            selection: Mapping of facet name to selected values
+            limit: Maximum number of products to return
+            offset: Number of matching products to skip
+            within: Optional bitmap restricting the candidate set (e.g. text matches)
+
+        Returns:
+            The matching products and per-facet counts
+
+        Raises:
+            ValidationError: If the selection names an unknown facet
+        """
+        unknown = set(selection) - set(FACETS)
+        if unknown:
+            raise ValidationError(detail=f"Unknown facets: {', '.join(sorted(unknown))}")
+        selected = {facet: set(values) for facet, values in selection.items()}
+        base = self.all_bits if within is None else within & self.all_bits
+
+        matched = base & self.match(selected)
+        facets: Dict[str, List[FacetValue]] = {}
+        for facet in FACETS:
+            scope = base & self.match(selected, exclude=facet) if facet in DISJUNCTIVE_FACETS else matched
+            chosen = selected.get(facet, set())
+            values = [
+                FacetValue(value=value, count=(scope & bits).bit_count(), selected=value in chosen)
+                for value, bits in self.postings[facet].items()
+            ]
+            if facet == "price":
+                order = {key: i for i, (key, *_) in enumerate(PRICE_BANDS)}
+                values.sort(key=lambda v: order[v.value])
+            else:
+                values.sort(key=lambda v: (-v.count, v.value))
+            facets[facet] = values
+
+        items: List[CatalogProduct] = []
+        for index, position in enumerate(_bit_positions(matched)):
+            if index < offset:
+                continue
+            if len(items) >= limit:
+                break
+            items.append(self.products[position])
+        return FacetResult(total=matched.bit_count(), items=tuple(items), facets=facets, bits=matched)
+
+
+# Index for the latest snapshot seen; rebased for stock changes, patched for
+# small catalog edits and rebuilt otherwise
+_index: Optional[FacetIndex] = None
+_lock = threading.Lock()
+_build_lock: Optional[asyncio.Lock] = None
+
+# Larger index_changes are rebuilt rather than patched
+MAX_INDEX_PATCH = 64
+
+
+def _cached_index(snapshot: CatalogSnapshot) -> Optional[FacetIndex]:
+    """The index for a snapshot if no bitmap has to be built, else None."""
+    global _index
+    index = _index
+    if index is None or index.index_version != snapshot.index_version:
+        return None
+    if index.version != snapshot.version:
+        index = index.rebased(snapshot)
+        with _lock:
+            if _index is None or _index.version < index.version:
+                _index = index
+    return index
+
+
+def _build_index(snapshot: CatalogSnapshot) -> FacetIndex:
+    """Patch the cached index up to a snapshot, or build it from scratch."""
+    global _index
+    index = _index
+    changes = snapshot.index_changes
+    if (
+        index is not None
+        and changes is not None
+        and changes[0] == index.index_version
+        and len(changes[1]) <= MAX_INDEX_PATCH
+    ):
+        index = index.patched(snapshot, changes[1])
+    else:
+        index = FacetIndex(snapshot)
+    with _lock:
+        if _index is None or _index.version < index.version:
+            _index = index
+    return index
+
+
+def get_facet_index() -> FacetIndex:
+    """Return the facet index for the current catalog snapshot."""
+    snapshot = get_snapshot()
+    return _cached_index(snapshot) or _build_index(snapshot)
+
+
+async def get_facet_index_async() -> FacetIndex:
+    """Async variant of get_facet_index() for page handlers.
+
+    Builds run in a worker thread (a full one takes about 0.1 s per 100k
+    products), and concurrent requests wait for the same build.
+    """
+    global _build_lock
+    snapshot = await get_snapshot_async()
+    index = _cached_index(snapshot)
+    if index is not None:
+        return index
+    if _build_lock is None:
+        _build_lock = asyncio.Lock()
+    async with _build_lock:
+        # The catalog may have moved on while this request waited
+        snapshot = await get_snapshot_async()
+        return _cached_index(snapshot) or await asyncio.to_thread(_build_index, snapshot)
+
+
+def facet_search(selection: Mapping[str, Iterable[str]], limit: int = 24, offset: int = 0) -> FacetResult:
+    """Search the catalog by facet selection."""
+    return get_facet_index().search(selection, limit=limit, offset=offset)
+
+
+async def facet_search_async(selection: Mapping[str, Iterable[str]], limit: int = 24, offset: int = 0) -> FacetResult:
+    """Async variant of facet_search() for page handlers."""
+    return (await get_facet_index_async()).search(selection, limit=limit, offset=offset)
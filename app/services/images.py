@@ -0,0 +1,245 @@
+import base64
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+import requests
+
+from app.core.config import settings
+from app.core.exceptions import ConfigurationError, ExternalServiceError
+from app.core.database import get_db_context
+from app.core.logging import app_logger
+from app.models.product import Product
+from app.services.catalog import CatalogProduct, get_snapshot
+
+# Pillow is only needed to ingest images, not to serve them
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = ImageOps = None
+
+# Variants are written to IMAGE_DIR and served from IMAGE_URL_PREFIX with
+# immutable caching; the filename carries the source content hash
+IMAGE_DIR = Path(settings.static_dir) / "products"
+IMAGE_URL_PREFIX = "/static/products"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Square variant widths, cropped to fill. All of them go into srcset so the
+# browser downloads the smallest one that covers the rendered size.
+VARIANT_WIDTHS = (200, 400, 800)
+THUMBNAIL_WIDTH = 400
+DETAIL_WIDTH = 800
+IMAGE_FORMAT = "webp"
+IMAGE_QUALITY = 82
+
+# Low-quality placeholder inlined as a data URI while the real image loads
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+
+# Hex digits of the SHA-256 kept in filenames
+HASH_LENGTH = 16
+
+FETCH_TIMEOUT = 5
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+INGEST_WORKERS = 8
+
+
+def variant_filename(image_hash: str, width: int) -> str:
+    return f"{image_hash}-{width}x{width}.{IMAGE_FORMAT}"
+
+
+def variant_url(image_hash: str, width: int) -> str:
+    """Public URL of a variant; changes whenever the source image changes."""
+    return f"{IMAGE_URL_PREFIX}/{variant_filename(image_hash, width)}"
+
+
+def variant_srcset(image_hash: str) -> str:
+    """srcset attribute listing every variant width."""
+    return ", ".join(f"{variant_url(image_hash, width)} {width}w" for width in VARIANT_WIDTHS)
+
+
+def has_variants(image_hash: str) -> bool:
+    """Whether every variant of an ingested image exists on disk."""
+    return all((IMAGE_DIR / variant_filename(image_hash, width)).exists() for width in VARIANT_WIDTHS)
+
+
+def _import_path(source: str, path: str) -> Path:
+    """Resolve a local image path, which must lie inside IMAGE_IMPORT_DIR."""
+    if not settings.image_import_dir:
+        raise ExternalServiceError(detail=f"Local image {source} not allowed; set IMAGE_IMPORT_DIR to import local files")
+    import_dir = Path(settings.image_import_dir).resolve()
+    resolved = (import_dir / path).resolve()
+    if not resolved.is_relative_to(import_dir):
+        raise ExternalServiceError(detail=f"Image {source} is outside the image import directory")
+    return resolved
+
+
+def load_source(source: str) -> bytes:
+    """Read an image from an http(s) URL, or a file in the image import directory.
+
+    image_url comes from supplier feeds, so local files (plain paths or
+    file:// URLs) are only read from IMAGE_IMPORT_DIR; relative paths are
+    resolved against it.
+
+    Raises:
+        ExternalServiceError: If the image cannot be fetched or is not allowed
+    """
+    parsed = urlparse(source)
+    if parsed.scheme in ("http", "https"):
+        try:
+            response = requests.get(source, timeout=FETCH_TIMEOUT, stream=True)
+            response.raise_for_status()
+            data = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        except requests.RequestException as e:
+            raise ExternalServiceError(detail=f"Could not fetch image {source}: {e}") from e
+    elif parsed.scheme in ("", "file"):
+        path = _import_path(source, unquote(parsed.path) if parsed.scheme == "file" else source)
+        try:
+            data = path.read_bytes()
+        except OSError as e:
+            raise ExternalServiceError(detail=f"Could not read image {source}: {e}") from e
+    else:
+        raise ExternalServiceError(detail=f"Unsupported image URL scheme: {source}")
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ExternalServiceError(detail=f"Image {source} is larger than {MAX_SOURCE_BYTES} bytes")
+    return data
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # Readers never see a half-written file under a final, immutable name
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _encode(image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, IMAGE_FORMAT, quality=quality, method=6)
+    return buffer.getvalue()
+
+
+@dataclass(frozen=True)
+class IngestedImage:
+    """Content hash of an ingested image plus its inline placeholder."""
+    image_hash: str
+    placeholder: str
+
+
+def ingest_image(data: bytes) -> IngestedImage:
+    """Generate all variants of an image and its placeholder.
+
+    Args:
+        data: Encoded source image
+
+    Returns:
+        The content hash identifying the variants, and the placeholder
+
+    Raises:
+        ConfigurationError: If Pillow is not installed
+        ExternalServiceError: If the data is not a readable image
+    """
+    if Image is None:
+        raise ConfigurationError(detail="Pillow is required to ingest product images")
+    image_hash = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            source = ImageOps.exif_transpose(source).convert("RGB")
+            IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+            for width in VARIANT_WIDTHS:
+                path = IMAGE_DIR / variant_filename(image_hash, width)
+                if not path.exists():
+                    resized = ImageOps.fit(source, (width, width), Image.Resampling.LANCZOS)
+                    _write_atomic(path, _encode(resized, IMAGE_QUALITY))
+            tiny = ImageOps.fit(source, (PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH), Image.Resampling.BOX)
+            placeholder = _encode(tiny, PLACEHOLDER_QUALITY)
+    except OSError as e:
+        raise ExternalServiceError(detail=f"Unreadable image: {e}") from e
+    return IngestedImage(
+        image_hash=image_hash,
+        placeholder=f"data:image/{IMAGE_FORMAT};base64,{base64.b64encode(placeholder).decode()}",
+    )
+
+
+@dataclass
+class ImageIngestReport:
+    """Outcome of an image ingest run."""
+    ingested: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def _needs_ingest(product: CatalogProduct) -> bool:
+    return not product.image_hash or not product.image_placeholder or not has_variants(product.image_hash)
+
+
+def _ingest_product(product: CatalogProduct) -> Tuple[int, Optional[IngestedImage], Optional[str]]:
+    try:
+        return product.id, ingest_image(load_source(product.image_url)), None
+    except (ConfigurationError, ExternalServiceError) as e:
+        return product.id, None, e.detail
+
+
+def ingest_product_images(product_ids: Optional[Iterable[int]] = None, force: bool = False) -> ImageIngestReport:
+    """Ingest product images that have no local variants yet.
+
+    Sources are fetched in parallel; products whose image cannot be fetched
+    keep rendering their remote image_url.
+
+    Args:
+        product_ids: Products to process; defaults to the whole catalog
+        force: Re-ingest even if variants already exist
+
+    Returns:
+        Counts of ingested, skipped and failed products
+    """
+    snapshot = get_snapshot()
+    if product_ids is None:
+        products = list(snapshot.products)
+    else:
+        products = [snapshot.by_id[i] for i in product_ids if i in snapshot.by_id]
+    todo = [p for p in products if force or _needs_ingest(p)]
+    report = ImageIngestReport(skipped=len(products) - len(todo))
+    if not todo:
+        return report
+
+    images: Dict[int, IngestedImage] = {}
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+        for product_id, image, error in pool.map(_ingest_product, todo):
+            if image is None:
+                report.failed += 1
+                report.errors.append(f"Product {product_id}: {error}")
+            else:
+                images[product_id] = image
+
+    changed = {
+        product_id: image for product_id, image in images.items()
+        if (snapshot.by_id[product_id].image_hash, snapshot.by_id[product_id].image_placeholder)
+        != (image.image_hash, image.placeholder)
+    }
+    if changed:
+        # ORM writes so the catalog snapshot is patched with the new images
+        with get_db_context() as db:
+            for product in db.query(Product).filter(Product.id.in_(list(changed))):
+                product.image_hash = changed[product.id].image_hash
+                product.image_placeholder = changed[product.id].placeholder
+            db.commit()
+    report.ingested = len(images)
+    app_logger.info(
+        f"Product images: {report.ingested} ingested, {report.skipped} up to date, {report.failed} failed"
+    )
+    for error in report.errors[:10]:
+        app_logger.warning(error)
+    return report
@@ -0,0 +1,182 @@
+"""Order placement.
+
+An order is placed in one transaction. Stock is taken with one conditional
+UPDATE per product (``stock = stock - n WHERE stock - held >= n``), so
+concurrent checkouts can never oversell. If any product is short, the whole
+order rolls back. Placements carry an idempotency key; retrying one, e.g.
+after a double-clicked button or a dropped connection, returns the order
+created by the first attempt instead of placing a second one.
+
+Stock held by other carts (see reservations) is not for sale: each UPDATE
+also subtracts the live holds of everyone but the customer, and the
+customer's holds on the ordered products are deleted in the same
+transaction.
+"""
+import secrets
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.core.exceptions import ConflictError, DatabaseError, ValidationError
+from app.core.logging import app_logger
+from app.models.order import Order, OrderLine, Reservation
+from app.models.product import Product
+from app.services.cart import Cart, cart_totals, to_cents
+from app.services.catalog import reload_products
+from app.services.reservations import held_by_others
+
+ORDER_STATUS_PLACED = "placed"
+
+# Order numbers are random so they reveal nothing about order volume
+_ORDER_NUMBER_BYTES = 5
+
+
+@dataclass(frozen=True)
+class PlacedOrder:
+    """Outcome of a placement; created is False when a retry returned an earlier order."""
+    id: int
+    order_number: str
+    total_cents: int
+    created: bool
+
+
+def _existing_order(session: Session, idempotency_key: str) -> Optional[PlacedOrder]:
+    row = session.execute(
+        select(Order.id, Order.order_number, Order.total_cents).where(Order.idempotency_key == idempotency_key)
+    ).first()
+    return PlacedOrder(row.id, row.order_number, row.total_cents, created=False) if row else None
+
+
+def _take_stock(session: Session, cart: Cart, customer_id: Optional[str]) -> Cart:
+    """Decrement stock for every line and return the cart repriced at current prices.
+
+    Units held by other carts are left alone; the customer's own holds on
+    the ordered products are released.
+
+    Raises:
+        ConflictError: If a product does not have enough unheld stock left
+    """
+    table = Product.__table__
+    now = time.time()
+    priced = Cart()
+    # A fixed lock order keeps concurrent orders from deadlocking on databases
+    # with row locks
+    for line in sorted(cart, key=lambda line: line.product_id):
+        price = session.execute(
+            update(table)
+            .where(
+                table.c.id == line.product_id,
+                table.c.stock - held_by_others(table.c.id, customer_id, now) >= line.quantity,
+            )
+            .values(stock=table.c.stock - line.quantity)
+            .returning(table.c.price)
+        ).scalar()
+        if price is None:
+            # Same connection: another one could wait on the lock this transaction holds
+            name = session.scalar(select(table.c.name).where(table.c.id == line.product_id)) or f"Product {line.product_id}"
+            raise ConflictError(detail=f"{name} does not have {line.quantity} available")
+        priced.add(line.product_id, to_cents(price), line.quantity)
+    if customer_id:
+        reservations = Reservation.__table__
+        session.execute(
+            delete(reservations).where(
+                reservations.c.holder == customer_id,
+                reservations.c.product_id.in_([line.product_id for line in cart]),
+            )
+        )
+    return priced
+
+
+def place_order(cart: Cart, idempotency_key: str, customer_id: Optional[str] = None) -> PlacedOrder:
+    """Place an order for the contents of a cart.
+
+    The customer's stock holds cover the order; units not held are only
+    taken if no other cart holds them. Blocking; call it from a worker
+    thread on the event loop.
+
+    Args:
+        cart: Cart to order; it is not modified
+        idempotency_key: Identifies this placement attempt across retries
+        customer_id: Browser storage id of the customer
+
+    Returns:
+        The placed order, or the earlier order placed with the same key
+
+    Raises:
+        ValidationError: If the cart is empty
+        ConflictError: If a product does not have enough unheld stock left
+        DatabaseError: If the order cannot be written
+    """
+    if not cart:
+        raise ValidationError(detail="Cannot place an order for an empty cart")
+    with SessionLocal() as session:
+        existing = _existing_order(session, idempotency_key)
+    if existing is not None:
+        _log_replay(existing)
+        return existing
+    with SessionLocal() as session:
+        order = _write_order(session, cart, idempotency_key, customer_id)
+    if order.created:
+        # Stock was updated outside the ORM; the connection is returned first,
+        # as refreshing the snapshot may need one
+        reload_products(line.product_id for line in cart)
+        app_logger.info(f"Order {order.order_number} placed: {cart.item_count} items, {order.total_cents} cents")
+    else:
+        _log_replay(order)
+    return order
+
+
+def _log_replay(order: PlacedOrder) -> None:
+    app_logger.info(f"Order {order.order_number} replayed for a retried placement")
+
+
+def _write_order(session: Session, cart: Cart, idempotency_key: str, customer_id: Optional[str]) -> PlacedOrder:
+    """Take the stock and insert the order in one transaction."""
+    try:
+        priced = _take_stock(session, cart, customer_id)
+        totals = cart_totals(priced)
+        order_number = f"ORD-{secrets.token_hex(_ORDER_NUMBER_BYTES).upper()}"
+        order_id = session.execute(
+            insert(Order).returning(Order.id),
+            {
+                "order_number": order_number,
+                "idempotency_key": idempotency_key,
+                "customer_id": customer_id,
+                "status": ORDER_STATUS_PLACED,
+                "subtotal_cents": totals.subtotal_cents,
+                "shipping_cents": totals.shipping_cents,
+                "tax_cents": totals.tax_cents,
+                "total_cents": totals.total_cents,
+                "created_at": datetime.now(timezone.utc),
+            },
+        ).scalar_one()
+        session.execute(insert(OrderLine), [
+            {
+                "order_id": order_id,
+                "product_id": line.product_id,
+                "quantity": line.quantity,
+                "unit_price_cents": line.unit_price_cents,
+            }
+            for line in priced
+        ])
+        session.commit()
+    except ConflictError:
+        session.rollback()
+        raise
+    except IntegrityError as e:
+        session.rollback()
+        # A concurrent attempt with the same key won the race
+        existing = _existing_order(session, idempotency_key)
+        if existing is not None:
+            return existing
+        raise DatabaseError(detail=f"Could not place order: {e.orig}") from e
+    except SQLAlchemyError as e:
+        session.rollback()
+        raise DatabaseError(detail=f"Could not place order: {e}") from e
+    return PlacedOrder(order_id, order_number, totals.total_cents, created=True)
@@ -0,0 +1,181 @@
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from app.services.catalog import CatalogProduct, CatalogSnapshot, get_snapshot, get_snapshot_async
+from app.services.images import DETAIL_WIDTH, THUMBNAIL_WIDTH, VARIANT_WIDTHS, variant_srcset, variant_url
+
+# Gallery thumbnails are local variants of this width
+GALLERY_WIDTH = 200
+GALLERY_IMAGES = 3
+
+_SIZED_IMAGE_RE = re.compile(r"^(https://source\.unsplash\.com/)\d+x\d+(/.*)$")
+
+
+def format_price(price: float) -> str:
+    return f"${price:,.2f}"
+
+
+def image_variant(image_url: str, size: Tuple[int, int]) -> str:
+    """URL of the image at the given size, when the image host supports it."""
+    match = _SIZED_IMAGE_RE.match(image_url)
+    if match is None:
+        return image_url
+    return f"{match.group(1)}{size[0]}x{size[1]}{match.group(2)}"
+
+
+def remote_srcset(image_url: str) -> str:
+    """srcset for a remote image, or "" if the host cannot resize it."""
+    if _SIZED_IMAGE_RE.match(image_url) is None:
+        return ""
+    return ", ".join(f"{image_variant(image_url, (width, width))} {width}w" for width in VARIANT_WIDTHS)
+
+
+def gallery_urls(product: CatalogProduct, category_products: Sequence[CatalogProduct]) -> Tuple[str, ...]:
+    """Local variant URLs for a product's gallery.
+
+    The product's own image comes first, followed by other products of its
+    category picked by product id, so galleries stay stable and cacheable.
+    Products whose image is not ingested yet are left out.
+    """
+    hashes: List[str] = [product.image_hash] if product.image_hash else []
+    count = len(category_products)
+    # Bounded, so a category without ingested images costs little
+    for i in range(min(count, GALLERY_IMAGES * 4)):
+        if len(hashes) == GALLERY_IMAGES:
+            break
+        image_hash = category_products[(product.id * GALLERY_IMAGES + i) % count].image_hash
+        if image_hash and image_hash not in hashes:
+            hashes.append(image_hash)
+    return tuple(variant_url(image_hash, GALLERY_WIDTH) for image_hash in hashes)
+
+
+@dataclass(frozen=True)
+class ProductView:
+    """Display-ready, immutable view of a catalog product.
+
+    Everything a card or detail page shows is derived once per catalog
+    version, so rendering is plain attribute access.
+    """
+    id: int
+    name: str
+    brand: str
+    category: str
+    description: str
+    price: float
+    price_display: str
+    url: str
+    brand_url: str
+    category_url: str
+    image_url: str
+    thumbnail_url: str
+    srcset: str
+    placeholder: Optional[str]
+    gallery_urls: Tuple[str, ...]
+    features: Tuple[str, ...]
+    stock: int
+    in_stock: bool
+
+    @classmethod
+    def from_product(cls, product: CatalogProduct, category_products: Sequence[CatalogProduct] = ()) -> "ProductView":
+        stock = product.stock or 0
+        if product.image_hash:
+            image_url = variant_url(product.image_hash, DETAIL_WIDTH)
+            thumbnail_url = variant_url(product.image_hash, THUMBNAIL_WIDTH)
+            srcset = variant_srcset(product.image_hash)
+        else:
+            # Not ingested (yet); fall back to the remote image
+            image_url = image_variant(product.image_url, (DETAIL_WIDTH, DETAIL_WIDTH))
+            thumbnail_url = image_variant(product.image_url, (THUMBNAIL_WIDTH, THUMBNAIL_WIDTH))
+            srcset = remote_srcset(product.image_url)
+        return cls(
+            id=product.id,
+            name=product.name,
+            brand=product.brand,
+            category=product.category,
+            description=product.description,
+            price=product.price,
+            price_display=format_price(product.price),
+            url=f"/product/{product.id}",
+            brand_url=f"/brand/{quote(product.brand)}",
+            category_url=f"/category/{quote(product.category)}",
+            image_url=image_url,
+            thumbnail_url=thumbnail_url,
+            srcset=srcset,
+            placeholder=product.image_placeholder,
+            gallery_urls=gallery_urls(product, category_products),
+            features=product.feature_list,
+            stock=stock,
+            in_stock=stock > 0,
+        )
+
+
+class ProductViewCache:
+    """Product views for one catalog index_version.
+
+    Views are built on first use, so a request only pays for the products
+    it shows, and are then shared by every request until the index_version
+    changes. Stock changes only rebuild the views of the products involved.
+    """
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.version = snapshot.version
+        self.index_version = snapshot.index_version
+        self._snapshot = snapshot
+        self._views: Dict[int, Tuple[CatalogProduct, ProductView]] = {}
+
+    def get(self, product: CatalogProduct) -> ProductView:
+        entry = self._views.get(product.id)
+        if entry is not None and entry[0] is product:
+            return entry[1]
+        # Products from an older snapshot still render correctly; only
+        # products of the current one are cached
+        snapshot = self._snapshot
+        view = ProductView.from_product(product, snapshot.by_category.get(product.category, ()))
+        if snapshot.by_id.get(product.id) is product:
+            self._views[product.id] = (product, view)
+        return view
+
+    def rebase(self, snapshot: CatalogSnapshot) -> None:
+        """Move to a snapshot with the same index_version, keeping the views."""
+        self._snapshot = snapshot
+        self.version = snapshot.version
+
+    def by_id(self, product_id: int) -> Optional[ProductView]:
+        product = self._snapshot.by_id.get(product_id)
+        return self.get(product) if product is not None else None
+
+
+# Cache for the current catalog version, replaced when the index_version changes
+_cache: Optional[ProductViewCache] = None
+_lock = threading.Lock()
+
+
+def _cache_for(snapshot: CatalogSnapshot) -> ProductViewCache:
+    global _cache
+    cache = _cache
+    if cache is None or cache.version != snapshot.version:
+        with _lock:
+            cache = _cache
+            if cache is not None and cache.version != snapshot.version and cache.index_version == snapshot.index_version:
+                cache.rebase(snapshot)
+            elif cache is None or cache.version != snapshot.version:
+                cache = _cache = ProductViewCache(snapshot)
+    return cache
+
+
+def product_view(product: CatalogProduct) -> ProductView:
+    """Return the cached view of a product."""
+    return _cache_for(get_snapshot()).get(product)
+
+
+def product_views(products: Iterable[CatalogProduct]) -> List[ProductView]:
+    """Return the cached views of several products."""
+    cache = _cache_for(get_snapshot())
+    return [cache.get(product) for product in products]
+
+
+async def get_product_view_async(product_id: int) -> Optional[ProductView]:
+    """Return the view of a product by id, or None if it does not exist."""
+    return _cache_for(await get_snapshot_async()).by_id(product_id)
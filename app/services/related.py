@@ -0,0 +1,334 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, insert, select, update
+
+from app.core.database import SessionLocal, get_async_db_context
+from app.core.logging import app_logger
+from app.models.product import CatalogState, RelatedProduct
+from app.services.catalog import (
+    CATALOG_STATE_ID,
+    CatalogProduct,
+    CatalogSnapshot,
+    add_catalog_listener,
+    get_snapshot,
+    get_snapshot_async,
+)
+
+# Number of related products stored (and shown) per product
+RELATED_LIMIT = 4
+
+# Neighbours considered on each side of a product in the price-ordered
+# category and brand views. Bounds the work per product to O(window) instead
+# of comparing against the whole catalog.
+CANDIDATE_WINDOW = 50
+
+# Score weights; they sum to 1 so scores stay in [0, 1]
+FEATURE_WEIGHT = 0.4
+BRAND_WEIGHT = 0.2
+CATEGORY_WEIGHT = 0.2
+PRICE_WEIGHT = 0.2
+
+# Rows written per executemany() call during a rebuild
+WRITE_BATCH_SIZE = 5000
+
+# Seconds the background refresh waits after a catalog change, so a burst
+# of writes (e.g. several orders) is recomputed in one pass
+REFRESH_DELAY = 0.5
+# Seconds before a failed refresh is retried
+RETRY_DELAY = 5.0
+
+# Changed product ids awaiting a refresh (None means everything), plus
+# unchanged products whose candidate windows shifted because of them
+_pending: Optional[Set[int]] = set()
+_shifted: Set[int] = set()
+_pending_changed = threading.Condition()
+_refresh_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+
+
+def score_related(product: CatalogProduct, other: CatalogProduct) -> float:
+    """Similarity of two products from feature overlap, brand, category and price.
+
+    Args:
+        product: The product being viewed
+        other: A candidate related product
+
+    Returns:
+        A score between 0 and 1, higher is more similar
+    """
+    union = product.feature_mask | other.feature_mask
+    overlap = (product.feature_mask & other.feature_mask).bit_count() / union.bit_count() if union else 0.0
+    highest = max(product.price, other.price)
+    proximity = 1 - abs(product.price - other.price) / highest if highest > 0 else 1.0
+    return (
+        FEATURE_WEIGHT * overlap
+        + BRAND_WEIGHT * (product.brand == other.brand)
+        + CATEGORY_WEIGHT * (product.category == other.category)
+        + PRICE_WEIGHT * proximity
+    )
+
+
+def _candidates(snapshot: CatalogSnapshot, product: CatalogProduct) -> Dict[int, CatalogProduct]:
+    """Products near this one in price within its category and its brand."""
+    candidates: Dict[int, CatalogProduct] = {}
+    for products, keys in (
+        snapshot.sorted_view(category=product.category),
+        snapshot.sorted_view(brand=product.brand),
+    ):
+        position = bisect_left(keys, (product.price, product.id))
+        for other in products[max(0, position - CANDIDATE_WINDOW):position + CANDIDATE_WINDOW + 1]:
+            if other.id != product.id:
+                candidates[other.id] = other
+    return candidates
+
+
+def compute_related(
+    snapshot: CatalogSnapshot,
+    product: CatalogProduct,
+    limit: int = RELATED_LIMIT,
+) -> List[Tuple[int, float]]:
+    """Top-k related products for one product.
+
+    Args:
+        snapshot: Catalog snapshot to pick candidates from
+        product: The product to compute related products for
+        limit: Number of related products to keep
+
+    Returns:
+        (related_id, score) pairs, best first; ties go to the lower id
+    """
+    scored = ((score_related(product, other), -other.id) for other in _candidates(snapshot, product).values())
+    return [(-negative_id, score) for score, negative_id in heapq.nlargest(limit, scored)]
+
+
+def _rows_for(snapshot: CatalogSnapshot, product_ids: Iterable[int]) -> Iterable[dict]:
+    for product_id in product_ids:
+        product = snapshot.by_id.get(product_id)
+        if product is None:
+            continue
+        for rank, (related_id, score) in enumerate(compute_related(snapshot, product)):
+            yield {"product_id": product_id, "related_id": related_id, "rank": rank, "score": score}
+
+
+def _write_related(session, snapshot: CatalogSnapshot, product_ids: Optional[Set[int]]) -> int:
+    """Replace stored related lists; product_ids=None rewrites the whole table."""
+    if product_ids is None:
+        session.execute(delete(RelatedProduct))
+        targets: Iterable[int] = snapshot.by_id
+    else:
+        ids = list(product_ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            session.execute(delete(RelatedProduct).where(RelatedProduct.product_id.in_(chunk)))
+        targets = ids
+
+    written = 0
+    batch: List[dict] = []
+    for row in _rows_for(snapshot, targets):
+        batch.append(row)
+        if len(batch) >= WRITE_BATCH_SIZE:
+            session.execute(insert(RelatedProduct), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        session.execute(insert(RelatedProduct), batch)
+        written += len(batch)
+    return written
+
+
+def _affected_ids(session, snapshot: CatalogSnapshot, changed_ids: Set[int]) -> Set[int]:
+    """Products whose related lists may change when changed_ids change.
+
+    That is the changed products themselves, products that currently list
+    one of them, and products that could now list one of them.
+    """
+    affected = set(changed_ids)
+    ids = list(changed_ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        affected.update(session.scalars(
+            select(RelatedProduct.product_id).where(RelatedProduct.related_id.in_(chunk))
+        ))
+    for product_id in changed_ids:
+        product = snapshot.by_id.get(product_id)
+        if product is not None:
+            affected.update(_candidates(snapshot, product))
+    return affected
+
+
+def rebuild_related_products(
+    product_ids: Optional[Iterable[int]] = None,
+    also_refresh: Iterable[int] = (),
+) -> int:
+    """Recompute and store related products.
+
+    Uses its own session so it can run right after another session commits.
+
+    Args:
+        product_ids: Changed products; None rebuilds the whole table
+        also_refresh: Unchanged products whose own lists must be recomputed
+
+    Returns:
+        Number of related_products rows written
+    """
+    snapshot = get_snapshot()
+    with _refresh_lock:
+        session = SessionLocal()
+        try:
+            if product_ids is None:
+                targets = None
+            else:
+                # Deleted products are included: their own rows are removed and
+                # products listing them are recomputed
+                targets = _affected_ids(session, snapshot, set(product_ids)) | set(also_refresh)
+            written = _write_related(session, snapshot, targets)
+            if targets is None:
+                session.execute(
+                    update(CatalogState)
+                    .where(CatalogState.id == CATALOG_STATE_ID)
+                    .values(related_revision=snapshot.revision)
+                )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    scope = "all products" if targets is None else f"{len(targets)} products"
+    app_logger.info(f"Related products refreshed for {scope} ({written} rows, catalog v{snapshot.version})")
+    return written
+
+
+def ensure_related_products() -> None:
+    """Build the related_products table if it is empty or older than the catalog.
+
+    The table is empty after migrating, and older than the catalog after an
+    import run while no server was up.
+    """
+    snapshot = get_snapshot()
+    session = SessionLocal()
+    try:
+        empty = session.scalar(select(RelatedProduct.product_id).limit(1)) is None
+        related_revision = session.scalar(
+            select(CatalogState.related_revision).where(CatalogState.id == CATALOG_STATE_ID)
+        )
+    finally:
+        session.close()
+    if (empty or related_revision != snapshot.revision) and len(snapshot):
+        mark_stale(None)
+        refresh_pending_related()
+
+
+def mark_stale(product_ids: Optional[Set[int]], shifted: Iterable[int] = ()) -> None:
+    """Queue changed products for a related-products refresh.
+
+    Args:
+        product_ids: Changed product ids; None queues a full rebuild
+        shifted: Unchanged products that only need their own lists recomputed
+    """
+    global _pending, _refresher
+    with _pending_changed:
+        if product_ids is None or _pending is None:
+            _pending = None
+            _shifted.clear()
+        else:
+            _pending |= product_ids
+            _shifted.update(shifted)
+        if _refresher is None:
+            _refresher = threading.Thread(target=_run_refresher, name="related-refresh", daemon=True)
+            _refresher.start()
+        _pending_changed.notify()
+
+
+def _run_refresher() -> None:
+    while True:
+        with _pending_changed:
+            while _pending is not None and not _pending:
+                _pending_changed.wait()
+        # Let the rest of the burst arrive before recomputing
+        time.sleep(REFRESH_DELAY)
+        try:
+            refresh_pending_related()
+        except Exception as e:
+            # The products stay queued
+            app_logger.error(f"Related products refresh failed, retrying in {RETRY_DELAY}s: {e}")
+            time.sleep(RETRY_DELAY)
+
+
+def refresh_pending_related() -> None:
+    """Recompute related lists for products queued by catalog changes."""
+    global _pending
+    with _pending_changed:
+        pending, _pending = _pending, set()
+        shifted = set(_shifted)
+        _shifted.clear()
+    if pending is None or pending:
+        try:
+            rebuild_related_products(pending, shifted)
+        except Exception:
+            mark_stale(pending, shifted)
+            raise
+
+
+def _scoring_key(product: Optional[CatalogProduct]) -> Optional[tuple]:
+    if product is None:
+        return None
+    return (product.brand, product.category, product.price, product.feature_mask)
+
+
+def _on_catalog_change(changed_ids: Optional[Set[int]], previous: CatalogSnapshot) -> None:
+    # Products that were near a changed product before the change see their
+    # candidate windows shift, and only the previous snapshot knows which
+    # they are. Products near its new position are added on refresh.
+    if changed_ids is None:
+        mark_stale(None)
+        return
+    # Edits that leave every scoring input alone (stock, images, copy) keep
+    # all related lists valid
+    current = get_snapshot().by_id
+    changed_ids = {
+        product_id for product_id in changed_ids
+        if _scoring_key(previous.by_id.get(product_id)) != _scoring_key(current.get(product_id))
+    }
+    if not changed_ids:
+        return
+    shifted: Set[int] = set()
+    for product_id in changed_ids:
+        product = previous.by_id.get(product_id)
+        if product is not None:
+            shifted.update(_candidates(previous, product))
+    mark_stale(set(changed_ids), shifted)
+
+
+# Catalog writes only queue the ids; a background thread recomputes them
+# shortly after, outside the writer's commit and the readers' requests.
+add_catalog_listener(_on_catalog_change)
+
+
+async def get_related_products_async(product_id: int, limit: int = RELATED_LIMIT) -> List[CatalogProduct]:
+    """Related products for the product page, read with one bounded query.
+
+    Lists of recently changed products may lag the catalog until the
+    background refresh has run.
+
+    Args:
+        product_id: The product being viewed
+        limit: Maximum number of related products
+
+    Returns:
+        Related products, most similar first
+    """
+    async with get_async_db_context() as db:
+        result = await db.execute(
+            select(RelatedProduct.related_id)
+            .where(RelatedProduct.product_id == product_id)
+            .order_by(RelatedProduct.rank)
+            .limit(limit)
+        )
+        related_ids = [row[0] for row in result]
+    by_id = (await get_snapshot_async()).by_id
+    return [by_id[related_id] for related_id in related_ids if related_id in by_id]
@@ -0,0 +1,223 @@
+"""Inventory reservations.
+
+Adding a product to a cart places a hold on its stock for RESERVATION_TTL
+seconds. Any activity on the cart extends all of its holds. Other shoppers
+can only add what is neither sold nor held: available = stock - held.
+
+Holds are rows of the reservations table, next to Product.stock, so every
+app server sees the same holds. A hold counts until its expires_at passes,
+whether or not it was swept yet; order placement subtracts the live holds
+of other carts in its conditional stock UPDATE (see orders). Holds of a
+product are changed with its row locked, so two carts cannot both take the
+last units. The sweeper deletes expired rows through the expires_at index:
+expiring k of n holds costs O(k log n) and never scans the live ones.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import and_, delete, func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.core.config import settings
+from app.core.database import SessionLocal, get_async_db_context
+from app.core.exceptions import ConflictError, DatabaseError
+from app.core.logging import app_logger
+from app.models.order import Reservation
+from app.models.product import Product
+
+# Deadlines are only pushed back when they move by at least this many
+# seconds, so a burst of cart activity costs one write, not one per click
+EXTEND_GRANULARITY = 30.0
+
+# Seconds between sweeps; expired holds stop counting before they are swept
+SWEEP_INTERVAL = 30.0
+
+
+@dataclass
+class ReservationStats:
+    holders: int
+    holds: int
+    units_held: int
+
+
+def held_by_others(product_id: ColumnElement, holder: Optional[str], now: float) -> ColumnElement:
+    """Units of a product held by live holds of every cart but holder, as a scalar subquery."""
+    table = Reservation.__table__
+    condition = and_(table.c.product_id == product_id, table.c.expires_at > now)
+    if holder:
+        condition = and_(condition, table.c.holder != holder)
+    return select(func.coalesce(func.sum(table.c.quantity), 0)).where(condition).scalar_subquery()
+
+
+class ReservationManager:
+    """Stock holds by holder (browser storage id) and product.
+
+    Methods other than the async ones block on the database; call them from
+    a worker thread on the event loop.
+    """
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self._clock = clock
+
+    def _available_query(self, product_id: int, holder: Optional[str], now: float):
+        products = Product.__table__
+        return select(func.coalesce(products.c.stock, 0) - held_by_others(products.c.id, holder, now)).where(
+            products.c.id == product_id
+        )
+
+    def _extend(self, session: Session, holder: str, now: float) -> None:
+        table = Reservation.__table__
+        deadline = now + self.ttl
+        session.execute(
+            update(table)
+            .where(
+                table.c.holder == holder,
+                table.c.expires_at > now,
+                table.c.expires_at < deadline - EXTEND_GRANULARITY,
+            )
+            .values(expires_at=deadline)
+        )
+
+    def available(self, product_id: int, holder: Optional[str] = None) -> int:
+        """Units a holder can have in total: stock minus everyone else's holds."""
+        with SessionLocal() as session:
+            return max(0, session.scalar(self._available_query(product_id, holder, self._clock())) or 0)
+
+    async def available_async(self, product_id: int, holder: Optional[str] = None) -> int:
+        async with get_async_db_context() as db:
+            return max(0, await db.scalar(self._available_query(product_id, holder, self._clock())) or 0)
+
+    def held(self, holder: str, product_id: int) -> int:
+        table = Reservation.__table__
+        with SessionLocal() as session:
+            return session.scalar(
+                select(table.c.quantity).where(
+                    table.c.holder == holder,
+                    table.c.product_id == product_id,
+                    table.c.expires_at > self._clock(),
+                )
+            ) or 0
+
+    def reserve(self, holder: str, product_id: int, quantity: int) -> None:
+        """Set a holder's hold on a product to `quantity` units (0 releases it).
+
+        The holder's other holds are extended as well.
+
+        Raises:
+            ConflictError: If fewer units are available
+            DatabaseError: If the hold cannot be written
+        """
+        if quantity <= 0:
+            self.release(holder, product_id)
+            return
+        table = Reservation.__table__
+        products = Product.__table__
+        now = self._clock()
+        with SessionLocal() as session:
+            try:
+                # A no-op write that locks the product row (and takes the
+                # SQLite write lock), so holds of one product change one at a time
+                stock = session.execute(
+                    update(products)
+                    .where(products.c.id == product_id)
+                    .values(stock=products.c.stock)
+                    .returning(products.c.stock)
+                ).first()
+                current = session.scalar(
+                    select(table.c.quantity).where(
+                        table.c.holder == holder, table.c.product_id == product_id, table.c.expires_at > now
+                    )
+                ) or 0
+                if stock is None:
+                    raise ConflictError(detail="Only 0 available")
+                if quantity > current:
+                    available = (stock[0] or 0) - session.scalar(select(held_by_others(product_id, holder, now)))
+                    if quantity > available:
+                        raise ConflictError(detail=f"Only {max(0, available)} available")
+                session.execute(delete(table).where(table.c.holder == holder, table.c.product_id == product_id))
+                session.execute(
+                    insert(table).values(
+                        holder=holder, product_id=product_id, quantity=quantity, expires_at=now + self.ttl
+                    )
+                )
+                self._extend(session, holder, now)
+                session.commit()
+            except SQLAlchemyError as e:
+                session.rollback()
+                raise DatabaseError(detail=f"Could not reserve product {product_id}: {e}") from e
+
+    def release(self, holder: str, product_id: Optional[int] = None) -> None:
+        """Release one hold of a holder, or all of them.
+
+        Raises:
+            DatabaseError: If the holds cannot be deleted
+        """
+        table = Reservation.__table__
+        statement = delete(table).where(table.c.holder == holder)
+        if product_id is not None:
+            statement = statement.where(table.c.product_id == product_id)
+        with SessionLocal() as session:
+            try:
+                session.execute(statement)
+                self._extend(session, holder, self._clock())
+                session.commit()
+            except SQLAlchemyError as e:
+                session.rollback()
+                raise DatabaseError(detail=f"Could not release holds: {e}") from e
+
+    def touch(self, holder: str) -> None:
+        """Extend every hold of a holder after cart activity.
+
+        Raises:
+            DatabaseError: If the holds cannot be updated
+        """
+        with SessionLocal() as session:
+            try:
+                self._extend(session, holder, self._clock())
+                session.commit()
+            except SQLAlchemyError as e:
+                session.rollback()
+                raise DatabaseError(detail=f"Could not extend holds: {e}") from e
+
+    async def expire(self, now: Optional[float] = None) -> int:
+        """Delete every hold whose deadline passed.
+
+        Returns:
+            The number of holds deleted
+        """
+        table = Reservation.__table__
+        now = self._clock() if now is None else now
+        async with get_async_db_context() as db:
+            result = await db.execute(delete(table).where(table.c.expires_at <= now))
+        return result.rowcount
+
+    def stats(self) -> ReservationStats:
+        table = Reservation.__table__
+        with SessionLocal() as session:
+            holders, holds, units_held = session.execute(
+                select(
+                    func.count(func.distinct(table.c.holder)),
+                    func.count(),
+                    func.coalesce(func.sum(table.c.quantity), 0),
+                ).where(table.c.expires_at > self._clock())
+            ).one()
+        return ReservationStats(holders=holders, holds=holds, units_held=units_held)
+
+    async def run_sweeper(self) -> None:
+        """Delete expired holds every SWEEP_INTERVAL seconds; runs until cancelled."""
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                released = await self.expire()
+            except SQLAlchemyError as e:
+                app_logger.error(f"Could not sweep expired stock holds: {e}")
+                continue
+            if released:
+                app_logger.debug(f"Released {released} expired stock holds")
+
+
+reservations = ReservationManager(ttl=settings.reservation_ttl)
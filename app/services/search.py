@@ -0,0 +1,180 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Mapping, Optional
+
+from sqlalchemy import text
+
+from app.core.database import get_async_db_context
+from app.services.catalog import CatalogProduct, get_snapshot_async
+from app.services.facets import FacetIndex, FacetResult, get_facet_index_async
+
+# BM25 column weights: name, brand, category, description, features
+BM25_WEIGHTS = (10.0, 6.0, 3.0, 1.0, 2.0)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_SEARCH_SQL = text(
+    f"""SELECT rowid FROM products_fts
+    WHERE products_fts MATCH :query
+    ORDER BY bm25(products_fts, {', '.join(str(w) for w in BM25_WEIGHTS)})
+    LIMIT :limit"""
+)
+
+# Every match, unranked: totals and facet counts cover the whole match set
+_MATCH_SQL = text("SELECT rowid FROM products_fts WHERE products_fts MATCH :query")
+
+# Every match, best first; read only as far as the requested page
+_RANKED_SQL = text(
+    f"""SELECT rowid FROM products_fts
+    WHERE products_fts MATCH :query
+    ORDER BY bm25(products_fts, {', '.join(str(w) for w in BM25_WEIGHTS)})"""
+)
+
+_SUGGEST_SQL = text(
+    """SELECT rowid FROM products_fts
+    WHERE products_fts MATCH :query
+    ORDER BY rank
+    LIMIT :limit"""
+)
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    """A typeahead suggestion."""
+    id: int
+    name: str
+    brand: str
+
+
+def build_match_query(query: str, prefix: bool = True, columns: Optional[Iterable[str]] = None) -> Optional[str]:
+    """Turn free text into a safe FTS5 MATCH expression.
+
+    Every word is quoted, so FTS5 operators typed by customers are treated
+    as plain text. Terms are AND-ed; the last one is a prefix query when
+    ``prefix`` is set so results update while the customer types.
+
+    Args:
+        query: Text typed by the customer
+        prefix: Whether the last term matches as a prefix
+        columns: Optional columns to restrict the match to
+
+    Returns:
+        The MATCH expression, or None if the query has no searchable words
+    """
+    tokens = _TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    if prefix:
+        terms[-1] += "*"
+    expression = " ".join(terms)
+    if columns:
+        expression = f"{{{' '.join(columns)}}} : ({expression})"
+    return expression
+
+
+async def _match_ids(sql, match: str, limit: Optional[int] = None) -> List[int]:
+    async with get_async_db_context() as db:
+        result = await db.execute(sql, {"query": match, "limit": limit})
+        return [row[0] for row in result]
+
+
+async def _ranked_products(index: FacetIndex, match: str, bits: int, count: int) -> List[CatalogProduct]:
+    """The first `count` products of a bitmap, best BM25 score first.
+
+    Ranked ids are streamed and reading stops once the page is filled, so
+    only the ids up to the requested page cross the driver.
+    """
+    ranked: List[CatalogProduct] = []
+    if count <= 0:
+        return ranked
+    # Bytes, so a membership test is O(1) instead of a shift of the whole int
+    flags = bits.to_bytes((len(index.products) + 7) // 8, "little")
+    async with get_async_db_context() as db:
+        result = await db.stream(_RANKED_SQL, {"query": match})
+        try:
+            async for (product_id,) in result:
+                position = index.position(product_id)
+                if position is not None and flags[position >> 3] >> (position & 7) & 1:
+                    ranked.append(index.products[position])
+                    if len(ranked) == count:
+                        break
+        finally:
+            await result.close()
+    return ranked
+
+
+async def full_text_search_async(query: str, limit: int = 24) -> List[CatalogProduct]:
+    """Search names, brands, categories, descriptions and features.
+
+    Args:
+        query: Text typed by the customer
+        limit: Maximum number of products to return
+
+    Returns:
+        Matching products, best BM25 score first
+    """
+    match = build_match_query(query)
+    if match is None:
+        return []
+    ids = await _match_ids(_SEARCH_SQL, match, limit)
+    by_id = (await get_snapshot_async()).by_id
+    return [by_id[product_id] for product_id in ids if product_id in by_id]
+
+
+async def suggest_async(prefix: str, limit: int = 8) -> List[Suggestion]:
+    """Typeahead suggestions matching the prefix against name and brand.
+
+    Args:
+        prefix: Partial text typed by the customer
+        limit: Maximum number of suggestions
+
+    Returns:
+        Suggestions ordered by relevance
+    """
+    match = build_match_query(prefix, columns=("name", "brand"))
+    if match is None:
+        return []
+    ids = await _match_ids(_SUGGEST_SQL, match, limit)
+    by_id = (await get_snapshot_async()).by_id
+    return [
+        Suggestion(id=product_id, name=by_id[product_id].name, brand=by_id[product_id].brand)
+        for product_id in ids if product_id in by_id
+    ]
+
+
+async def search_catalog_async(
+    query: str,
+    selection: Mapping[str, Iterable[str]],
+    limit: int = 24,
+    offset: int = 0,
+) -> FacetResult:
+    """Combine full-text matching with facet filters and counts.
+
+    Without a query this is a plain facet search (cheapest first). With a
+    query, the total and facet counts cover every text match, and the
+    requested page is returned in BM25 order.
+
+    Args:
+        query: Free text, may be empty
+        selection: Mapping of facet name to selected values
+        limit: Maximum number of products to return
+        offset: Number of matching products to skip
+
+    Returns:
+        The matching products and per-facet counts
+    """
+    index = await get_facet_index_async()
+    match = build_match_query(query) if query else None
+    if match is None:
+        return index.search(selection, limit=limit, offset=offset)
+
+    matched_ids = await _match_ids(_MATCH_SQL, match)
+    result = index.search(selection, limit=0, within=index.bitmap_for_ids(matched_ids))
+    ranked = await _ranked_products(index, match, result.bits, offset + limit)
+    return FacetResult(
+        total=result.total,
+        items=tuple(ranked[offset:]),
+        facets=result.facets,
+        bits=result.bits,
+    )
@@ -0,0 +1 @@
+"""Standalone benchmarks, run with ``python -m benchmarks.<name>``."""
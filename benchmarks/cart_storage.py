@@ -0,0 +1,162 @@
+"""Cart storage write amplification.
+
+Replays a checkout rush, in which many users click through a short burst of
+cart changes each, against every cart store. Each store runs with and without
+write coalescing. The baseline is a JSON file per user rewritten on every
+change, which is what NiceGUI's app.storage.user does.
+
+Usage:
+    python -m benchmarks.cart_storage [--users 500] [--burst 8] [--redis-url redis://localhost:6379/15]
+
+Without --redis-url the Redis backend runs against fakeredis, an in-process
+stand-in, so only its round trips and payload bytes are meaningful.
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from app.services.cart import Cart
+from app.services.cart_store import (
+    CartStore,
+    CoalescingCartWriter,
+    RedisCartStore,
+    SQLiteCartStore,
+    StoredCart,
+    _encode,
+)
+
+# Rush length in seconds; user bursts start uniformly within it
+RUSH_SECONDS = 2.0
+# Seconds between two clicks of one user
+CLICK_GAP = 0.05
+PRODUCTS = 50
+
+
+class JsonFileCartStore(CartStore):
+    """Baseline: one JSON file per user, rewritten on every change."""
+    name = "json-files"
+
+    def __init__(self, directory: Path):
+        super().__init__()
+        self.directory = directory
+
+    def load(self, storage_id: str) -> StoredCart:
+        path = self.directory / f"{storage_id}.json"
+        return json.loads(path.read_text()) if path.exists() else None
+
+    def _write(self, carts: Mapping[str, StoredCart], encoded: Mapping[str, str]) -> None:
+        for storage_id in carts:
+            path = self.directory / f"{storage_id}.json"
+            if storage_id in encoded:
+                path.write_text(json.dumps({"cart": json.loads(encoded[storage_id])}))
+            else:
+                path.unlink(missing_ok=True)
+
+
+def _disk_bytes() -> Optional[int]:
+    # Bytes this process passed to write(), including WAL pages and headers
+    try:
+        for line in Path("/proc/self/io").read_text().splitlines():
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rush_schedule(users: int, burst: int, seed: int = 7) -> List[Tuple[float, str, int]]:
+    """(time, storage id, product id) for every click of the rush, in time order."""
+    rng = random.Random(seed)
+    events = []
+    for user in range(users):
+        start = rng.uniform(0, RUSH_SECONDS)
+        for click in range(burst):
+            events.append((start + click * CLICK_GAP, f"user-{user:05d}", rng.randint(1, PRODUCTS)))
+    events.sort()
+    return events
+
+
+def replay(store: CartStore, events: List[Tuple[float, str, int]], delay: float) -> Dict[str, float]:
+    """Apply the rush to a store and return what it cost."""
+    writer = CoalescingCartWriter(store, delay)
+    carts: Dict[str, Cart] = {}
+    logical_bytes = 0
+    disk_before = _disk_bytes()
+    started = time.perf_counter()
+    for at, storage_id, product_id in events:
+        if delay > 0:
+            # Real time matters only when writes are coalesced over time
+            wait = started + at - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        cart = carts.setdefault(storage_id, Cart())
+        cart.add(product_id, 100 * product_id + 99)
+        data = cart.to_storage()
+        logical_bytes += len(_encode(data))
+        writer.save(storage_id, data)
+    writer.close()
+    disk_after = _disk_bytes()
+    return {
+        "mutations": writer.mutations,
+        "writes": store.stats.writes,
+        "rows": store.stats.rows,
+        "payload_bytes": store.stats.bytes,
+        "logical_bytes": logical_bytes,
+        "disk_bytes": disk_after - disk_before if disk_before is not None and store.name != "redis" else None,
+    }
+
+
+def _redis_client(url: Optional[str]):
+    if url:
+        import redis
+        client = redis.Redis.from_url(url)
+        client.flushdb()
+        return client
+    try:
+        import fakeredis
+    except ImportError:
+        return None
+    return fakeredis.FakeRedis()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare cart store write amplification under a checkout rush.")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--burst", type=int, default=8, help="Cart changes per user")
+    parser.add_argument("--delay", type=float, default=0.5, help="Coalescing delay in seconds")
+    parser.add_argument("--redis-url", help="Real Redis to benchmark (its current database is flushed)")
+    args = parser.parse_args(argv)
+
+    events = rush_schedule(args.users, args.burst)
+    print(f"{args.users} users x {args.burst} changes = {len(events)} cart changes over {RUSH_SECONDS}s\n")
+    print(f"{'store':<12} {'coalescing':>10} {'writes':>8} {'rows':>8} {'payload KB':>11} {'disk KB':>9} {'amplification':>14}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [("json-files", 0.0), ("sqlite", 0.0), ("sqlite", args.delay), ("redis", 0.0), ("redis", args.delay)]
+        for name, delay in runs:
+            if name == "json-files":
+                store: Optional[CartStore] = JsonFileCartStore(Path(tmp))
+            elif name == "sqlite":
+                store = SQLiteCartStore(str(Path(tmp) / f"carts-{delay}.db"))
+            else:
+                client = _redis_client(args.redis_url)
+                if client is None:
+                    print(f"{name:<12} skipped: install fakeredis or pass --redis-url")
+                    continue
+                store = RedisCartStore(client=client)
+            result = replay(store, events, delay)
+            physical = result["disk_bytes"] if result["disk_bytes"] is not None else result["payload_bytes"]
+            disk = f"{result['disk_bytes'] / 1024:9.0f}" if result["disk_bytes"] is not None else f"{'-':>9}"
+            print(
+                f"{name:<12} {f'{delay}s' if delay else 'off':>10} {result['writes']:>8} {result['rows']:>8} "
+                f"{result['payload_bytes'] / 1024:>11.0f} {disk} {physical / result['logical_bytes']:>13.2f}x"
+            )
+    print("\namplification = bytes written (disk for files, payload for Redis) / bytes of cart states changed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Cost of catalog snapshot updates at catalog scale.
+
+Builds a synthetic catalog in memory (no database), caches the sorted
+views listing pages use, then measures:
+
+- build: a full CatalogSnapshot, as refresh_catalog() makes
+- stock patch: patched() with one product's stock changed, as every order
+  makes through reload_products()
+- price patch: patched() with one product moved in the price order
+- insert / delete: patched() adding or removing one product
+
+and checks that each patch leaves the same indexes as a full build. The
+facet index (app.services.facets) is measured the same way: a full build,
+and following each patch by rebasing or patching it.
+
+Usage:
+    python -m benchmarks.catalog_snapshot [--products 100000] [--repeat 20]
+"""
+import argparse
+import random
+import time
+from dataclasses import replace
+from typing import Callable, List, Optional
+
+from app.services.catalog import SORT_KEYS, CatalogProduct, CatalogSnapshot, feature_dictionary
+from app.services.facets import MAX_INDEX_PATCH, FacetIndex
+
+CATEGORIES = ["Diving", "Chronograph", "Dress", "Pilot", "Field", "GMT"]
+BRANDS = ["Rolex", "Omega", "Patek Philippe", "Audemars Piguet", "Cartier", "IWC", "Breitling", "Tudor"]
+FEATURES = ["Sapphire crystal", "Date display", "Chronograph", "Water resistant", "Automatic", "GMT", "Luminous"]
+
+
+def make_catalog(count: int, seed: int = 1) -> List[CatalogProduct]:
+    rnd = random.Random(seed)
+    products = []
+    for product_id in range(1, count + 1):
+        features = tuple(rnd.sample(FEATURES, rnd.randint(1, 3)))
+        products.append(CatalogProduct(
+            id=product_id,
+            name=f"Watch {rnd.randint(0, 10 ** 6)}",
+            brand=rnd.choice(BRANDS),
+            category=rnd.choice(CATEGORIES),
+            price=round(rnd.uniform(200, 50000), 2),
+            description="",
+            image_url="",
+            stock=rnd.randint(0, 20),
+            features=",".join(features),
+            feature_list=features,
+            feature_mask=feature_dictionary.encode(features),
+        ))
+    return products
+
+
+def warm_views(snapshot: CatalogSnapshot) -> None:
+    for sort in SORT_KEYS:
+        snapshot.sorted_view(sort=sort)
+        for category in CATEGORIES:
+            snapshot.sorted_view(category=category, sort=sort)
+        for brand in BRANDS:
+            snapshot.sorted_view(brand=brand, sort=sort)
+
+
+def same_indexes(patched: CatalogSnapshot) -> bool:
+    full = CatalogSnapshot(patched.products)
+    views_match = all(
+        patched.sorted_view(category, brand, sort) == full.sorted_view(category, brand, sort)
+        for category, brand, sort in list(patched._sorted_views) + list(patched._stale_views)
+    )
+    return (
+        list(patched.by_id.items()) == list(full.by_id.items())
+        and list(patched.by_category.items()) == list(full.by_category.items())
+        and list(patched.by_brand.items()) == list(full.by_brand.items())
+        and patched.by_price == full.by_price
+        and patched.features == full.features
+        and views_match
+    )
+
+
+def measure(snapshot: CatalogSnapshot, repeat: int, change: Callable[[CatalogSnapshot, int], CatalogSnapshot]):
+    started = time.perf_counter()
+    for i in range(repeat):
+        snapshot = change(snapshot, i)
+    return (time.perf_counter() - started) / repeat * 1000, snapshot
+
+
+def follow(index: FacetIndex, snapshot: CatalogSnapshot) -> FacetIndex:
+    """The facet index for a snapshot patched once from the index's snapshot."""
+    if snapshot.index_version == index.index_version:
+        return index.rebased(snapshot)
+    if snapshot.index_changes is not None and len(snapshot.index_changes[1]) <= MAX_INDEX_PATCH:
+        return index.patched(snapshot, snapshot.index_changes[1])
+    return FacetIndex(snapshot)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure catalog snapshot builds and patches.")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    products = make_catalog(args.products)
+    started = time.perf_counter()
+    base = CatalogSnapshot(products)
+    print(f"{'build':<14} {(time.perf_counter() - started) * 1000:>9.2f} ms  ({args.products} products)")
+    warm_views(base)
+    started = time.perf_counter()
+    facets = FacetIndex(base)
+    print(f"{'facet build':<14} {(time.perf_counter() - started) * 1000:>9.2f} ms")
+
+    middle = args.products // 2
+    changes = {
+        "stock patch": lambda s, i: s.patched([replace(s.by_id[middle + i], stock=i)]),
+        "price patch": lambda s, i: s.patched([replace(s.by_id[middle + i], price=s.by_id[middle + i].price * 1.1)]),
+        "insert": lambda s, i: s.patched([replace(s.by_id[middle], id=args.products + 1 + i)]),
+        "delete": lambda s, i: s.patched(deleted_ids=[middle + i]),
+    }
+    for name, change in changes.items():
+        per_patch, patched = measure(base, args.repeat, change)
+        kept = "kept" if patched.index_version == base.index_version else "bumped"
+        check = "ok" if same_indexes(patched) else "MISMATCH"
+        print(f"{name:<14} {per_patch:>9.2f} ms  index_version {kept}, indexes {check}")
+
+        patched = change(base, 0)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            followed = follow(facets, patched)
+        per_follow = (time.perf_counter() - started) / args.repeat * 1000
+        check = "ok" if followed.postings == FacetIndex(patched).postings else "MISMATCH"
+        print(f"{'  facets':<14} {per_follow:>9.2f} ms  postings {check}")
+
+
+if __name__ == "__main__":
+    main()
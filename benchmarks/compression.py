@@ -0,0 +1,163 @@
+"""Compression cost per request and bytes sent.
+
+Requests go straight through the ASGI interface of small apps (no server
+or sockets), each asking for one response with a browser's
+Accept-Encoding. Every response is served by:
+
+- gzip: the GZipMiddleware(minimum_size=1000) this layer replaced
+- compression: CompressionMiddleware
+- precompressed: CompressionMiddleware over a static mount with .br/.zst/.gz
+  siblings written by precompress_directory() (static files only)
+
+Static files are copies of the largest JS bundles NiceGUI serves. The
+first request of a cached response pays for its compression; the table
+shows the steady state after it.
+
+Usage:
+    python -m benchmarks.compression [--requests 200] [--accept-encoding "gzip, deflate, br, zstd"]
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import nicegui
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+from app.core.compression import ENCODINGS, precompress_directory
+from app.core.middleware import CompressionMiddleware
+from app.core.static_files import PrecompressedStaticFiles
+
+ASSETS = ("vue.esm-browser.prod.js", "quasar.umd.prod.js")
+
+# A page of catalog listings, about 20 KB of JSON
+PRODUCTS = [
+    {
+        "id": i,
+        "name": f"Seamaster Diver 300M Ref. {i}",
+        "brand": "Omega",
+        "price": 5200.0 + i,
+        "description": "Ceramic bezel, helium escape valve and a Master Chronometer movement. " * 2,
+    }
+    for i in range(100)
+]
+
+
+def _copy_assets(directory: Path) -> List[str]:
+    static = Path(nicegui.__file__).parent / "static"
+    names = []
+    for name in ASSETS:
+        source = next(static.rglob(name), None)
+        if source is not None:
+            shutil.copy(source, directory / name)
+            names.append(name)
+    return names
+
+
+def build_app(directory: Path, install: Callable[[FastAPI], None]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/products")
+    async def products():
+        return PRODUCTS
+
+    @app.get("/api/catalog/products")
+    async def catalog_products():
+        return JSONResponse(PRODUCTS, headers={"ETag": '"1-42"'})
+
+    app.mount("/static", PrecompressedStaticFiles(directory=directory))
+    install(app)
+    return app
+
+
+async def _request(app: FastAPI, path: str, accept_encoding: bytes) -> Tuple[int, Optional[bytes]]:
+    """Send one GET; return the body size and its Content-Encoding."""
+    scope = {
+        "type": "http",
+        # 2.4: FileResponse does not watch receive() for a disconnect
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"shop.example.com"), (b"accept-encoding", accept_encoding)],
+        "client": ("10.0.0.1", 50000),
+        "server": ("127.0.0.1", 8080),
+    }
+    size = 0
+    encoding = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size, encoding
+        if message["type"] == "http.response.start":
+            encoding = dict(message["headers"]).get(b"content-encoding")
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return size, encoding
+
+
+async def measure(app: FastAPI, path: str, requests: int, accept_encoding: bytes) -> Dict[str, object]:
+    started = time.perf_counter()
+    size, encoding = await _request(app, path, accept_encoding)
+    first = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(requests):
+        await _request(app, path, accept_encoding)
+    return {
+        "first_ms": first * 1000,
+        "us_per_request": (time.perf_counter() - started) / requests * 1e6,
+        "bytes": size,
+        "encoding": (encoding or b"identity").decode(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare the cost of response compression setups.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--accept-encoding", default="gzip, deflate, br, zstd")
+    args = parser.parse_args(argv)
+    accept_encoding = args.accept_encoding.encode()
+
+    print(f"Encodings available: {', '.join(ENCODINGS)}")
+    with tempfile.TemporaryDirectory() as plain_dir, tempfile.TemporaryDirectory() as precompressed_dir:
+        names = _copy_assets(Path(plain_dir))
+        _copy_assets(Path(precompressed_dir))
+        started = time.perf_counter()
+        precompress_directory(precompressed_dir)
+        print(f"precompress_directory: {time.perf_counter() - started:.1f} s for {len(names)} files")
+
+        gzip_app = build_app(Path(plain_dir), lambda app: app.add_middleware(GZipMiddleware, minimum_size=1000))
+        setups = [
+            ("gzip", gzip_app),
+            ("compression", build_app(Path(plain_dir), lambda app: app.add_middleware(CompressionMiddleware))),
+            ("precompressed", build_app(Path(precompressed_dir), lambda app: app.add_middleware(CompressionMiddleware))),
+        ]
+        paths = ["/api/products", "/api/catalog/products"] + [f"/static/{name}" for name in names]
+
+        print(f"{'path':<36} {'setup':<14} {'encoding':<9} {'bytes':>9} {'first ms':>9} {'us/request':>11}")
+        for path in paths:
+            for name, app in setups:
+                if name == "precompressed" and not path.startswith("/static/"):
+                    continue
+                result = asyncio.run(measure(app, path, args.requests, accept_encoding))
+                print(
+                    f"{path:<36} {name:<14} {result['encoding']:<9} {result['bytes']:>9} "
+                    f"{result['first_ms']:>9.1f} {result['us_per_request']:>11.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Shared rate limit store check.
+
+Simulates several machines, each with its own FallbackRateLimitStore and
+Redis connection, against one Redis-protocol server. By default this is
+fakeredis's TCP server, started in-process as a local stand-in. It checks
+that:
+
+- a client gets one quota across all machines, not one per machine
+- concurrent checks are pipelined, so round trips are far fewer than requests
+- when the server stops answering, requests are decided on local counters
+  and none waits much longer than RATE_LIMIT_TIMEOUT
+
+Usage:
+    python -m benchmarks.rate_limit_store [--machines 4] [--requests 4000] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from app.core.rate_limit import FallbackRateLimitStore, MemoryRateLimitStore, RedisRateLimitStore
+
+WINDOW = 60
+# Timeout while checking the shared quota: the in-process stand-in competes
+# with the simulated machines for the GIL, so it answers slower than Redis
+QUOTA_TIMEOUT = 2.0
+# Requests in flight at once on each machine
+CONCURRENCY = 64
+
+
+def _start_stand_in() -> str:
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    host, port = server.server_address
+    return f"redis://{host}:{port}/0"
+
+
+async def _start_stalled_server() -> Tuple[asyncio.AbstractServer, str]:
+    """A server that accepts connections and never answers."""
+    async def swallow(reader, writer):
+        while await reader.read(65536):
+            pass
+
+    server = await asyncio.start_server(swallow, "127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    return server, f"redis://{host}:{port}/0"
+
+
+def _machines(url: str, count: int, limit: int, timeout: float) -> List[FallbackRateLimitStore]:
+    return [
+        FallbackRateLimitStore(
+            RedisRateLimitStore(limit, WINDOW, url), MemoryRateLimitStore(limit, WINDOW), timeout
+        )
+        for _ in range(count)
+    ]
+
+
+async def _timed_hit(store: FallbackRateLimitStore, client: str) -> Tuple[bool, float]:
+    started = time.perf_counter()
+    allowed = await store.hit(client, time.time())
+    return allowed, time.perf_counter() - started
+
+
+async def _load(stores: List[FallbackRateLimitStore], requests: int, clients: int) -> List[Tuple[str, bool, float]]:
+    """Spread requests of `clients` clients round-robin over the machines."""
+    async def machine(index: int, store: FallbackRateLimitStore) -> List[Tuple[str, bool, float]]:
+        mine = [f"198.51.100.{n % clients}" for n in range(index, requests, len(stores))]
+        results = []
+        for start in range(0, len(mine), CONCURRENCY):
+            wave = mine[start:start + CONCURRENCY]
+            outcomes = await asyncio.gather(*(_timed_hit(store, client) for client in wave))
+            results.extend((client, allowed, latency) for client, (allowed, latency) in zip(wave, outcomes))
+        return results
+
+    per_machine = await asyncio.gather(*(machine(i, store) for i, store in enumerate(stores)))
+    return [result for results in per_machine for result in results]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def run(url: str, machines: int, requests: int, clients: int, limit: int, timeout: float) -> bool:
+    checks = []
+
+    stores = _machines(url, machines, limit, max(timeout, QUOTA_TIMEOUT))
+    results = await _load(stores, requests, clients)
+    allowed, sent = {}, {}
+    for client, ok, _ in results:
+        allowed[client] = allowed.get(client, 0) + ok
+        sent[client] = sent.get(client, 0) + 1
+    latencies = [latency for _, _, latency in results]
+    round_trips = sum(store.shared.batches for store in stores)
+    fallbacks = sum(store.fallbacks for store in stores)
+    for store in stores:
+        await store.close()
+    print(f"{machines} machines, {requests} requests from {clients} clients, limit {limit} per {WINDOW}s")
+    print(f"  allowed per client: {sorted(set(allowed.values()))} (per-machine counters would allow up to {machines * limit})")
+    print(f"  round trips: {round_trips} for {requests} checks ({requests / max(round_trips, 1):.0f} checks each)")
+    print(f"  latency p50 {_percentile(latencies, 50) * 1000:.2f} ms, p99 {_percentile(latencies, 99) * 1000:.2f} ms")
+    one_quota = all(allowed[client] == min(limit, sent[client]) for client in sent)
+    checks.append(("one quota across machines", fallbacks == 0 and one_quota))
+    checks.append(("checks are pipelined", round_trips * 4 <= requests))
+
+    stalled, stalled_url = await _start_stalled_server()
+    stores = _machines(stalled_url, machines, limit, timeout)
+    results = await _load(stores, requests, clients)
+    latencies = [latency for _, _, latency in results]
+    fallbacks = sum(store.fallbacks for store in stores)
+    for store in stores:
+        await store.close()
+    stalled.close()
+    print(f"Stalled server, timeout {timeout * 1000:.0f} ms:")
+    print(f"  fallbacks: {fallbacks}; worst latency {max(latencies) * 1000:.1f} ms")
+    checks.append(("latency bounded when the store stalls", max(latencies) < timeout + 0.05))
+    checks.append(("stalled store falls back to local counters", fallbacks >= 1))
+
+    for name, ok in checks:
+        print(f"  [{'ok' if ok else 'FAIL'}] {name}")
+    return all(ok for _, ok in checks)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check the shared rate limit store across simulated machines.")
+    parser.add_argument("--machines", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=0.05, help="Seconds to wait for the shared store")
+    parser.add_argument("--redis-url", help="Real Redis to use instead of the in-process stand-in")
+    args = parser.parse_args(argv)
+
+    url = args.redis_url or _start_stand_in()
+    ok = asyncio.run(run(url, args.machines, args.requests, args.clients, args.limit, args.timeout))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
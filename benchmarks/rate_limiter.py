@@ -0,0 +1,160 @@
+"""Rate limiter cost per request and memory.
+
+Drives RateLimitMiddleware through its ASGI interface in two scenarios:
+
+- flood: requests from 100k distinct IPs, as from a botnet or a scraper
+  rotating addresses
+- hot client: one IP sending many requests under a high limit
+
+The baseline is the previous implementation. It keeps a list of timestamps
+per IP, rebuilds it on every request and never forgets an IP.
+
+Usage:
+    python -m benchmarks.rate_limiter [--ips 100000] [--requests-per-ip 3] [--hot-requests 12000]
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.middleware import RateLimitMiddleware
+
+# Headers of a typical browser request, so header parsing costs what it would
+BASE_HEADERS = [
+    (b"host", b"shop.example.com"),
+    (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0"),
+    (b"accept", b"text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"),
+    (b"accept-language", b"en-US,en;q=0.9"),
+    (b"accept-encoding", b"gzip, deflate, br, zstd"),
+    (b"connection", b"keep-alive"),
+    (b"cookie", b"session=0123456789abcdef0123456789abcdef"),
+    (b"upgrade-insecure-requests", b"1"),
+]
+
+
+class LegacyRateLimitMiddleware:
+    """Baseline: the per-IP timestamp list limiter this module replaced."""
+    def __init__(self, app, limit: int = 100, window: int = 60, exempt_paths: List[str] = None):
+        self.app = app
+        self.limit = limit
+        self.window = window
+        self.exempt_paths = exempt_paths or []
+        self.requests = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        client_ip = self._get_client_ip(scope)
+        path = scope["path"]
+        if any(path.startswith(exempt) for exempt in self.exempt_paths):
+            return await self.app(scope, receive, send)
+        current_time = time.time()
+        if client_ip in self.requests:
+            requests_info = self.requests[client_ip]
+            requests_info = [r for r in requests_info if current_time - r < self.window]
+            if len(requests_info) >= self.limit:
+                return await send({"type": "http.response.start", "status": 429, "headers": []})
+            requests_info.append(current_time)
+            self.requests[client_ip] = requests_info
+        else:
+            self.requests[client_ip] = [current_time]
+        return await self.app(scope, receive, send)
+
+    def _get_client_ip(self, scope):
+        headers = dict(scope.get("headers", []))
+        forwarded = headers.get(b"x-forwarded-for", b"").decode("utf8").split(",")[0].strip()
+        if forwarded:
+            return forwarded
+        return scope.get("client", ("", 0))[0] or "unknown"
+
+
+async def _app(scope, receive, send):
+    pass
+
+
+async def _receive():
+    return {"type": "http.request", "body": b""}
+
+
+def _scope(ip: str) -> Dict:
+    return {
+        "type": "http",
+        "path": "/api/products",
+        "headers": BASE_HEADERS + [(b"x-forwarded-for", f"{ip}, 10.0.0.1".encode())],
+        "client": ("10.0.0.1", 50000),
+    }
+
+
+def _ip(n: int) -> str:
+    return f"{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}.{n % 7 + 1}"
+
+
+async def _drive(middleware, scopes: List[Dict]) -> int:
+    rejected = 0
+
+    async def send(message):
+        nonlocal rejected
+        if message.get("status") == 429:
+            rejected += 1
+
+    for scope in scopes:
+        await middleware(scope, _receive, send)
+    return rejected
+
+
+def measure(factory: Callable[[], Any], scopes: List[Dict]) -> Dict[str, Any]:
+    """Run scopes through fresh middlewares: once timed, once under tracemalloc."""
+    middleware = factory()
+    started = time.perf_counter()
+    rejected = asyncio.run(_drive(middleware, scopes))
+    elapsed = time.perf_counter() - started
+
+    # tracemalloc slows every allocation down, so memory gets its own run
+    traced = factory()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    asyncio.run(_drive(traced, scopes))
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {
+        "us_per_request": elapsed / len(scopes) * 1e6,
+        "retained_mb": retained / 2**20,
+        "rejected": rejected,
+        "middleware": middleware,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare rate limiter implementations.")
+    parser.add_argument("--ips", type=int, default=100_000, help="Distinct IPs in the flood")
+    parser.add_argument("--requests-per-ip", type=int, default=3)
+    parser.add_argument("--hot-requests", type=int, default=12_000, help="Requests from the hot client")
+    parser.add_argument("--hot-limit", type=int, default=10_000, help="Per-window limit for the hot client")
+    parser.add_argument("--max-clients", type=int, default=50_000, help="Client cap of the new limiter")
+    args = parser.parse_args(argv)
+
+    flood = [_scope(_ip(n)) for _ in range(args.requests_per_ip) for n in range(args.ips)]
+    hot = [_scope("203.0.113.7")] * args.hot_requests
+    scenarios = [
+        (f"flood: {args.ips} IPs x {args.requests_per_ip}", flood, 100),
+        (f"hot client: {args.hot_requests} requests", hot, args.hot_limit),
+    ]
+
+    print(f"{'scenario':<32} {'limiter':<16} {'us/request':>11} {'retained MB':>12} {'tracked IPs':>12} {'rejected':>9}")
+    for name, scopes, limit in scenarios:
+        legacy = measure(lambda: LegacyRateLimitMiddleware(_app, limit=limit), scopes)
+        current = measure(lambda: RateLimitMiddleware(_app, limit=limit, max_clients=args.max_clients), scopes)
+        rows = [
+            (name, "timestamp lists", legacy, len(legacy["middleware"].requests)),
+            ("", "sliding window", current, len(current["middleware"].store)),
+        ]
+        for label, limiter, result, tracked in rows:
+            print(
+                f"{label:<32} {limiter:<16} {result['us_per_request']:>11.2f} "
+                f"{result['retained_mb']:>12.1f} {tracked:>12} {result['rejected']:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
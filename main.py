@@ -5,322 +5,400 @@ A professional e-commerce application for luxury watches with catalog, cart, and
 import os
 from nicegui import ui, app
 import uvicorn
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import random
 from datetime import datetime
+from urllib.parse import quote, urlencode
 from typing import List, Dict, Optional, Any
+from functools import partial
 import asyncio
+import hashlib
+import uuid
+from pathlib import Path
 
 # Load environment variables
 load_dotenv()
 
-# Initialize SQLAlchemy
-Base = declarative_base()
-engine = create_engine("sqlite:///watches.db", connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Define models
-class Product(Base):
-    __tablename__ = "products"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
-    brand = Column(String(50), nullable=False)
-    category = Column(String(50), nullable=False)
-    price = Column(Float, nullable=False)
-    description = Column(Text, nullable=False)
-    image_url = Column(String(255), nullable=False)
-    stock = Column(Integer, default=10)
-    features = Column(Text, nullable=True)
-
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-# Initialize session state
-@app.middleware('before_request')
-def init_session():
-    if not hasattr(app.storage.user, 'cart'):
-        app.storage.user.cart = []
-    if not hasattr(app.storage.user, 'cart_total'):
-        app.storage.user.cart_total = 0.0
+from app.api import api_router
+from app.core.compression import precompress_directory
+from app.core.config import settings
+from app.core.database import engine, get_db_context, with_unit_of_work
+from app.core.exceptions import AppException
+from app.core.lifecycle import lifecycle
+from app.core.logging import app_logger
+from app.core.middleware import add_startup_gate, close_middleware, setup_middleware
+from app.core.static_files import CachedStaticFiles
+from app.core.migrations import migrate
+from app.models.migrations import MIGRATIONS
+from app.models.product import Product
+from app.services.catalog import (
+    check_catalog_query_plans,
+    get_product_by_id,
+    get_all_products_async,
+    get_products_by_category_async,
+    get_products_by_brand_async,
+    get_unique_categories_async,
+    get_unique_brands_async,
+    get_unique_features_async,
+    list_products_async,
+    SORT_KEYS,
+    split_features,
+    watch_catalog_revision,
+)
+from app.services.cart import Cart, cart_cache, cart_totals, format_cents, publish_cart_changed, subscribe_cart, to_cents
+from app.services.cart_store import close_cart_writer, get_cart_writer
+from app.services.catalog_import import import_products
+from app.services.facets import FACETS, PRICE_BANDS, get_facet_index_async
+from app.services.images import IMAGE_DIR, IMAGE_URL_PREFIX, IMMUTABLE_CACHE_CONTROL, ingest_product_images
+from app.services.orders import place_order
+from app.services.product_views import get_product_view_async, product_view
+from app.services.related import ensure_related_products, get_related_products_async
+from app.services.reservations import reservations
+from app.services.search import search_catalog_async, suggest_async
+
+# Mount the JSON API on NiceGUI's FastAPI app
+app.include_router(api_router, prefix=settings.api_prefix)
+
+# Requests wait for the required startup phases (see the lifecycle below);
+# added first, so it sits inside the MIDDLEWARE layers
+add_startup_gate(app, lifecycle)
+# Middleware layers in the order given by MIDDLEWARE (metrics at METRICS_PATH)
+setup_middleware(app)
+
+# Content-hashed product image variants never change, so cache them for good
+IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+app.mount(IMAGE_URL_PREFIX, CachedStaticFiles(directory=IMAGE_DIR, cache_control=IMMUTABLE_CACHE_CONTROL), name='product-images')
+# Site assets (stylesheet), linked with their content hash so they can be
+# cached for good too. Their .br/.zst/.gz siblings are served when present.
+# They ship with the code, so a relative STATIC_DIR is taken from here
+ASSET_DIR = Path(__file__).resolve().parent / settings.static_dir / 'assets'
+ASSET_URL_PREFIX = '/static/assets'
+app.mount(ASSET_URL_PREFIX, CachedStaticFiles(directory=ASSET_DIR, cache_control=IMMUTABLE_CACHE_CONTROL), name='assets')
+
+def asset_url(name: str) -> str:
+    """URL of a site asset that changes whenever the file does."""
+    version = hashlib.sha256((ASSET_DIR / name).read_bytes()).hexdigest()[:12]
+    return f'{ASSET_URL_PREFIX}/{name}?v={version}'
 
 # Sample data initialization
 def initialize_sample_data():
-    db = SessionLocal()
-    # Check if we already have products
-    if db.query(Product).count() == 0:
-        # Watch categories
-        categories = ["Luxury", "Chronograph", "Dive", "Dress", "Smart"]
+    with get_db_context() as db:
+        # Check if we already have products
+        if db.query(Product).count() == 0:
+            # Watch categories
+            categories = ["Luxury", "Chronograph", "Dive", "Dress", "Smart"]
         
-        # Watch brands
-        brands = ["Rolex", "Omega", "Tag Heuer", "Patek Philippe", "Audemars Piguet", 
-                 "Seiko", "Citizen", "Breitling", "Cartier", "IWC"]
+            # Watch brands
+            brands = ["Rolex", "Omega", "Tag Heuer", "Patek Philippe", "Audemars Piguet", 
+                     "Seiko", "Citizen", "Breitling", "Cartier", "IWC"]
         
-        # Watch features
-        feature_options = [
-            "Automatic movement", "Swiss made", "Sapphire crystal", 
-            "Water resistant to 100m", "Chronograph function",
-            "Date display", "Power reserve indicator", "GMT function",
-            "Ceramic bezel", "Luminous hands", "Titanium case",
-            "Perpetual calendar", "Tourbillon", "Moon phase display"
-        ]
+            # Watch features
+            feature_options = [
+                "Automatic movement", "Swiss made", "Sapphire crystal", 
+                "Water resistant to 100m", "Chronograph function",
+                "Date display", "Power reserve indicator", "GMT function",
+                "Ceramic bezel", "Luminous hands", "Titanium case",
+                "Perpetual calendar", "Tourbillon", "Moon phase display"
+            ]
         
-        # Sample watches
-        watches = [
-            {
-                "name": "Submariner Date",
-                "brand": "Rolex",
-                "category": "Dive",
-                "price": 9950.00,
-                "description": "The Rolex Submariner Date is a reference among diving watches. Waterproof to a depth of 300 meters, this iconic timepiece combines technical performance and elegant design.",
-                "image_url": f"https://source.unsplash.com/800x800/?luxury,dive,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 5))
-            },
-            {
-                "name": "Speedmaster Professional",
-                "brand": "Omega",
-                "category": "Chronograph",
-                "price": 6250.00,
-                "description": "The Omega Speedmaster Professional, also known as the 'Moonwatch', is a manual-winding chronograph that was worn during the first American spacewalk and the first lunar landing.",
-                "image_url": f"https://source.unsplash.com/800x800/?chronograph,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 5))
-            },
-            {
-                "name": "Royal Oak",
-                "brand": "Audemars Piguet",
-                "category": "Luxury",
-                "price": 25000.00,
-                "description": "The Audemars Piguet Royal Oak is a true icon in the world of luxury watches. Its octagonal bezel with exposed screws and integrated bracelet revolutionized the industry when it was introduced in 1972.",
-                "image_url": f"https://source.unsplash.com/800x800/?luxury,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 5))
-            },
-            {
-                "name": "Carrera Calibre 16",
-                "brand": "Tag Heuer",
-                "category": "Chronograph",
-                "price": 4350.00,
-                "description": "The TAG Heuer Carrera Calibre 16 is a sporty chronograph inspired by motor racing. It features a tachymeter scale on the bezel and three subdials for precise timing.",
-                "image_url": f"https://source.unsplash.com/800x800/?chronograph,racing,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 5))
-            },
-            {
-                "name": "Nautilus",
-                "brand": "Patek Philippe",
-                "category": "Luxury",
-                "price": 35000.00,
-                "description": "The Patek Philippe Nautilus is one of the most sought-after luxury sports watches in the world. Its distinctive porthole-shaped case and horizontal embossed dial make it instantly recognizable.",
-                "image_url": f"https://source.unsplash.com/800x800/?luxury,watch,nautilus&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 5))
-            },
-            {
-                "name": "Presage Cocktail Time",
-                "brand": "Seiko",
-                "category": "Dress",
-                "price": 425.00,
-                "description": "The Seiko Presage Cocktail Time features a stunning sunburst dial inspired by the art of cocktail making. It offers exceptional value with its in-house automatic movement and elegant design.",
-                "image_url": f"https://source.unsplash.com/800x800/?dress,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 4))
-            },
-            {
-                "name": "Navitimer B01 Chronograph",
-                "brand": "Breitling",
-                "category": "Chronograph",
-                "price": 8500.00,
-                "description": "The Breitling Navitimer is a pilot's chronograph with a circular slide rule bezel for performing various calculations related to airborne navigation. It's been a favorite among aviators since 1952.",
-                "image_url": f"https://source.unsplash.com/800x800/?pilot,chronograph,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 5))
-            },
-            {
-                "name": "Tank Solo",
-                "brand": "Cartier",
-                "category": "Dress",
-                "price": 2740.00,
-                "description": "The Cartier Tank Solo continues the legacy of the iconic Tank watch, first created in 1917. Its rectangular case and clean dial epitomize elegant simplicity.",
-                "image_url": f"https://source.unsplash.com/800x800/?cartier,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 3))
-            },
-            {
-                "name": "Portugieser Chronograph",
-                "brand": "IWC",
-                "category": "Chronograph",
-                "price": 7600.00,
-                "description": "The IWC Portugieser Chronograph is known for its clean dial design with applied Arabic numerals and a thin bezel that maximizes the dial opening. It's a sophisticated timepiece with a sporty character.",
-                "image_url": f"https://source.unsplash.com/800x800/?iwc,chronograph,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 4))
-            },
-            {
-                "name": "Prospex Diver",
-                "brand": "Seiko",
-                "category": "Dive",
-                "price": 1200.00,
-                "description": "The Seiko Prospex Diver, affectionately known as the 'Turtle' due to its cushion-shaped case, is a professional diving watch with 200m water resistance and Seiko's reliable automatic movement.",
-                "image_url": f"https://source.unsplash.com/800x800/?dive,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 4))
-            },
-            {
-                "name": "Seamaster Diver 300M",
-                "brand": "Omega",
-                "category": "Dive",
-                "price": 5200.00,
-                "description": "The Omega Seamaster Diver 300M gained worldwide fame as James Bond's watch. It features a wave-patterned dial, a helium escape valve, and exceptional water resistance.",
-                "image_url": f"https://source.unsplash.com/800x800/?omega,dive,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 5))
-            },
-            {
-                "name": "Datejust 41",
-                "brand": "Rolex",
-                "category": "Dress",
-                "price": 8500.00,
-                "description": "The Rolex Datejust is the archetype of the classic watch. Introduced in 1945, it was the first self-winding waterproof chronometer wristwatch to display the date in a window at 3 o'clock on the dial.",
-                "image_url": f"https://source.unsplash.com/800x800/?rolex,watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, 4))
-            }
-        ]
+            # Sample watches
+            watches = [
+                {
+                    "name": "Submariner Date",
+                    "brand": "Rolex",
+                    "category": "Dive",
+                    "price": 9950.00,
+                    "description": "The Rolex Submariner Date is a reference among diving watches. Waterproof to a depth of 300 meters, this iconic timepiece combines technical performance and elegant design.",
+                    "image_url": "https://source.unsplash.com/800x800/?luxury,dive,watch&sig=1",
+                    "features": ", ".join(random.sample(feature_options, 5))
+                },
+                {
+                    "name": "Speedmaster Professional",
+                    "brand": "Omega",
+                    "category": "Chronograph",
+                    "price": 6250.00,
+                    "description": "The Omega Speedmaster Professional, also known as the 'Moonwatch', is a manual-winding chronograph that was worn during the first American spacewalk and the first lunar landing.",
+                    "image_url": "https://source.unsplash.com/800x800/?chronograph,watch&sig=2",
+                    "features": ", ".join(random.sample(feature_options, 5))
+                },
+                {
+                    "name": "Royal Oak",
+                    "brand": "Audemars Piguet",
+                    "category": "Luxury",
+                    "price": 25000.00,
+                    "description": "The Audemars Piguet Royal Oak is a true icon in the world of luxury watches. Its octagonal bezel with exposed screws and integrated bracelet revolutionized the industry when it was introduced in 1972.",
+                    "image_url": "https://source.unsplash.com/800x800/?luxury,watch&sig=3",
+                    "features": ", ".join(random.sample(feature_options, 5))
+                },
+                {
+                    "name": "Carrera Calibre 16",
+                    "brand": "Tag Heuer",
+                    "category": "Chronograph",
+                    "price": 4350.00,
+                    "description": "The TAG Heuer Carrera Calibre 16 is a sporty chronograph inspired by motor racing. It features a tachymeter scale on the bezel and three subdials for precise timing.",
+                    "image_url": "https://source.unsplash.com/800x800/?chronograph,racing,watch&sig=4",
+                    "features": ", ".join(random.sample(feature_options, 5))
+                },
+                {
+                    "name": "Nautilus",
+                    "brand": "Patek Philippe",
+                    "category": "Luxury",
+                    "price": 35000.00,
+                    "description": "The Patek Philippe Nautilus is one of the most sought-after luxury sports watches in the world. Its distinctive porthole-shaped case and horizontal embossed dial make it instantly recognizable.",
+                    "image_url": "https://source.unsplash.com/800x800/?luxury,watch,nautilus&sig=5",
+                    "features": ", ".join(random.sample(feature_options, 5))
+                },
+                {
+                    "name": "Presage Cocktail Time",
+                    "brand": "Seiko",
+                    "category": "Dress",
+                    "price": 425.00,
+                    "description": "The Seiko Presage Cocktail Time features a stunning sunburst dial inspired by the art of cocktail making. It offers exceptional value with its in-house automatic movement and elegant design.",
+                    "image_url": "https://source.unsplash.com/800x800/?dress,watch&sig=6",
+                    "features": ", ".join(random.sample(feature_options, 4))
+                },
+                {
+                    "name": "Navitimer B01 Chronograph",
+                    "brand": "Breitling",
+                    "category": "Chronograph",
+                    "price": 8500.00,
+                    "description": "The Breitling Navitimer is a pilot's chronograph with a circular slide rule bezel for performing various calculations related to airborne navigation. It's been a favorite among aviators since 1952.",
+                    "image_url": "https://source.unsplash.com/800x800/?pilot,chronograph,watch&sig=7",
+                    "features": ", ".join(random.sample(feature_options, 5))
+                },
+                {
+                    "name": "Tank Solo",
+                    "brand": "Cartier",
+                    "category": "Dress",
+                    "price": 2740.00,
+                    "description": "The Cartier Tank Solo continues the legacy of the iconic Tank watch, first created in 1917. Its rectangular case and clean dial epitomize elegant simplicity.",
+                    "image_url": "https://source.unsplash.com/800x800/?cartier,watch&sig=8",
+                    "features": ", ".join(random.sample(feature_options, 3))
+                },
+                {
+                    "name": "Portugieser Chronograph",
+                    "brand": "IWC",
+                    "category": "Chronograph",
+                    "price": 7600.00,
+                    "description": "The IWC Portugieser Chronograph is known for its clean dial design with applied Arabic numerals and a thin bezel that maximizes the dial opening. It's a sophisticated timepiece with a sporty character.",
+                    "image_url": "https://source.unsplash.com/800x800/?iwc,chronograph,watch&sig=9",
+                    "features": ", ".join(random.sample(feature_options, 4))
+                },
+                {
+                    "name": "Prospex Diver",
+                    "brand": "Seiko",
+                    "category": "Dive",
+                    "price": 1200.00,
+                    "description": "The Seiko Prospex Diver, affectionately known as the 'Turtle' due to its cushion-shaped case, is a professional diving watch with 200m water resistance and Seiko's reliable automatic movement.",
+                    "image_url": "https://source.unsplash.com/800x800/?dive,watch&sig=10",
+                    "features": ", ".join(random.sample(feature_options, 4))
+                },
+                {
+                    "name": "Seamaster Diver 300M",
+                    "brand": "Omega",
+                    "category": "Dive",
+                    "price": 5200.00,
+                    "description": "The Omega Seamaster Diver 300M gained worldwide fame as James Bond's watch. It features a wave-patterned dial, a helium escape valve, and exceptional water resistance.",
+                    "image_url": "https://source.unsplash.com/800x800/?omega,dive,watch&sig=11",
+                    "features": ", ".join(random.sample(feature_options, 5))
+                },
+                {
+                    "name": "Datejust 41",
+                    "brand": "Rolex",
+                    "category": "Dress",
+                    "price": 8500.00,
+                    "description": "The Rolex Datejust is the archetype of the classic watch. Introduced in 1945, it was the first self-winding waterproof chronometer wristwatch to display the date in a window at 3 o'clock on the dial.",
+                    "image_url": "https://source.unsplash.com/800x800/?rolex,watch&sig=12",
+                    "features": ", ".join(random.sample(feature_options, 4))
+                }
+            ]
         
-        # Generate additional watches to have a good catalog
-        for i in range(8):
-            brand = random.choice(brands)
-            category = random.choice(categories)
-            price_tier = random.choice([1, 2, 3, 4, 5])
-            base_price = price_tier * 1000
-            price = base_price + random.randint(0, 9) * 100 + random.randint(0, 9) * 10
+            # Generate additional watches to have a good catalog
+            for i in range(8):
+                brand = random.choice(brands)
+                category = random.choice(categories)
+                price_tier = random.choice([1, 2, 3, 4, 5])
+                base_price = price_tier * 1000
+                price = base_price + random.randint(0, 9) * 100 + random.randint(0, 9) * 10
             
-            watch = {
-                "name": f"{brand} {category} {random.choice(['Classic', 'Elite', 'Master', 'Pro', 'Limited'])}",
-                "brand": brand,
-                "category": category,
-                "price": price,
-                "description": f"A beautiful {category.lower()} watch from {brand}, featuring premium materials and expert craftsmanship. This timepiece combines elegant design with reliable performance.",
-                "image_url": f"https://source.unsplash.com/800x800/?{category.lower()},watch&sig={random.randint(1, 1000)}",
-                "features": ", ".join(random.sample(feature_options, random.randint(3, 5)))
-            }
-            watches.append(watch)
-        
-        # Add all watches to the database
-        for watch_data in watches:
-            watch = Product(**watch_data)
-            db.add(watch)
+                watch = {
+                    "name": f"{brand} {category} {random.choice(['Classic', 'Elite', 'Master', 'Pro', 'Limited'])}",
+                    "brand": brand,
+                    "category": category,
+                    "price": price,
+                    "description": f"A beautiful {category.lower()} watch from {brand}, featuring premium materials and expert craftsmanship. This timepiece combines elegant design with reliable performance.",
+                    "image_url": f"https://source.unsplash.com/800x800/?{category.lower()},watch&sig={100 + i}",
+                    "features": ", ".join(random.sample(feature_options, random.randint(3, 5)))
+                }
+                watches.append(watch)
         
-        db.commit()
-    db.close()
+            # Add all watches to the database in one batched upsert
+            import_products(watches, session=db)
+
+# Startup work runs from the server's startup hook rather than at import, so
+# importing main stays cheap and each phase is timed. NiceGUI runs the hook as
+# a background task, so the startup gate holds requests until required phases
+# are done (all phases in the default warm_first mode); with
+# STARTUP_MODE=serve_first the rest runs after serving has started.
+@lifecycle.phase('migrate')
+def migrate_database():
+    migrate(engine, MIGRATIONS)
+
+@lifecycle.phase('styles')
+def add_styles():
+    stylesheet = asset_url('store.css')
+    ui.add_head_html(f'<link rel="stylesheet" href="{stylesheet}">', shared=True)
+
+lifecycle.add_phase('seed_sample_data', initialize_sample_data, required=False)
+
+if settings.debug:
+    # Guard against catalog queries regressing to full table scans
+    lifecycle.add_phase('check_query_plans', check_catalog_query_plans, required=False)
+
+@lifecycle.phase('warm_catalog', required=False)
+async def warm_catalog():
+    await get_facet_index_async()
 
-# Initialize sample data
-initialize_sample_data()
+lifecycle.add_phase('related_products', ensure_related_products, required=False)
+
+# Writes .br/.zst/.gz siblings of the site assets, which the assets mount
+# serves instead of compressing per request
+lifecycle.add_phase('precompress_static', partial(precompress_directory, ASSET_DIR), required=False)
+
+if settings.ingest_product_images:
+    # Fetches remote images, so it never holds up serving in serve_first mode
+    lifecycle.add_phase('product_images', ingest_product_images, required=False)
+
+async def relay_cart_changes():
+    """Deliver cart changes published through a shared store to this server's tabs."""
+    loop = asyncio.get_running_loop()
+    get_cart_writer().store.listen(
+        lambda storage_id, item_count: loop.call_soon_threadsafe(publish_cart_changed, storage_id, item_count)
+    )
+
+app.on_startup(lifecycle.startup)
+# Run as background tasks until shutdown cancels them
+app.on_startup(reservations.run_sweeper)
+if settings.catalog_poll_interval > 0:
+    app.on_startup(partial(watch_catalog_revision, settings.catalog_poll_interval))
+app.on_startup(relay_cart_changes)
+app.on_shutdown(close_cart_writer)
+app.on_shutdown(close_middleware)
 
 # Helper functions
-def get_all_products():
-    db = SessionLocal()
-    products = db.query(Product).all()
-    db.close()
-    return products
-
-def get_products_by_category(category: str):
-    db = SessionLocal()
-    products = db.query(Product).filter(Product.category == category).all()
-    db.close()
-    return products
-
-def get_products_by_brand(brand: str):
-    db = SessionLocal()
-    products = db.query(Product).filter(Product.brand == brand).all()
-    db.close()
-    return products
-
-def get_product_by_id(product_id: int):
-    db = SessionLocal()
-    product = db.query(Product).filter(Product.id == product_id).first()
-    db.close()
-    return product
-
-def get_unique_categories():
-    db = SessionLocal()
-    categories = [category[0] for category in db.query(Product.category).distinct()]
-    db.close()
-    return categories
-
-def get_unique_brands():
-    db = SessionLocal()
-    brands = [brand[0] for brand in db.query(Product.brand).distinct()]
-    db.close()
-    return brands
-
-def format_price(price: float) -> str:
-    return f"${price:,.2f}"
-
-def add_to_cart(product_id: int, quantity: int = 1):
+def load_stored_cart(storage_id: str):
+    # Carts saved in user storage by earlier versions move to the cart store
+    # on their next change
+    return get_cart_writer().load(storage_id) or app.storage.user.pop('cart', None)
+
+def get_cart() -> Cart:
+    """The current user's cart.
+
+    With a process-local store it is decoded once and then served from
+    memory. A shared store (Redis) may hold changes made on other machines,
+    so the cart is read from it on every call.
+    """
+    storage_id = app.storage.browser['id']
+    if get_cart_writer().store.shared:
+        return Cart.from_storage(load_stored_cart(storage_id))
+    return cart_cache.get(storage_id, partial(load_stored_cart, storage_id))
+
+def save_cart(cart: Cart):
+    storage_id = app.storage.browser['id']
+    # Buffered; a burst of changes is written once
+    writer = get_cart_writer()
+    writer.save(storage_id, cart.to_storage() if cart else None)
+    # Updates the cart badge in every open tab of this user. A shared store
+    # relays the change to every app server, this one included.
+    if not writer.store.publish(storage_id, cart.item_count):
+        publish_cart_changed(storage_id, cart.item_count)
+
+def cart_item_count() -> int:
+    return get_cart().item_count
+
+# Stock holds are database writes, made in a worker thread; they also keep the
+# cart's other holds alive
+async def add_to_cart(product_id: int, quantity: int = 1):
+    """Add units to the cart, holding them in stock.
+
+    Raises:
+        ConflictError: If other carts hold or bought the remaining stock
+    """
     product = get_product_by_id(product_id)
-    if not product:
+    if not product or quantity <= 0:
         return False
-    
-    # Check if product is already in cart
-    for item in app.storage.user.cart:
-        if item['id'] == product_id:
-            item['quantity'] += quantity
-            app.storage.user.cart_total += product.price * quantity
-            return True
-    
-    # Add new product to cart
-    cart_item = {
-        'id': product.id,
-        'name': product.name,
-        'brand': product.brand,
-        'price': product.price,
-        'image_url': product.image_url,
-        'quantity': quantity
-    }
-    app.storage.user.cart.append(cart_item)
-    app.storage.user.cart_total += product.price * quantity
+    cart = get_cart()
+    line = cart.get(product.id)
+    held = (line.quantity if line else 0) + quantity
+    await asyncio.to_thread(reservations.reserve, app.storage.browser['id'], product.id, held)
+    cart.add(product.id, to_cents(product.price), quantity)
+    save_cart(cart)
+    return True
+
+async def remove_from_cart(product_id: int):
+    cart = get_cart()
+    if product_id not in cart:
+        return False
+    # Released first, so a failed release leaves the cart as it was
+    await asyncio.to_thread(reservations.release, app.storage.browser['id'], product_id)
+    cart.remove(product_id)
+    save_cart(cart)
     return True
 
-def remove_from_cart(product_id: int):
-    for i, item in enumerate(app.storage.user.cart):
-        if item['id'] == product_id:
-            app.storage.user.cart_total -= item['price'] * item['quantity']
-            app.storage.user.cart.pop(i)
-            return True
-    return False
-
-def update_cart_quantity(product_id: int, quantity: int):
-    if quantity <= 0:
-        return remove_from_cart(product_id)
-    
-    for item in app.storage.user.cart:
-        if item['id'] == product_id:
-            app.storage.user.cart_total -= item['price'] * item['quantity']
-            item['quantity'] = quantity
-            app.storage.user.cart_total += item['price'] * quantity
-            return True
-    return False
-
-def clear_cart():
-    app.storage.user.cart = []
-    app.storage.user.cart_total = 0.0
+async def update_cart_quantity(product_id: int, quantity: int):
+    """Change the quantity of a cart line, adjusting its stock hold.
+
+    Raises:
+        ConflictError: If the additional units are not available
+    """
+    cart = get_cart()
+    if product_id not in cart:
+        return False
+    await asyncio.to_thread(reservations.reserve, app.storage.browser['id'], product_id, max(quantity, 0))
+    cart.set_quantity(product_id, quantity)
+    save_cart(cart)
+    return True
+
+async def clear_cart():
+    cart = get_cart()
+    cart.clear()
+    save_cart(cart)
+    # Saved first: after an order the cart must be empty even if this fails
+    await asyncio.to_thread(reservations.release, app.storage.browser['id'])
 
 # UI Components
 def create_header():
     with ui.header().classes('bg-black text-white'):
         with ui.row().classes('w-full items-center justify-between q-px-lg'):
-            ui.label('LUXURY TIMEPIECES').classes('text-2xl font-bold cursor-pointer').on('click', lambda: ui.open('/'))
+            ui.label('LUXURY TIMEPIECES').classes('text-2xl font-bold cursor-pointer').on('click', lambda: ui.navigate.to('/'))
             
             with ui.row().classes('items-center'):
-                ui.button('Home', on_click=lambda: ui.open('/')).classes('text-white bg-transparent')
-                ui.button('Shop', on_click=lambda: ui.open('/shop')).classes('text-white bg-transparent')
-                ui.button('About', on_click=lambda: ui.open('/about')).classes('text-white bg-transparent')
-                ui.button('Contact', on_click=lambda: ui.open('/contact')).classes('text-white bg-transparent')
+                # Search box with prefix typeahead backed by the FTS5 index
+                search_box = ui.input(placeholder='Search watches').props('dense dark standout clearable').classes('w-64 q-mr-md')
+                
+                async def update_suggestions():
+                    value = (search_box.value or '').strip()
+                    suggestions = await suggest_async(value) if len(value) >= 2 else []
+                    search_box.set_autocomplete([suggestion.name for suggestion in suggestions])
                 
-                with ui.button(on_click=lambda: ui.open('/cart')).classes('text-white bg-transparent q-ml-md'):
+                search_box.on_value_change(update_suggestions)
+                search_box.on('keydown.enter', lambda: ui.navigate.to(f'/search?q={quote((search_box.value or "").strip())}'))
+                
+                ui.button('Home', on_click=lambda: ui.navigate.to('/')).classes('text-white bg-transparent')
+                ui.button('Shop', on_click=lambda: ui.navigate.to('/shop')).classes('text-white bg-transparent')
+                ui.button('Search', on_click=lambda: ui.navigate.to('/search')).classes('text-white bg-transparent')
+                ui.button('About', on_click=lambda: ui.navigate.to('/about')).classes('text-white bg-transparent')
+                ui.button('Contact', on_click=lambda: ui.navigate.to('/contact')).classes('text-white bg-transparent')
+                
+                with ui.button(on_click=lambda: ui.navigate.to('/cart')).classes('text-white bg-transparent q-ml-md'):
                     ui.icon('shopping_cart')
-                    cart_count = ui.label(str(sum(item['quantity'] for item in app.storage.user.cart))).classes('text-xs bg-primary text-white rounded-full absolute px-1 -top-1 -right-1 min-w-4 h-4 flex items-center justify-center')
-                    
-                    def update_cart_count():
-                        cart_count.text = str(sum(item['quantity'] for item in app.storage.user.cart))
-                    
-                    ui.timer(1, update_cart_count)
+                    cart_count = ui.label(str(cart_item_count())).classes('text-xs bg-primary text-white rounded-full absolute px-1 -top-1 -right-1 min-w-4 h-4 flex items-center justify-center')
+
+                    # Pushed only when this user's cart changes, from any tab
+                    unsubscribe = subscribe_cart(app.storage.browser['id'], lambda count: cart_count.set_text(str(count)))
+                    ui.context.client.on_delete(unsubscribe)
 
-def create_footer():
+async def create_footer():
     with ui.footer().classes('bg-black text-white p-8'):
         with ui.row().classes('w-full justify-between'):
             with ui.column().classes('w-1/4'):
@@ -329,7 +407,7 @@ def create_footer():
                 
             with ui.column().classes('w-1/4'):
                 ui.label('SHOP').classes('text-lg font-bold mb-4')
-                for category in get_unique_categories():
+                for category in await get_unique_categories_async():
                     ui.link(category, f'/category/{category}').classes('block mb-2 text-white hover:text-primary')
                 
             with ui.column().classes('w-1/4'):
@@ -349,30 +427,119 @@ def create_footer():
         with ui.row().classes('w-full justify-center mt-8 pt-8 border-t border-gray-700'):
             ui.label(f'© {datetime.now().year} Luxury Timepieces. All rights reserved.').classes('text-sm')
 
+# Rendered image width per breakpoint, so the browser can pick from srcset
+CARD_IMAGE_SIZES = '(min-width: 1024px) 25vw, (min-width: 640px) 50vw, 100vw'
+DETAIL_IMAGE_SIZES = '(min-width: 1024px) 50vw, 100vw'
+CATEGORY_IMAGE_SIZES = '(min-width: 640px) 25vw, 100vw'
+BRAND_IMAGE_SIZES = '128px'
+
+
+def create_product_image(view, src: str, sizes: str, eager: bool = False):
+    """Responsive product image.
+
+    Below-the-fold images load lazily and show the inline placeholder until
+    then; the main image of a page is fetched eagerly with high priority.
+    """
+    image = ui.image(src)
+    image.props['loading'] = 'eager' if eager else 'lazy'
+    if eager:
+        image.props['fetchpriority'] = 'high'
+    if view.srcset:
+        image.props['srcset'] = view.srcset
+        image.props['sizes'] = sizes
+    if view.placeholder:
+        image.props['placeholder-src'] = view.placeholder
+    return image
+
 def create_product_card(product):
+    view = product_view(product)
     with ui.card().classes('w-full h-full product-card'):
-        ui.image(product.image_url).classes('w-full h-48 object-cover')
+        create_product_image(view, view.thumbnail_url, CARD_IMAGE_SIZES).classes('w-full h-48 object-cover')
         with ui.card_section():
-            ui.label(product.brand).classes('text-sm text-gray-500')
-            ui.label(product.name).classes('text-lg font-bold')
-            ui.label(format_price(product.price)).classes('text-primary font-bold')
+            ui.label(view.brand).classes('text-sm text-gray-500')
+            ui.label(view.name).classes('text-lg font-bold')
+            ui.label(view.price_display).classes('text-primary font-bold')
             
             with ui.row().classes('justify-between items-center mt-4'):
-                ui.button('View Details', on_click=lambda p=product: ui.open(f'/product/{p.id}')).classes('bg-black text-white')
-                ui.button(on_click=lambda p=product: add_to_cart_with_notification(p.id)).props('flat round color=primary').classes('ml-2').\
-                    on('click', lambda: ui.notify('Added to cart', color='positive')).tooltip('Add to Cart').add(ui.icon('add_shopping_cart'))
+                # A plain link navigates in the browser without a server round trip
+                with ui.link(target=view.url):
+                    ui.button('View Details').classes('bg-black text-white')
+                ui.button(icon='add_shopping_cart', on_click=partial(add_to_cart_with_notification, view.id)).props('flat round color=primary').classes('ml-2').tooltip('Add to Cart')
 
-def add_to_cart_with_notification(product_id: int):
-    success = add_to_cart(product_id)
+async def add_to_cart_with_notification(product_id: int, quantity: int = 1):
+    try:
+        success = await add_to_cart(product_id, quantity)
+    except AppException as e:
+        # Out of stock, or the hold could not be written (e.g. a locked database)
+        ui.notify(f'Could not add to cart: {e.detail}', color='negative')
+        return
     if success:
         product = get_product_by_id(product_id)
         ui.notify(f'{product.name} added to cart', color='positive')
     else:
         ui.notify('Failed to add product to cart', color='negative')
 
+# Number of cards rendered per listing page / LOAD MORE click
+PAGE_SIZE = 24
+
+def listing_url(path: str, sort: str, features: List[str]) -> str:
+    params = {'sort': sort}
+    if features:
+        params['features'] = ','.join(features)
+    return f'{path}?{urlencode(params)}'
+
+def create_sort_links(path: str, sort: str, features: List[str] = ()):
+    with ui.row().classes('items-center gap-4 mb-4 text-sm'):
+        ui.label('SORT BY').classes('font-bold')
+        for key in SORT_KEYS:
+            link = ui.link(key.capitalize(), listing_url(path, key, list(features))).classes('hover:text-primary')
+            if key == sort:
+                link.classes('text-primary font-bold')
+
+async def create_feature_filter(path: str, sort: str, selected: List[str]):
+    """Feature links that narrow a listing to products having all selected features."""
+    with ui.row().classes('items-center gap-2 mb-4 text-sm flex-wrap'):
+        ui.label('FEATURES').classes('font-bold mr-2')
+        for feature in await get_unique_features_async():
+            chosen = feature in selected
+            toggled = [f for f in selected if f != feature] if chosen else selected + [feature]
+            link = ui.link(feature, listing_url(path, sort, toggled)).classes('px-3 py-1 border rounded-full hover:text-primary')
+            if chosen:
+                link.classes('bg-black text-white')
+
+async def create_product_listing(columns: int, empty_message: str, sort: str = 'price', **filters):
+    """Render the first page of a listing with a LOAD MORE button for the rest.
+    
+    Render cost is bounded by PAGE_SIZE rather than by the catalog size.
+    """
+    if sort not in SORT_KEYS:
+        sort = 'price'
+    page = await list_products_async(sort=sort, limit=PAGE_SIZE, **filters)
+    if not page.items:
+        ui.label(empty_message).classes('text-xl text-center w-full py-16')
+        return
+    
+    with ui.grid(columns=columns).classes('gap-8') as grid:
+        for product in page.items:
+            create_product_card(product)
+    
+    cursor = {'next': page.next_cursor}
+    
+    async def load_more():
+        next_page = await list_products_async(sort=sort, cursor=cursor['next'], limit=PAGE_SIZE, **filters)
+        with grid:
+            for product in next_page.items:
+                create_product_card(product)
+        cursor['next'] = next_page.next_cursor
+        load_more_button.set_visibility(next_page.next_cursor is not None)
+    
+    load_more_button = ui.button('LOAD MORE', on_click=load_more).classes('bg-black text-white mt-8 self-center')
+    load_more_button.set_visibility(page.next_cursor is not None)
+
 # Page definitions
 @ui.page('/')
-def home_page():
+@with_unit_of_work
+async def home_page():
     create_header()
     
     # Hero section
@@ -381,26 +548,28 @@ def home_page():
         with ui.column().classes('absolute inset-0 flex items-center justify-center text-center text-white bg-black bg-opacity-50 p-8'):
             ui.label('TIMELESS ELEGANCE').classes('text-5xl font-bold mb-4')
             ui.label('Discover our collection of luxury timepieces').classes('text-2xl mb-8')
-            ui.button('SHOP NOW', on_click=lambda: ui.open('/shop')).classes('bg-primary text-white px-8 py-4 text-lg')
+            ui.button('SHOP NOW', on_click=lambda: ui.navigate.to('/shop')).classes('bg-primary text-white px-8 py-4 text-lg')
     
     # Featured categories
     with ui.column().classes('py-16 px-8 bg-white'):
         ui.label('FEATURED CATEGORIES').classes('text-3xl font-bold text-center mb-12')
         
         with ui.row().classes('w-full justify-center gap-8'):
-            for category in get_unique_categories()[:3]:
+            for category in (await get_unique_categories_async())[:3]:
+                # The category's first product stands in for it, so the URL is stable
+                cover = product_view((await get_products_by_category_async(category))[0])
                 with ui.card().classes('w-1/4 category-card'):
-                    ui.image(f'https://source.unsplash.com/800x600/?{category.lower()},watch&sig={random.randint(1, 1000)}').classes('w-full h-64 object-cover')
+                    create_product_image(cover, cover.thumbnail_url, CATEGORY_IMAGE_SIZES).classes('w-full h-64 object-cover')
                     with ui.card_section().classes('text-center'):
                         ui.label(category.upper()).classes('text-xl font-bold')
-                        ui.button('SHOP NOW', on_click=lambda c=category: ui.open(f'/category/{c}')).classes('bg-black text-white mt-4')
+                        ui.button('SHOP NOW', on_click=lambda c=category: ui.navigate.to(f'/category/{c}')).classes('bg-black text-white mt-4')
     
     # Featured products
     with ui.column().classes('py-16 px-8 bg-gray-100'):
         ui.label('FEATURED WATCHES').classes('text-3xl font-bold text-center mb-12')
         
         with ui.grid(columns=4).classes('gap-8'):
-            for product in get_all_products()[:8]:
+            for product in (await get_all_products_async())[:8]:
                 create_product_card(product)
     
     # Brand showcase
@@ -408,9 +577,11 @@ def home_page():
         ui.label('PRESTIGIOUS BRANDS').classes('text-3xl font-bold text-center mb-12')
         
         with ui.row().classes('w-full justify-center gap-12 flex-wrap'):
-            for brand in get_unique_brands()[:6]:
+            for brand in (await get_unique_brands_async())[:6]:
+                # Like the category cards, the brand's first product stands in for it
+                cover = product_view((await get_products_by_brand_async(brand))[0])
                 with ui.column().classes('items-center brand-card'):
-                    ui.image(f'https://source.unsplash.com/300x200/?{brand.lower()},logo&sig={random.randint(1, 1000)}').classes('w-32 h-32 object-contain grayscale hover:grayscale-0 transition-all duration-300')
+                    create_product_image(cover, cover.thumbnail_url, BRAND_IMAGE_SIZES).classes('w-32 h-32 object-contain grayscale hover:grayscale-0 transition-all duration-300')
                     ui.label(brand.upper()).classes('text-lg font-bold mt-4')
     
     # Testimonials
@@ -435,10 +606,11 @@ def home_page():
             email_input = ui.input(placeholder='Your email address').classes('w-3/4')
             ui.button('SUBSCRIBE', on_click=lambda: ui.notify('Thank you for subscribing!', color='positive')).classes('bg-black text-white w-1/4')
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/shop')
-def shop_page():
+@with_unit_of_work
+async def shop_page(sort: str = 'price', features: str = ''):
     create_header()
     
     with ui.column().classes('p-8'):
@@ -450,43 +622,40 @@ def shop_page():
                 ui.label('FILTER BY').classes('text-xl font-bold mb-4')
                 
                 ui.label('CATEGORIES').classes('font-bold mt-4 mb-2')
-                for category in get_unique_categories():
+                for category in await get_unique_categories_async():
                     ui.link(category, f'/category/{category}').classes('block mb-2 hover:text-primary')
                 
                 ui.label('BRANDS').classes('font-bold mt-6 mb-2')
-                for brand in get_unique_brands():
+                for brand in await get_unique_brands_async():
                     ui.link(brand, f'/brand/{brand}').classes('block mb-2 hover:text-primary')
                 
                 ui.label('PRICE RANGE').classes('font-bold mt-6 mb-2')
-                price_ranges = [
-                    ('Under $1,000', '0-1000'),
-                    ('$1,000 - $5,000', '1000-5000'),
-                    ('$5,000 - $10,000', '5000-10000'),
-                    ('$10,000 - $20,000', '10000-20000'),
-                    ('$20,000+', '20000-999999')
-                ]
-                for label, range_val in price_ranges:
+                for range_val, label, _, _ in PRICE_BANDS:
                     ui.link(label, f'/price-range/{range_val}').classes('block mb-2 hover:text-primary')
             
             # Products grid
             with ui.column().classes('w-3/4'):
-                with ui.grid(columns=3).classes('gap-8'):
-                    for product in get_all_products():
-                        create_product_card(product)
+                selected = split_features(features)
+                create_sort_links('/shop', sort, selected)
+                await create_feature_filter('/shop', sort, selected)
+                await create_product_listing(3, 'No products found.', sort=sort, features=selected)
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/product/{product_id}')
-def product_page(product_id: int):
+@with_unit_of_work
+async def product_page(product_id: int):
     create_header()
     
-    product = get_product_by_id(product_id)
+    product = await get_product_view_async(product_id)
     if not product:
         with ui.column().classes('p-16 text-center'):
             ui.label('Product not found').classes('text-2xl font-bold')
-            ui.button('Back to Shop', on_click=lambda: ui.open('/shop')).classes('bg-primary text-white mt-4')
-        create_footer()
+            ui.button('Back to Shop', on_click=lambda: ui.navigate.to('/shop')).classes('bg-primary text-white mt-4')
+        await create_footer()
         return
+    # Units this visitor can still add: stock minus other carts' holds
+    available = await reservations.available_async(product.id, app.storage.browser['id'])
     
     with ui.column().classes('p-8'):
         # Breadcrumb
@@ -495,25 +664,25 @@ def product_page(product_id: int):
             ui.label('>').classes('mx-2 text-gray-500')
             ui.link('Shop', '/shop').classes('text-gray-500 hover:text-primary')
             ui.label('>').classes('mx-2 text-gray-500')
-            ui.link(product.category, f'/category/{product.category}').classes('text-gray-500 hover:text-primary')
+            ui.link(product.category, product.category_url).classes('text-gray-500 hover:text-primary')
             ui.label('>').classes('mx-2 text-gray-500')
             ui.label(product.name).classes('text-gray-700')
         
         with ui.row().classes('gap-8'):
             # Product images
             with ui.column().classes('w-1/2'):
-                ui.image(product.image_url).classes('w-full h-[500px] object-cover rounded-lg shadow-lg')
+                create_product_image(product, product.image_url, DETAIL_IMAGE_SIZES, eager=True).classes('w-full h-[500px] object-cover rounded-lg shadow-lg')
                 
-                # Additional images (simulated)
+                # Additional images
                 with ui.row().classes('mt-4 gap-4'):
-                    for i in range(3):
-                        ui.image(f"https://source.unsplash.com/400x400/?{product.category.lower()},watch&sig={random.randint(1, 1000)}").classes('w-1/3 h-24 object-cover rounded cursor-pointer hover:opacity-80')
+                    for gallery_url in product.gallery_urls:
+                        ui.image(gallery_url).props('loading=lazy').classes('w-1/3 h-24 object-cover rounded cursor-pointer hover:opacity-80')
             
             # Product details
             with ui.column().classes('w-1/2'):
                 ui.label(product.brand).classes('text-xl text-gray-500')
                 ui.label(product.name).classes('text-3xl font-bold')
-                ui.label(format_price(product.price)).classes('text-2xl text-primary font-bold mt-4')
+                ui.label(product.price_display).classes('text-2xl text-primary font-bold mt-4')
                 
                 ui.separator().classes('my-6')
                 
@@ -523,7 +692,7 @@ def product_page(product_id: int):
                 if product.features:
                     ui.label('FEATURES').classes('font-bold mt-6')
                     with ui.column().classes('mt-2'):
-                        for feature in product.features.split(', '):
+                        for feature in product.features:
                             with ui.row().classes('items-center mb-1'):
                                 ui.icon('check').classes('text-primary mr-2')
                                 ui.label(feature).classes('text-gray-700')
@@ -531,10 +700,10 @@ def product_page(product_id: int):
                 ui.separator().classes('my-6')
                 
                 with ui.row().classes('items-center gap-4'):
-                    quantity = ui.number(value=1, min=1, max=product.stock).classes('w-20')
-                    ui.button('ADD TO CART', on_click=lambda: add_to_cart_with_notification(product.id)).classes('bg-primary text-white px-8')
+                    quantity = ui.number(value=1, min=1, max=max(available, 1)).classes('w-20')
+                    ui.button('ADD TO CART', on_click=lambda: add_to_cart_with_notification(product.id, int(quantity.value or 1))).classes('bg-primary text-white px-8')
                 
-                ui.label(f'In Stock: {product.stock}').classes('text-sm text-gray-500 mt-4')
+                ui.label(f'In Stock: {available}' if available else 'Out of stock').classes('text-sm text-gray-500 mt-4')
                 
                 ui.separator().classes('my-6')
                 
@@ -552,87 +721,144 @@ def product_page(product_id: int):
             ui.label('YOU MAY ALSO LIKE').classes('text-2xl font-bold mb-8')
             
             with ui.grid(columns=4).classes('gap-8'):
-                related_products = get_products_by_category(product.category)
-                for related in related_products:
-                    if related.id != product.id:
-                        create_product_card(related)
-                        if len(related_products) <= 4:
-                            break
+                for related in await get_related_products_async(product.id):
+                    create_product_card(related)
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/category/{category}')
-def category_page(category: str):
+@with_unit_of_work
+async def category_page(category: str, sort: str = 'price', features: str = ''):
     create_header()
     
-    products = get_products_by_category(category)
-    
+    selected = split_features(features)
     with ui.column().classes('p-8'):
         ui.label(f'{category.upper()} WATCHES').classes('text-3xl font-bold mb-8')
-        
-        if not products:
-            ui.label('No products found in this category.').classes('text-xl text-center w-full py-16')
-        else:
-            with ui.grid(columns=4).classes('gap-8'):
-                for product in products:
-                    create_product_card(product)
+        create_sort_links(f'/category/{category}', sort, selected)
+        await create_feature_filter(f'/category/{category}', sort, selected)
+        await create_product_listing(4, 'No products found in this category.', sort=sort, category=category, features=selected)
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/brand/{brand}')
-def brand_page(brand: str):
+@with_unit_of_work
+async def brand_page(brand: str, sort: str = 'price', features: str = ''):
     create_header()
     
-    products = get_products_by_brand(brand)
-    
+    selected = split_features(features)
     with ui.column().classes('p-8'):
         ui.label(f'{brand.upper()}').classes('text-3xl font-bold mb-8')
-        
-        if not products:
-            ui.label('No products found for this brand.').classes('text-xl text-center w-full py-16')
-        else:
-            with ui.grid(columns=4).classes('gap-8'):
-                for product in products:
-                    create_product_card(product)
+        create_sort_links(f'/brand/{brand}', sort, selected)
+        await create_feature_filter(f'/brand/{brand}', sort, selected)
+        await create_product_listing(4, 'No products found for this brand.', sort=sort, brand=brand, features=selected)
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/price-range/{range_val}')
-def price_range_page(range_val: str):
+@with_unit_of_work
+async def price_range_page(range_val: str, sort: str = 'price', features: str = ''):
     create_header()
     
     min_price, max_price = map(int, range_val.split('-'))
     
-    db = SessionLocal()
-    products = db.query(Product).filter(Product.price >= min_price, Product.price <= max_price).all()
-    db.close()
-    
     range_label = f"Under ${min_price:,}" if min_price == 0 else f"${min_price:,} - ${max_price:,}" if max_price < 999999 else f"${min_price:,}+"
     
     with ui.column().classes('p-8'):
         ui.label(f'WATCHES: {range_label}').classes('text-3xl font-bold mb-8')
+        selected = split_features(features)
+        create_sort_links(f'/price-range/{range_val}', sort, selected)
+        await create_feature_filter(f'/price-range/{range_val}', sort, selected)
+        await create_product_listing(4, 'No products found in this price range.', sort=sort, min_price=min_price, max_price=max_price, features=selected)
+    
+    await create_footer()
+
+@ui.page('/search')
+@with_unit_of_work
+async def search_page(q: str = '', category: str = '', brand: str = '', price: str = '', feature: str = ''):
+    create_header()
+    
+    # Selected values per facet; query parameters pre-select a single value
+    selection = {facet: set() for facet in FACETS}
+    for facet, value in (('category', category), ('brand', brand), ('price', price), ('feature', feature)):
+        if value:
+            selection[facet].add(value)
+    band_labels = {key: label for key, label, _, _ in PRICE_BANDS}
+    facet_titles = {'category': 'CATEGORIES', 'brand': 'BRANDS', 'price': 'PRICE RANGE', 'feature': 'FEATURES'}
+    
+    with ui.column().classes('p-8'):
+        ui.label(f'RESULTS FOR "{q.upper()}"' if q else 'SEARCH WATCHES').classes('text-3xl font-bold mb-8')
         
-        if not products:
-            ui.label('No products found in this price range.').classes('text-xl text-center w-full py-16')
-        else:
-            with ui.grid(columns=4).classes('gap-8'):
-                for product in products:
-                    create_product_card(product)
+        @ui.refreshable
+        async def search_results():
+            result = await search_catalog_async(q, selection, limit=PAGE_SIZE)
+            
+            def toggle(facet, value, checked):
+                (selection[facet].add if checked else selection[facet].discard)(value)
+                search_results.refresh()
+            
+            with ui.row().classes('w-full gap-8'):
+                # Facet sidebar with live counts
+                with ui.column().classes('w-1/4'):
+                    for facet in FACETS:
+                        ui.label(facet_titles[facet]).classes('font-bold mt-4 mb-2')
+                        for value in result.facets[facet]:
+                            if not value.count and not value.selected:
+                                continue
+                            label = band_labels.get(value.value, value.value) if facet == 'price' else value.value
+                            ui.checkbox(f'{label} ({value.count})', value=value.selected,
+                                        on_change=lambda e, f=facet, v=value.value: toggle(f, v, e.value))
+                
+                # Results grid
+                with ui.column().classes('w-3/4'):
+                    ui.label(f'{result.total} watches found').classes('text-gray-500 mb-4')
+                    if not result.items:
+                        ui.label('No products match these filters.').classes('text-xl text-center w-full py-16')
+                    else:
+                        with ui.grid(columns=3).classes('gap-8'):
+                            for product in result.items:
+                                create_product_card(product)
+        
+        await search_results()
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/cart')
-def cart_page():
+@with_unit_of_work
+async def cart_page():
     create_header()
+    cart = get_cart()
+    await asyncio.to_thread(reservations.touch, app.storage.browser['id'])
+    views = {line.product_id: await get_product_view_async(line.product_id) for line in cart}
     
     with ui.column().classes('p-8'):
         ui.label('YOUR SHOPPING CART').classes('text-3xl font-bold mb-8')
         
-        if not app.storage.user.cart:
+        if not cart:
             with ui.column().classes('text-center py-16'):
                 ui.label('Your cart is empty').classes('text-xl mb-4')
-                ui.button('CONTINUE SHOPPING', on_click=lambda: ui.open('/shop')).classes('bg-primary text-white')
+                ui.button('CONTINUE SHOPPING', on_click=lambda: ui.navigate.to('/shop')).classes('bg-primary text-white')
         else:
+            async def update_quantity(product_id, quantity_input, line_total):
+                await asyncio.sleep(0.5)  # Debounce
+                try:
+                    await update_cart_quantity(product_id, int(quantity_input.value or 1))
+                except AppException as e:
+                    ui.notify(e.detail, color='negative')
+                # Shows the quantity actually kept, also after a failed update
+                line = get_cart().get(product_id)
+                if line:
+                    quantity_input.set_value(line.quantity)
+                    line_total.set_text(format_cents(line.total_cents))
+                cart_summary.refresh()
+            
+            async def remove_item(product_id):
+                try:
+                    await remove_from_cart(product_id)
+                except AppException as e:
+                    ui.notify(e.detail, color='negative')
+                    return
+                ui.navigate.reload()  # Re-render without the removed row
+            
             with ui.column().classes('w-full'):
                 # Cart items
                 with ui.column().classes('w-full'):
@@ -643,77 +869,70 @@ def cart_page():
                         ui.label('Total').classes('w-1/6 text-center')
                         ui.label('').classes('w-12')
                     
-                    for item in app.storage.user.cart:
+                    for line in cart:
+                        view = views[line.product_id]
                         with ui.row().classes('w-full items-center p-4 border-b'):
                             with ui.row().classes('w-1/2 items-center'):
-                                ui.image(item['image_url']).classes('w-16 h-16 object-cover mr-4')
+                                if view:
+                                    create_product_image(view, view.thumbnail_url, '64px').classes('w-16 h-16 object-cover mr-4')
                                 with ui.column():
-                                    ui.label(item['name']).classes('font-bold')
-                                    ui.label(item['brand']).classes('text-sm text-gray-500')
+                                    ui.label(view.name if view else 'No longer available').classes('font-bold')
+                                    if view:
+                                        ui.label(view.brand).classes('text-sm text-gray-500')
                             
-                            ui.label(format_price(item['price'])).classes('w-1/6 text-center')
+                            ui.label(format_cents(line.unit_price_cents)).classes('w-1/6 text-center')
                             
                             with ui.row().classes('w-1/6 justify-center'):
-                                quantity_input = ui.number(value=item['quantity'], min=1).classes('w-16 text-center')
-                                
-                                async def update_quantity(e, item_id=item['id']):
-                                    await asyncio.sleep(0.5)  # Debounce
-                                    update_cart_quantity(item_id, int(quantity_input.value))
-                                    cart_summary.refresh()
-                                
-                                quantity_input.on('change', update_quantity)
+                                quantity_input = ui.number(value=line.quantity, min=1, precision=0).classes('w-16 text-center')
                             
-                            ui.label(format_price(item['price'] * item['quantity'])).classes('w-1/6 text-center')
+                            line_total = ui.label(format_cents(line.total_cents)).classes('w-1/6 text-center')
+                            quantity_input.on('change', lambda _, product_id=line.product_id, quantity_input=quantity_input, line_total=line_total: update_quantity(product_id, quantity_input, line_total))
                             
-                            ui.button(on_click=lambda item_id=item['id']: remove_item_and_refresh(item_id)).props('flat round color=negative icon=delete').classes('w-12')
+                            ui.button(on_click=partial(remove_item, line.product_id)).props('flat round color=negative icon=delete').classes('w-12')
                 
                 # Cart summary
                 with ui.card().classes('w-full mt-8 p-6'):
                     @ui.refreshable
                     def cart_summary():
+                        totals = cart_totals(get_cart())
                         with ui.column().classes('w-full'):
                             with ui.row().classes('w-full justify-between mb-2'):
                                 ui.label('Subtotal:').classes('font-bold')
-                                ui.label(format_price(app.storage.user.cart_total)).classes('font-bold')
+                                ui.label(format_cents(totals.subtotal_cents)).classes('font-bold')
                             
                             with ui.row().classes('w-full justify-between mb-2'):
                                 ui.label('Shipping:').classes('font-bold')
-                                shipping = 0 if app.storage.user.cart_total >= 500 else 25
-                                ui.label('Free' if shipping == 0 else format_price(shipping)).classes('font-bold')
+                                ui.label('Free' if totals.shipping_cents == 0 else format_cents(totals.shipping_cents)).classes('font-bold')
                             
                             with ui.row().classes('w-full justify-between mb-2'):
                                 ui.label('Tax:').classes('font-bold')
-                                tax = app.storage.user.cart_total * 0.08  # 8% tax
-                                ui.label(format_price(tax)).classes('font-bold')
+                                ui.label(format_cents(totals.tax_cents)).classes('font-bold')
                             
                             ui.separator().classes('my-4')
                             
                             with ui.row().classes('w-full justify-between mb-4'):
                                 ui.label('Total:').classes('text-xl font-bold')
-                                total = app.storage.user.cart_total + shipping + tax
-                                ui.label(format_price(total)).classes('text-xl font-bold text-primary')
+                                ui.label(format_cents(totals.total_cents)).classes('text-xl font-bold text-primary')
                             
                             with ui.row().classes('w-full justify-between'):
-                                ui.button('CONTINUE SHOPPING', on_click=lambda: ui.open('/shop')).classes('bg-gray-800 text-white')
-                                ui.button('PROCEED TO CHECKOUT', on_click=lambda: ui.open('/checkout')).classes('bg-primary text-white')
+                                ui.button('CONTINUE SHOPPING', on_click=lambda: ui.navigate.to('/shop')).classes('bg-gray-800 text-white')
+                                ui.button('PROCEED TO CHECKOUT', on_click=lambda: ui.navigate.to('/checkout')).classes('bg-primary text-white')
                     
                     cart_summary()
-                
-                def remove_item_and_refresh(item_id):
-                    remove_from_cart(item_id)
-                    cart_summary.refresh()
-                    if not app.storage.user.cart:
-                        ui.open('/cart')  # Refresh the page if cart is empty
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/checkout')
-def checkout_page():
+@with_unit_of_work
+async def checkout_page():
     create_header()
     
-    if not app.storage.user.cart:
-        ui.open('/cart')
+    cart = get_cart()
+    if not cart:
+        ui.navigate.to('/cart')
         return
+    await asyncio.to_thread(reservations.touch, app.storage.browser['id'])
+    totals = cart_totals(cart)
     
     with ui.column().classes('p-8'):
         ui.label('CHECKOUT').classes('text-3xl font-bold mb-8')
@@ -748,45 +967,62 @@ def checkout_page():
                 with ui.card().classes('w-full p-6'):
                     ui.label('ORDER SUMMARY').classes('text-xl font-bold mb-4')
                     
-                    for item in app.storage.user.cart:
+                    for line in cart:
+                        view = await get_product_view_async(line.product_id)
                         with ui.row().classes('w-full justify-between mb-2'):
-                            ui.label(f"{item['name']} (x{item['quantity']})").classes('text-sm')
-                            ui.label(format_price(item['price'] * item['quantity'])).classes('text-sm font-bold')
+                            ui.label(f"{view.name if view else 'No longer available'} (x{line.quantity})").classes('text-sm')
+                            ui.label(format_cents(line.total_cents)).classes('text-sm font-bold')
                     
                     ui.separator().classes('my-4')
                     
                     with ui.row().classes('w-full justify-between mb-2'):
                         ui.label('Subtotal:')
-                        ui.label(format_price(app.storage.user.cart_total))
+                        ui.label(format_cents(totals.subtotal_cents))
                     
                     with ui.row().classes('w-full justify-between mb-2'):
                         ui.label('Shipping:')
-                        shipping = 0 if app.storage.user.cart_total >= 500 else 25
-                        ui.label('Free' if shipping == 0 else format_price(shipping))
+                        ui.label('Free' if totals.shipping_cents == 0 else format_cents(totals.shipping_cents))
                     
                     with ui.row().classes('w-full justify-between mb-2'):
                         ui.label('Tax:')
-                        tax = app.storage.user.cart_total * 0.08  # 8% tax
-                        ui.label(format_price(tax))
+                        ui.label(format_cents(totals.tax_cents))
                     
                     ui.separator().classes('my-4')
                     
                     with ui.row().classes('w-full justify-between mb-4'):
                         ui.label('Total:').classes('font-bold')
-                        total = app.storage.user.cart_total + shipping + tax
-                        ui.label(format_price(total)).classes('font-bold text-primary')
+                        ui.label(format_cents(totals.total_cents)).classes('font-bold text-primary')
                     
-                    ui.button('PLACE ORDER', on_click=place_order).classes('w-full bg-primary text-white')
+                    # One key per rendered checkout, so a double click places one order
+                    idempotency_key = uuid.uuid4().hex
+                    place_button = ui.button('PLACE ORDER').classes('w-full bg-primary text-white')
+                    place_button.on_click(partial(submit_order, place_button, idempotency_key))
 
-def place_order():
-    # In a real application, this would process the payment and create an order
-    # For this demo, we'll just clear the cart and show a confirmation
-    order_number = f"ORD-{random.randint(100000, 999999)}"
-    clear_cart()
-    ui.open(f'/order-confirmation/{order_number}')
+async def submit_order(button, idempotency_key: str):
+    # Payment is out of scope; placing the order takes the stock
+    button.disable()
+    try:
+        order = await asyncio.to_thread(place_order, get_cart(), idempotency_key, app.storage.browser['id'])
+    except AppException as e:
+        ui.notify(e.detail, color='negative')
+        return
+    except Exception as e:
+        # E.g. a locked database; the same key can safely be retried
+        app_logger.error(f"Placing order {idempotency_key} failed: {e!r}")
+        ui.notify('Your order could not be placed. Please try again.', color='negative')
+        return
+    finally:
+        button.enable()
+    try:
+        await clear_cart()
+    except AppException as e:
+        # The order stands; leftover holds expire with RESERVATION_TTL
+        app_logger.error(f"Clearing the cart after order {order.order_number} failed: {e.detail}")
+    ui.navigate.to(f'/order-confirmation/{order.order_number}')
 
 @ui.page('/order-confirmation/{order_number}')
-def order_confirmation_page(order_number: str):
+@with_unit_of_work
+async def order_confirmation_page(order_number: str):
     create_header()
     
     with ui.column().classes('p-16 text-center'):
@@ -795,12 +1031,13 @@ def order_confirmation_page(order_number: str):
         ui.label(f'Thank you for your purchase! Your order number is {order_number}.').classes('text-xl mb-8')
         ui.label('We have sent a confirmation email with your order details.').classes('mb-8')
         
-        ui.button('CONTINUE SHOPPING', on_click=lambda: ui.open('/')).classes('bg-primary text-white px-8')
+        ui.button('CONTINUE SHOPPING', on_click=lambda: ui.navigate.to('/')).classes('bg-primary text-white px-8')
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/about')
-def about_page():
+@with_unit_of_work
+async def about_page():
     create_header()
     
     with ui.column().classes('p-8'):
@@ -857,10 +1094,11 @@ def about_page():
                                      'Sophie travels the world to discover exceptional timepieces and build relationships with manufacturers and collectors.', 
                                      'Michael ensures that every customer receives personalized service and expert guidance throughout their journey.'][i])
     
-    create_footer()
+    await create_footer()
 
 @ui.page('/contact')
-def contact_page():
+@with_unit_of_work
+async def contact_page():
     create_header()
     
     with ui.column().classes('p-8'):
@@ -930,53 +1168,7 @@ def contact_page():
                     for icon in ['facebook', 'instagram', 'twitter', 'youtube']:
                         ui.button().props(f'flat round color=primary icon={icon}')
 
-# Add custom CSS
-ui.add_head_html('''
-<style>
-:root {
-    --primary: #d4af37;
-    --primary-dark: #b8971f;
-}
-
-.bg-primary {
-    background-color: var(--primary) !important;
-}
-
-.text-primary {
-    color: var(--primary) !important;
-}
-
-.hover\:text-primary:hover {
-    color: var(--primary) !important;
-}
-
-.border-primary {
-    border-color: var(--primary) !important;
-}
-
-.product-card {
-    transition: all 0.3s ease;
-}
-
-.product-card:hover {
-    transform: translateY(-5px);
-    box-shadow: 0 10px 20px rgba(0, 0, 0, 0.1);
-}
-
-.category-card {
-    transition: all 0.3s ease;
-    overflow: hidden;
-}
-
-.category-card:hover img {
-    transform: scale(1.05);
-}
-
-.category-card img {
-    transition: all 0.3s ease;
-}
-</style>
-''')
 
 # Run the app
-ui.run(title="Luxury Timepieces", favicon="🕰️")
\ No newline at end of file
+# The compression middleware layer replaces NiceGUI's gzip middleware
+ui.run(title="Luxury Timepieces", favicon="🕰️", storage_secret=settings.secret_key, gzip_middleware_factory=None)
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""Cart changes reach the tabs of a user on every app server sharing Redis."""
+import threading
+import time
+
+import pytest
+
+from app.services.cart_store import RedisCartStore
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def test_changes_reach_every_server():
+    server = fakeredis.FakeServer()
+    servers = [RedisCartStore(client=fakeredis.FakeRedis(server=server)) for _ in range(3)]
+    received = {index: threading.Event() for index in range(len(servers))}
+    changes = []
+    try:
+        for index, store in enumerate(servers):
+            def listener(storage_id, item_count, index=index):
+                changes.append((index, storage_id, item_count))
+                received[index].set()
+
+            store.listen(listener)
+        # Messages published before the subscriptions are active are lost
+        for store in servers:
+            while not store._listener_thread.pubsub.subscribed:
+                time.sleep(0.01)
+
+        assert servers[0].publish("browser-1", 3)
+        assert all(event.wait(5) for event in received.values())
+    finally:
+        for store in servers:
+            store.close()
+    assert sorted(changes) == [(index, "browser-1", 3) for index in range(len(servers))]
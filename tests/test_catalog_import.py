@@ -0,0 +1,59 @@
+"""Re-importing a supplier feed, whose rows carry no product ids."""
+import pytest
+from sqlalchemy import select
+
+from app.core import database
+from app.core.database import SessionLocal
+from app.core.migrations import migrate
+from app.models.migrations import MIGRATIONS
+from app.models.product import Product
+from app.services.catalog_import import import_products
+
+FEED = [
+    {"name": "Submariner Date", "brand": "Rolex", "category": "Dive", "price": 9950,
+     "image_url": "https://example.com/1.jpg", "features": "Date display, Ceramic bezel"},
+    {"name": "Nautilus", "brand": "Patek Philippe", "category": "Luxury", "price": 35000,
+     "image_url": "https://example.com/2.jpg", "stock": 3},
+]
+
+
+@pytest.fixture(autouse=True)
+def catalog_database(tmp_path):
+    database.setup_database(f"sqlite:///{tmp_path / 'catalog.db'}")
+    migrate(database.engine, MIGRATIONS)
+
+
+def _products():
+    with SessionLocal() as session:
+        return {product.name: product for product in session.scalars(select(Product))}
+
+
+def test_reimport_updates_products_by_brand_and_name():
+    import_products(FEED, refresh=False)
+    first = _products()
+    assert first["Submariner Date"].stock == 10
+
+    with SessionLocal() as session:
+        session.get(Product, first["Submariner Date"].id).stock = 4
+        session.commit()
+    feed = [FEED[0] | {"price": 10250, "features": "Date display"}, FEED[1] | {"stock": 5}]
+    report = import_products(feed, refresh=False)
+
+    products = _products()
+    assert report.rows_written == 2
+    assert {name: product.id for name, product in products.items()} == {
+        name: product.id for name, product in first.items()
+    }
+    assert products["Submariner Date"].price == 10250
+    # A feed without stock keeps the stock of the existing product
+    assert products["Submariner Date"].stock == 4
+    assert products["Nautilus"].stock == 5
+
+
+def test_repeated_rows_in_one_chunk_write_one_product():
+    report = import_products([FEED[1], FEED[1] | {"price": 36000}], refresh=False)
+
+    products = _products()
+    assert report.rows_written == 2
+    assert list(products) == ["Nautilus"]
+    assert products["Nautilus"].price == 36000
@@ -0,0 +1,92 @@
+"""Concurrent checkouts of one SKU.
+
+Hundreds of simultaneous orders, retries reusing their idempotency keys and
+other carts reserving units race for the stock of one product, part of
+which another cart already holds.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core import database
+from app.core.database import SessionLocal
+from app.core.exceptions import ConflictError
+from app.core.migrations import migrate
+from app.models.migrations import MIGRATIONS
+from app.models.order import Order, OrderLine
+from app.models.product import Product
+from app.services.cart import Cart
+from app.services.orders import place_order
+from app.services.reservations import reservations
+
+ORDERS = 300
+RETRIES = 100
+RESERVERS = 50
+STOCK = 50
+HELD = 10
+
+
+@pytest.fixture
+def product_id(tmp_path):
+    database.setup_database(f"sqlite:///{tmp_path / 'orders.db'}")
+    migrate(database.engine, MIGRATIONS)
+    with SessionLocal() as session:
+        product = Product(
+            name="Limited Edition", brand="Test", category="Dive", price=1234.5,
+            description="", image_url="https://example.com/watch.jpg", stock=STOCK,
+        )
+        session.add(product)
+        session.commit()
+        return product.id
+
+
+def test_concurrent_orders_never_oversell(product_id):
+    reservations.reserve("cart-held", product_id, HELD)
+    # Retries reuse the keys of the first orders and race with them; so do
+    # carts reserving one unit each
+    keys = [f"order-{i}" for i in range(ORDERS)] + [f"order-{i}" for i in range(RETRIES)]
+    holders = [f"cart-{i}" for i in range(RESERVERS)]
+    barrier = threading.Barrier(len(keys) + len(holders))
+
+    def attempt(key: str) -> Tuple[str, Optional[str]]:
+        cart = Cart()
+        cart.add(product_id, 123450)
+        barrier.wait()
+        try:
+            return key, place_order(cart, key).order_number
+        except ConflictError:
+            return key, None
+
+    def reserve(holder: str) -> bool:
+        barrier.wait()
+        try:
+            reservations.reserve(holder, product_id, 1)
+        except ConflictError:
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=len(keys) + len(holders)) as pool:
+        reserved = pool.map(reserve, holders)
+        results: List[Tuple[str, Optional[str]]] = list(pool.map(attempt, keys))
+        reserved = list(reserved)
+
+    with SessionLocal() as session:
+        final_stock = session.scalar(select(Product.stock).where(Product.id == product_id))
+        order_count = session.scalar(select(func.count()).select_from(Order))
+        units_sold = session.scalar(select(func.coalesce(func.sum(OrderLine.quantity), 0)))
+    units_held = reservations.stats().units_held
+
+    numbers_by_key = {}
+    for key, number in results:
+        if number is not None:
+            assert numbers_by_key.setdefault(key, number) == number, f"two orders for {key}"
+    assert len(numbers_by_key) == order_count
+    assert final_stock >= 0
+    assert units_sold == STOCK - final_stock
+    # No unit is both sold and held, and nothing is left over once anyone
+    # was turned away
+    assert units_held == HELD + sum(reserved)
+    assert units_sold + units_held == STOCK
@@ -0,0 +1,44 @@
+"""Catalog access paths must stay backed by indexes.
+
+check_catalog_query_plans() builds a scratch database from the migrations
+and explains every statement of catalog_queries(); a plan that falls back
+to a table scan fails the check.
+"""
+import pytest
+from sqlalchemy import create_engine, select, text
+
+from app.core.exceptions import DatabaseError
+from app.core.migrations import migrate
+from app.core.query_plan import check_query_plans, find_full_scans
+from app.models.migrations import MIGRATIONS
+from app.models.product import Product
+from app.services.catalog import catalog_queries, check_catalog_query_plans
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    migrate(engine, MIGRATIONS)
+    yield engine
+    engine.dispose()
+
+
+def test_catalog_queries_use_indexes():
+    plans = check_catalog_query_plans()
+    assert set(plans) == set(catalog_queries())
+    for name, plan in plans.items():
+        assert not find_full_scans(plan), name
+
+
+def test_query_without_index_fails(engine):
+    queries = catalog_queries() | {"get_products_by_description": select(Product).where(Product.description == "x")}
+    with pytest.raises(DatabaseError, match="get_products_by_description"):
+        check_query_plans(engine, queries)
+
+
+def test_dropped_index_fails(engine):
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_products_category"))
+        connection.execute(text("DROP INDEX ix_products_category_price"))
+    with pytest.raises(DatabaseError, match="get_products_by_category"):
+        check_catalog_query_plans(engine)